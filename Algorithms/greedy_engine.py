@@ -0,0 +1,857 @@
+"""Batched candidate evaluation for the greedy heuristics"""
+import heapq
+import multiprocessing as mp
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+
+# Static arrays of an instance that the parallel workers attach to through shared memory
+SHARED_ARRAYS = [
+    "H",
+    "F",
+    "C",
+    "B",
+    "inv_D_sq",
+    "comp_attr",
+    "V",
+    "U_L",
+    "U_LT",
+    "order",
+]
+# For a coordinate-based instance, the coordinates are shared in place of inv_D_sq
+SHARED_COORDINATES = ["customers", "locations"]
+
+
+class CandidateEvaluator:
+    """
+    Evaluate the greedy objective for many candidate locations at once.
+
+    The static instance data (H, D, D_comp, A_opponent_bar, F, C, B) is converted to arrays once,
+    so scoring all unbuilt locations of an iteration is a single (I, n) matrix operation
+    instead of a loop over the customer points for every location.
+
+    For a coordinate-based instance (D is a distances.DistanceMatrix), 1 / D^2 is never stored:
+    the columns are computed when used and candidates are scored a block of locations at a time,
+    with each (I, block) temporary kept under block_bytes.
+
+    Args:
+        config (dict): The instance configuration.
+        G_function (callable): Vectorized G function of the algorithm version.
+        E_function (callable): Vectorized E function of the algorithm version.
+        block_bytes (int, optional): Size of one (I, block) float64 temporary when D is computed from the coordinates.
+            Defaults to 64 MiB.
+    """
+
+    def __init__(self, config: dict, G_function, E_function, block_bytes: int = 64 * 1024**2):
+        self.G_function = G_function
+        self.E_function = E_function
+        self.block_bytes = block_bytes
+        self.H = np.asarray(config["H"], dtype=float)
+        self.F = np.asarray(config["F"], dtype=float)
+        self.C = np.asarray(config["C"], dtype=float)
+        self.B = np.asarray(config["B"], dtype=float)
+        # 1 / D^2 for our locations and the (constant) attractiveness of the competitors
+        self.distances = None
+        if hasattr(config["D"], "columns"):  # computed from the coordinates
+            self.distances, self.inv_D_sq = config["D"], None
+        else:
+            self.inv_D_sq = 1 / np.asarray(config["D"], dtype=float) ** 2
+        self.comp_attr = (
+            np.asarray(config["A_opponent_bar"], dtype=float)
+            / np.asarray(config["D_comp"], dtype=float) ** 2
+        ).sum(axis=1)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, G_function, E_function, distances=None, block_bytes: int = 64 * 1024**2):
+        """
+        Build an evaluator from already converted arrays (e.g. attached from shared memory) without copying them.
+
+        Args:
+            arrays (dict): H, F, C, B, comp_attr and, unless distances is given, inv_D_sq arrays.
+            G_function (callable): Vectorized G function of the algorithm version.
+            E_function (callable): Vectorized E function of the algorithm version.
+            distances (distances.DistanceMatrix, optional): D of a coordinate-based instance, in place of inv_D_sq.
+            block_bytes (int, optional): See CandidateEvaluator.
+
+        Returns:
+            CandidateEvaluator: The evaluator.
+        """
+        evaluator = cls.__new__(cls)
+        evaluator.G_function = G_function
+        evaluator.E_function = E_function
+        evaluator.block_bytes = block_bytes
+        evaluator.distances = distances
+        for name in ["H", "F", "C", "B", "comp_attr"]:
+            setattr(evaluator, name, arrays[name])
+        evaluator.inv_D_sq = None if distances is not None else arrays["inv_D_sq"]
+        return evaluator
+
+    @property
+    def block_size(self):
+        """Locations scored at a time when D is computed from the coordinates."""
+        return max(1, self.block_bytes // (8 * len(self.H)))
+
+    def inv_dist_sq(self, loc_idx):
+        """
+        1 / D^2 between every customer point and the given location(s).
+
+        Args:
+            loc_idx (int or array-like): Index of a location, or of several locations.
+
+        Returns:
+            np.ndarray: Dim: (i) for one location, (i, n) for several.
+        """
+        if self.inv_D_sq is not None:
+            return self.inv_D_sq[:, loc_idx]
+        if np.ndim(loc_idx) == 0:
+            return 1 / self.distances.columns([loc_idx])[:, 0] ** 2
+        return 1 / self.distances.columns(np.asarray(loc_idx, dtype=int)) ** 2
+
+    def own_attraction(self, facility_is_built: list, total_util_list: list):
+        """
+        Calculate the attractiveness of our built facilities for every customer point.
+
+        Args:
+            facility_is_built (list): List indicating whether a facility is built.
+            total_util_list (list): List representing total utility.
+
+        Returns:
+            np.ndarray: Our attractiveness for each customer point, Dim: (i)
+        """
+        built = np.flatnonzero(np.asarray(facility_is_built) == 1)
+        e_values = self.E_function(np.asarray(total_util_list, dtype=float)[built])
+        return self.inv_dist_sq(built) @ e_values
+
+    def location_cost(self, loc: int, extra_attr: float, cars_to_fill: list):
+        """
+        Calculate the cost of building one location.
+
+        Args:
+            loc (int): Index of the location.
+            extra_attr (float): Extra attractiveness (toilets) at the location.
+            cars_to_fill (list): List of tuples (car type, number) allocated to the location.
+
+        Returns:
+            float: Building, extra attractiveness and cars usage cost of the location.
+        """
+        cars_cost = sum(self.B[loc, k] * num for k, num in cars_to_fill)
+        return float(self.F[loc] + self.C[loc] * extra_attr + cars_cost)
+
+    def gain(self, own_attr):
+        """
+        Calculate the total gain for our attractiveness at every customer point.
+
+        Args:
+            own_attr (np.ndarray): Our attractiveness for each customer point, Dim: (i) or (i, n)
+
+        Returns:
+            float or np.ndarray: Total gain (one per column if own_attr is 2D).
+        """
+        comp_attr = self.comp_attr if own_attr.ndim == 1 else self.comp_attr[:, None]
+        total_attr = own_attr + comp_attr
+        return self.H @ (self.G_function(total_attr) * own_attr / total_attr)
+
+    def objective_breakdown(
+        self,
+        facility_is_built: list,
+        total_util_list: list,
+        compensate_attractiveness: list,
+        cars_usage_record: list,
+    ):
+        """
+        Break the objective of a solution down into the gain of each customer point and the cost parts.
+
+        Args:
+            facility_is_built (list): List indicating whether a facility is built.
+            total_util_list (list): List representing total utility.
+            compensate_attractiveness (list): List representing compensation for attractiveness.
+            cars_usage_record (list): Record of cars' usage [(car type, number, location), ...].
+
+        Returns:
+            dict: total_attr, G, our_vs_all_percentage and customer_gain for each customer point (Dim: (i)),
+            and the build_cost, attr_cost and cars_cost of the solution.
+        """
+        own_attr = self.own_attraction(facility_is_built, total_util_list)
+        total_attr = own_attr + self.comp_attr
+        g_values = self.G_function(total_attr)
+        our_vs_all_percentage = own_attr / total_attr
+        return {
+            "total_attr": total_attr,
+            "G": g_values,
+            "our_vs_all_percentage": our_vs_all_percentage,
+            "customer_gain": self.H * g_values * our_vs_all_percentage,
+            "build_cost": float(self.F @ np.asarray(facility_is_built, dtype=float)),
+            "attr_cost": float(self.C @ np.asarray(compensate_attractiveness, dtype=float)),
+            "cars_cost": float(sum(self.B[loc, k] * num for k, num, loc in cars_usage_record)),
+        }
+
+    def score_candidates(
+        self, own_attr, base_cost: float, loc_idx, total_util, location_cost
+    ):
+        """
+        Calculate the objective value of building each candidate location on top of the current solution.
+
+        Args:
+            own_attr (np.ndarray): Our attractiveness for each customer point before building, Dim: (i)
+            base_cost (float): Cost of the current solution.
+            loc_idx (array-like): Index of each candidate location, Dim: (n)
+            total_util (array-like): Total utility (cars + toilets) of each candidate, Dim: (n)
+            location_cost (array-like): Cost of building each candidate, Dim: (n)
+
+        Returns:
+            np.ndarray: Objective value for each candidate, Dim: (n)
+        """
+        loc_idx = np.asarray(loc_idx, dtype=int)
+        if self.inv_D_sq is None and len(loc_idx) > self.block_size:
+            # (i, n) matrices of one block of locations at a time
+            total_util = np.asarray(total_util, dtype=float)
+            location_cost = np.asarray(location_cost, dtype=float)
+            return np.concatenate(
+                [
+                    self.score_candidates(
+                        own_attr,
+                        base_cost,
+                        loc_idx[start : start + self.block_size],
+                        total_util[start : start + self.block_size],
+                        location_cost[start : start + self.block_size],
+                    )
+                    for start in range(0, len(loc_idx), self.block_size)
+                ]
+            )
+        e_values = self.E_function(np.asarray(total_util, dtype=float))
+        our_attr = own_attr[:, None] + self.inv_dist_sq(loc_idx) * e_values
+        return self.gain(our_attr) - (base_cost + np.asarray(location_cost, dtype=float))
+
+    def location_costs(self, loc_idx, extra_attr, cars_to_fill):
+        """
+        Batched version of location_cost for fills given as a matrix (see FillKernel.fill).
+
+        Args:
+            loc_idx (array-like): Index of each location, Dim: (n)
+            extra_attr (array-like): Extra attractiveness of each location, Dim: (n)
+            cars_to_fill (np.ndarray): Number of cars of each type at each location, Dim: (n, k)
+
+        Returns:
+            np.ndarray: Cost of building each location, Dim: (n)
+        """
+        loc_idx = np.asarray(loc_idx, dtype=int)
+        cars_cost = (self.B[loc_idx] * cars_to_fill).sum(axis=1)
+        return self.F[loc_idx] + self.C[loc_idx] * np.asarray(extra_attr) + cars_cost
+
+
+def solution_dtypes(config: dict):
+    """
+    dtypes of a solution of the instance, integers unless the instance data is fractional.
+
+    Returns:
+        tuple: dtype of the numbers of cars (from U_T, U_L, U_LT) and of the utility and extra attractiveness
+        (from V, A_EX_bound and the numbers of cars).
+    """
+    cars_dtype = np.result_type(
+        np.asarray(config["U_T"]), np.asarray(config["U_L"]), np.asarray(config["U_LT"]), np.int64
+    )
+    util_dtype = np.result_type(np.asarray(config["V"]), np.asarray(config["A_EX_bound"]), cars_dtype)
+    return cars_dtype, util_dtype
+
+
+class SolverState:
+    """
+    The solution of a greedy run as arrays, in place of the config U_T and the candidates,
+    compensate_attractiveness, total_util_list and cars_usage_record lists.
+
+    Building a location only writes its own row, so commit and rollback are O(k) and never copy the solution.
+    The arrays keep the dtype of the instance data (see solution_dtypes): integers for the benchmark instances,
+    so the result YAML is unchanged, and floats when capacities, V or A_EX_bound are fractional.
+
+    Args:
+        j_amount (int): Number of candidate locations.
+        k_amount (int): Number of car types.
+        U_T (array-like): Number of cars of each type.
+        cars_dtype (np.dtype, optional): dtype of the numbers of cars. Defaults to np.int64.
+        util_dtype (np.dtype, optional): dtype of the extra attractiveness and the utility. Defaults to np.int64.
+    """
+
+    __slots__ = ("y", "x_jk", "A_EX", "total_util", "U_T", "history")
+
+    def __init__(self, j_amount: int, k_amount: int, U_T, cars_dtype=np.int64, util_dtype=np.int64):
+        self.y = np.zeros(j_amount, dtype=bool)  # built locations
+        self.x_jk = np.zeros((j_amount, k_amount), dtype=cars_dtype)  # cars at each location
+        self.A_EX = np.zeros(j_amount, dtype=util_dtype)  # extra attractiveness (toilets)
+        self.total_util = np.zeros(j_amount, dtype=util_dtype)  # cars + toilets, input of E
+        self.U_T = np.array(U_T, dtype=cars_dtype)  # remaining cars of each type
+        self.history = []  # built locations, latest last
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(config["j_amount"], config["k_amount"], config["U_T"], *solution_dtypes(config))
+
+    def unbuilt(self):
+        """Index of the locations that haven't been built yet."""
+        return np.flatnonzero(~self.y).tolist()
+
+    def commit(self, loc: int, cars_to_fill: list, cur_util, extra_attr):
+        """
+        Build a location.
+
+        Args:
+            loc (int): Index of the location.
+            cars_to_fill (list): Cars to fill [(car type, number), ...].
+            cur_util: Utility from the cars.
+            extra_attr: Extra attractiveness of the location.
+        """
+        for car_type, num in cars_to_fill:
+            self.x_jk[loc, car_type] = num
+            self.U_T[car_type] -= num
+        self.y[loc] = True
+        self.A_EX[loc] = extra_attr
+        self.total_util[loc] = cur_util + extra_attr
+        self.history.append(loc)
+
+    def rollback(self):
+        """
+        Undo the latest commit.
+
+        Returns:
+            int: Index of the location that was removed.
+        """
+        loc = self.history.pop()
+        self.U_T += self.x_jk[loc]
+        self.x_jk[loc] = 0
+        self.y[loc] = False
+        self.A_EX[loc] = 0
+        self.total_util[loc] = 0
+        return loc
+
+    def cost(self, F, C, B):
+        """Building, extra attractiveness and cars usage cost of the solution."""
+        return float(F @ self.y + C @ self.A_EX + np.vdot(B, self.x_jk))
+
+
+class ObjectiveState:
+    """
+    Running objective terms of the current greedy solution.
+
+    Keeps our attractiveness for every customer point and the total cost of the built facilities,
+    so the objective after building one more location is an O(I) update instead of
+    re-walking every built facility, competitor and cars usage record.
+
+    Args:
+        evaluator (CandidateEvaluator): Evaluator holding the static instance data.
+    """
+
+    def __init__(self, evaluator: CandidateEvaluator):
+        self.evaluator = evaluator
+        self.own_attr = np.zeros(len(evaluator.H))
+        self.cost = 0.0
+        self.version = 0  # number of committed locations
+
+    @classmethod
+    def from_solution(
+        cls,
+        evaluator: CandidateEvaluator,
+        facility_is_built: list,
+        total_util_list: list,
+        compensate_attractiveness: list,
+        cars_usage_record: list,
+    ):
+        """
+        Build the state of an existing solution given as the greedy lists.
+
+        Args:
+            evaluator (CandidateEvaluator): Evaluator holding the static instance data.
+            facility_is_built (list): List indicating whether a facility is built.
+            total_util_list (list): List representing total utility.
+            compensate_attractiveness (list): List representing compensation for attractiveness.
+            cars_usage_record (list): Record of cars' usage [(car type, number, location), ...].
+
+        Returns:
+            ObjectiveState: State of the solution.
+        """
+        state = cls(evaluator)
+        state.own_attr = evaluator.own_attraction(facility_is_built, total_util_list)
+        state.cost = float(
+            evaluator.F @ np.asarray(facility_is_built, dtype=float)
+            + evaluator.C @ np.asarray(compensate_attractiveness, dtype=float)
+            + sum(evaluator.B[j, k] * num for k, num, j in cars_usage_record)
+        )
+        return state
+
+    @classmethod
+    def from_state(cls, evaluator: CandidateEvaluator, solver_state: SolverState):
+        """
+        Build the state of a solution given as a SolverState.
+
+        Args:
+            evaluator (CandidateEvaluator): Evaluator holding the static instance data.
+            solver_state (SolverState): The solution.
+
+        Returns:
+            ObjectiveState: State of the solution.
+        """
+        state = cls(evaluator)
+        state.own_attr = evaluator.own_attraction(solver_state.y, solver_state.total_util)
+        state.cost = solver_state.cost(evaluator.F, evaluator.C, evaluator.B)
+        return state
+
+    @property
+    def comp_attr(self):
+        return self.evaluator.comp_attr
+
+    def objective(self):
+        """Objective value of the current solution."""
+        return float(self.evaluator.gain(self.own_attr)) - self.cost
+
+    def objective_if_built(self, loc: int, total_util: float, location_cost: float):
+        """
+        Calculate the objective value if one more location is built, without changing the state.
+
+        Args:
+            loc (int): Index of the location.
+            total_util (float): Total utility (cars + toilets) of the location.
+            location_cost (float): Cost of building the location (see CandidateEvaluator.location_cost).
+
+        Returns:
+            float: Objective value after building the location.
+        """
+        e_value = self.evaluator.E_function(total_util)
+        own_attr = self.own_attr + self.evaluator.inv_dist_sq(loc) * e_value
+        return float(self.evaluator.gain(own_attr)) - (self.cost + location_cost)
+
+    def score_candidates(self, loc_idx, total_util, location_cost):
+        """Batched version of objective_if_built, see CandidateEvaluator.score_candidates."""
+        return self.evaluator.score_candidates(
+            self.own_attr, self.cost, loc_idx, total_util, location_cost
+        )
+
+    def commit(self, loc: int, total_util: float, location_cost: float):
+        """
+        Build a location in the current solution.
+
+        Args:
+            loc (int): Index of the location.
+            total_util (float): Total utility (cars + toilets) of the location.
+            location_cost (float): Cost of building the location.
+        """
+        e_value = self.evaluator.E_function(total_util)
+        self.own_attr = self.own_attr + self.evaluator.inv_dist_sq(loc) * e_value
+        self.cost += location_cost
+        self.version += 1
+
+
+class LazyCandidateQueue:
+    """
+    Max-heap of the candidate locations keyed by their last objective value (CELF-style lazy greedy).
+
+    Building one of our facilities adds to the shared denominator of our_vs_all_percentage, so the marginal
+    gain of the other locations is expected to shrink. Only the top of the heap is re-scored until it stays on top.
+    The G function can break this assumption, so the result may differ from re-scoring every location.
+    A location whose fill plan no longer fits the remaining U_T is re-scored right away.
+    One queue is kept for each obj_e_this_round, since the fill plans depend on it.
+    """
+
+    def __init__(self):
+        self.heap = []  # (-marginal gain, location, stamp)
+        self.plans = {}  # location -> (cars to fill, total utility, location cost)
+        self.stamp = {}  # location -> stamp of its latest heap entry
+        self.scored_version = {}  # location -> objective state version of its latest score
+        self.evaluations = 0
+        self.evaluations_saved = 0
+
+    def _push(self, loc: int, marginal_gain: float, version: int):
+        self.stamp[loc] = self.stamp.get(loc, 0) + 1
+        self.scored_version[loc] = version
+        heapq.heappush(self.heap, (-marginal_gain, loc, self.stamp[loc]))
+
+    def _score(self, objective_state: ObjectiveState, loc: int, current_obj: float):
+        _, total_util, location_cost = self.plans[loc]
+        self.evaluations += 1
+        self._push(
+            loc,
+            objective_state.objective_if_built(loc, total_util, location_cost)
+            - current_obj,
+            objective_state.version,
+        )
+
+    def best(
+        self, objective_state: ObjectiveState, candidates: list, U_T: list, plan_location
+    ):
+        """
+        Find the location with the highest objective value.
+
+        Args:
+            objective_state (ObjectiveState): Running objective terms of the current solution.
+            candidates (list): List indicating whether a facility has been built.
+            U_T (list): Remaining amount of each car type.
+            plan_location (callable): plan_location(loc) -> (cars to fill [(car type, number), ...], total utility, location cost)
+
+        Returns:
+            tuple: The best location (-1 if every location is built) and its objective value.
+        """
+        unbuilt = [loc for loc, facility in enumerate(candidates) if facility == 0]
+        evaluations_before = self.evaluations
+        current_obj = objective_state.objective()
+        if not self.plans:
+            # First call, score every location in one batch
+            for loc in unbuilt:
+                self.plans[loc] = plan_location(loc)
+            objs = objective_state.score_candidates(
+                unbuilt,
+                [self.plans[loc][1] for loc in unbuilt],
+                [self.plans[loc][2] for loc in unbuilt],
+            )
+            self.evaluations += len(unbuilt)
+            for loc, obj in zip(unbuilt, objs):
+                self._push(loc, float(obj) - current_obj, objective_state.version)
+        else:
+            # Fall back to re-scoring the locations whose fill plan was changed by the remaining U_T
+            for loc in unbuilt:
+                if any(U_T[k] < num for k, num in self.plans[loc][0]):
+                    self.plans[loc] = plan_location(loc)
+                    self._score(objective_state, loc, current_obj)
+
+        best_loc, best_obj = -1, None
+        while self.heap:
+            neg_gain, loc, stamp = self.heap[0]
+            if candidates[loc] == 1 or stamp != self.stamp[loc]:
+                heapq.heappop(self.heap)  # built location or outdated entry
+            elif self.scored_version[loc] != objective_state.version:
+                heapq.heappop(self.heap)
+                self._score(objective_state, loc, current_obj)
+            else:
+                best_loc, best_obj = loc, current_obj - neg_gain
+                break
+        self.evaluations_saved += len(unbuilt) - (self.evaluations - evaluations_before)
+        return best_loc, best_obj
+
+
+class FillKernel:
+    """
+    Fill many candidate locations at once, the batched version of fill_location in heuristic_greedyV5.
+
+    V never changes during a run, so the order in which each location takes the car types
+    (largest V first, ties by the larger car type like sorted(..., reverse=True)) is computed once per instance.
+    A fill is then at most k passes over the locations: each pass takes
+    min(U_L left, U_LT, U_T, ceil((obj_e - util) / V)) of the next car type of every location still filling.
+
+    Args:
+        V (array-like): Utility of each car type at each location, Dim: (j, k)
+        U_L (array-like): Capacity of each location, Dim: (j)
+        U_LT (array-like): Capacity of each car type at each location, Dim: (j, k)
+        A_EX_bound (int): Upper bound of the extra attractiveness.
+        order (np.ndarray, optional): Precomputed car type order, Dim: (j, k)
+    """
+
+    def __init__(self, V, U_L, U_LT, A_EX_bound, order=None):
+        self.V = np.asarray(V)
+        self.U_L = np.asarray(U_L)
+        self.U_LT = np.asarray(U_LT)
+        self.A_EX_bound = A_EX_bound
+        if order is None:
+            car_type = np.broadcast_to(np.arange(self.V.shape[1]), self.V.shape)
+            order = np.lexsort((-car_type, -self.V), axis=-1)
+        self.order = order
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(config["V"], config["U_L"], config["U_LT"], config["A_EX_bound"])
+
+    def fill(self, loc_idx, obj_e_this_round: int, U_T):
+        """
+        Fill every given location for one target.
+
+        Args:
+            loc_idx (array-like): Index of each location, Dim: (n)
+            obj_e_this_round (int): Maximun value for the attractiveness to reach.
+            U_T (array-like): Remaining amount of each car type, Dim: (k)
+
+        Returns:
+            tuple: Number of cars of each type (n, k), utility from the cars (n), extra attractiveness (n)
+            and the number of car types visited (n), i.e. the length of each fill_location plan.
+        """
+        loc_idx = np.asarray(loc_idx, dtype=int)
+        U_T = np.asarray(U_T)
+        rows = np.arange(len(loc_idx))
+        cars_dtype = np.result_type(self.U_L, self.U_LT, U_T, np.int64)  # 容量有小數時不截斷
+        cars_to_fill = np.zeros((len(loc_idx), self.V.shape[1]), dtype=cars_dtype)
+        quota_loc = self.U_L[loc_idx].astype(cars_dtype)
+        cur_util = np.zeros(len(loc_idx), dtype=np.result_type(self.V, cars_dtype))
+        n_visited = np.zeros(len(loc_idx), dtype=int)
+        for step in range(self.V.shape[1]):
+            filling = (quota_loc > 0) & (cur_util < obj_e_this_round)
+            if not filling.any():
+                break
+            car_type = self.order[loc_idx, step]
+            value = self.V[loc_idx, car_type]
+            to_target = np.ceil((obj_e_this_round - cur_util) / value)
+            num_to_fill = np.minimum(
+                np.minimum(quota_loc, self.U_LT[loc_idx, car_type]),
+                np.minimum(U_T[car_type], to_target),
+            ).astype(cars_dtype)
+            num_to_fill[~filling] = 0  # 此點容納不下車了或已達目標
+            cars_to_fill[rows, car_type] = num_to_fill
+            quota_loc -= num_to_fill
+            cur_util += num_to_fill * value
+            n_visited += filling
+        extra_attr = np.minimum(
+            np.maximum(0, obj_e_this_round - cur_util), self.A_EX_bound
+        )
+        return cars_to_fill, cur_util, extra_attr, n_visited
+
+    def plans(self, loc_idx, obj_e_this_round: int, U_T):
+        """
+        Same as fill, as fill_location plans.
+
+        Returns:
+            list: For each location, a tuple containing the cars to fill [(car type, number), ...],
+            the utility from the cars and the extra attractiveness.
+        """
+        cars_to_fill, cur_util, extra_attr, n_visited = self.fill(
+            loc_idx, obj_e_this_round, U_T
+        )
+        order = self.order[np.asarray(loc_idx, dtype=int)].tolist()
+        cars_to_fill = cars_to_fill.tolist()
+        return [
+            ([(k, cars[k]) for k in car_types[:visited]], util, extra)
+            for car_types, cars, visited, util, extra in zip(
+                order,
+                cars_to_fill,
+                n_visited.tolist(),
+                cur_util.tolist(),
+                extra_attr.tolist(),
+            )
+        ]
+
+
+class FillPlanCache:
+    """
+    Fill plans of the candidate locations, keyed on (location, obj_e_this_round).
+
+    A fill plan only depends on the static V, U_L, U_LT of the location and on the remaining U_T of the car types
+    it takes, so a plan computed in one iteration is still the same plan later as long as U_T covers every
+    number it takes. After a build only the plans that take one of the reduced car types are checked,
+    and dropped if a remaining U_T no longer covers them.
+    """
+
+    def __init__(self):
+        self.plans = {}  # (location, obj_e_this_round) -> (cars to fill, util from cars, extra attractiveness)
+        self.by_car_type = {}  # car type -> keys of the plans that take it
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, loc: int, obj_e_this_round: int):
+        """Cached plan of a location for a target, None if it has to be (re)computed."""
+        plan = self.plans.get((loc, obj_e_this_round))
+        if plan is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return plan
+
+    def put(self, loc: int, obj_e_this_round: int, plan: tuple):
+        key = (loc, obj_e_this_round)
+        self.plans[key] = plan
+        for car_type, _ in plan[0]:
+            self.by_car_type.setdefault(car_type, set()).add(key)
+
+    def _drop(self, key):
+        for car_type, _ in self.plans.pop(key)[0]:
+            self.by_car_type[car_type].discard(key)
+        self.invalidations += 1
+
+    def invalidate(self, U_T: list, cars_to_fill: list):
+        """
+        Drop the plans that don't fit the remaining U_T after a build.
+
+        Args:
+            U_T (list): Remaining number of cars of each type after the build.
+            cars_to_fill (list): Cars taken by the build [(car type, number), ...].
+        """
+        for car_type in {k for k, num in cars_to_fill if num > 0}:
+            for key in list(self.by_car_type.get(car_type, ())):
+                if any(U_T[k] < num for k, num in self.plans[key][0]):
+                    self._drop(key)
+
+    def stats(self):
+        """Hit / miss counts and the hit rate of the lookups."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ParallelCandidateScorer:
+    """
+    Score the candidate locations of a greedy iteration on a pool of worker processes.
+
+    The static instance arrays are placed in shared memory once, the workers attach to them instead of
+    receiving pickled copies. For a coordinate-based instance the customer and location coordinates are shared
+    instead of 1 / D^2, and each worker computes the columns of its own chunk. Each task only carries its chunk of locations and the small running state
+    (our attractiveness per customer, cost, remaining U_T). Ties are broken by the lowest location index,
+    so the chosen location is the same as in the serial batch evaluation.
+
+    Args:
+        config (dict): The instance configuration.
+        G_function (callable): Vectorized G function of the algorithm version.
+        E_function (callable): Vectorized E function of the algorithm version.
+        n_workers (int): Number of worker processes.
+    """
+
+    def __init__(
+        self, config: dict, G_function, E_function, n_workers: int
+    ):
+        evaluator = CandidateEvaluator(config, G_function, E_function)
+        kernel = FillKernel.from_config(config)
+        arrays = {name: getattr(kernel, name) for name in ["V", "U_L", "U_LT", "order"]}
+        arrays.update({name: getattr(evaluator, name) for name in SHARED_ARRAYS[:6]})
+        distance_spec = None
+        if evaluator.inv_D_sq is None:  # computed from the coordinates
+            distances = evaluator.distances
+            del arrays["inv_D_sq"]
+            arrays.update(zip(SHARED_COORDINATES, (distances.points_1, distances.points_2)))
+            distance_spec = (type(distances), distances.cal_method, distances.decimals, evaluator.block_bytes)
+
+        self.n_workers = n_workers
+        self.shm_blocks = []
+        self.pool = None
+        shm_specs = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.shm_blocks.append(shm)
+                np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+                shm_specs[name] = (shm.name, array.shape, array.dtype.str)
+            self.pool = mp.Pool(
+                n_workers,
+                initializer=_init_scoring_worker,
+                initargs=(
+                    shm_specs,
+                    config["A_EX_bound"],
+                    G_function,
+                    E_function,
+                    distance_spec,
+                ),
+            )
+        except BaseException:
+            # 建到一半失敗 (記憶體不足, 無法開 process...) 也要釋放已經建好的 shared memory
+            self.close()
+            raise
+
+    def best(
+        self,
+        objective_state: ObjectiveState,
+        candidates: list,
+        U_T: list,
+        obj_e_this_round: int,
+    ):
+        """
+        Find the location with the highest objective value.
+
+        Args:
+            objective_state (ObjectiveState): Running objective terms of the current solution.
+            candidates (list): List indicating whether a facility has been built.
+            U_T (list): Remaining amount of each car type.
+            obj_e_this_round: maximun value for the attractiveness to reach.
+
+        Returns:
+            tuple: The best location (-1 if every location is built) and its objective value.
+        """
+        unbuilt = [loc for loc, facility in enumerate(candidates) if facility == 0]
+        chunks = [c.tolist() for c in np.array_split(unbuilt, self.n_workers) if len(c)]
+        tasks = [
+            (
+                chunk,
+                objective_state.own_attr,
+                objective_state.cost,
+                list(U_T),
+                obj_e_this_round,
+            )
+            for chunk in chunks
+        ]
+        best_loc, best_obj = -1, None
+        for obj, loc in self.pool.map(_score_chunk, tasks):
+            if best_loc == -1 or obj > best_obj or (obj == best_obj and loc < best_loc):
+                best_loc, best_obj = loc, obj
+        return best_loc, best_obj
+
+    def close(self, terminate: bool = False):
+        """
+        Stop the workers and release the shared memory. Can be called more than once.
+
+        Args:
+            terminate (bool, optional): Kill the workers instead of letting them finish, e.g. on an exception.
+        """
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for shm in self.shm_blocks:
+            shm.close()
+            shm.unlink()
+        self.shm_blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(terminate=exc_type is not None)
+
+
+_worker = {}  # per-process state of the scoring workers
+
+
+def _attach_shared_memory(shm_name):
+    """
+    Attach to a shared memory block of the main process, which alone unlinks it.
+
+    From Python 3.13 the block is not registered with the resource_tracker (track=False). Before, attaching registers
+    it again, a no-op since the pool workers share the main process's resource_tracker. Calling
+    resource_tracker.unregister here would remove the main process's registration and make its unlink fail.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    return shared_memory.SharedMemory(name=shm_name)
+
+
+def _init_scoring_worker(shm_specs, A_EX_bound, G_function, E_function, distance_spec=None):
+    arrays = {}
+    for name, (shm_name, shape, dtype) in shm_specs.items():
+        shm = _attach_shared_memory(shm_name)
+        _worker.setdefault("shm_blocks", []).append(shm)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+    if distance_spec is None:
+        _worker["evaluator"] = CandidateEvaluator.from_arrays(arrays, G_function, E_function)
+    else:
+        # 每個 worker 只算自己那一塊地點的 1 / D^2
+        distance_type, cal_method, decimals, block_bytes = distance_spec
+        distances = distance_type(*(arrays[name] for name in SHARED_COORDINATES), cal_method, decimals)
+        _worker["evaluator"] = CandidateEvaluator.from_arrays(
+            arrays, G_function, E_function, distances, block_bytes
+        )
+    _worker["kernel"] = FillKernel(
+        arrays["V"], arrays["U_L"], arrays["U_LT"], A_EX_bound, arrays["order"]
+    )
+
+
+def _score_chunk(task):
+    locs, own_attr, base_cost, U_T, obj_e_this_round = task
+    evaluator = _worker["evaluator"]
+    cars_to_fill, cur_util, extra_attr, _ = _worker["kernel"].fill(
+        locs, obj_e_this_round, U_T
+    )
+    objs = evaluator.score_candidates(
+        own_attr,
+        base_cost,
+        locs,
+        cur_util + extra_attr,
+        evaluator.location_costs(locs, extra_attr, cars_to_fill),
+    )
+    best = int(np.argmax(objs))  # first location with the highest objective
+    return float(objs[best]), locs[best]
@@ -5,6 +5,7 @@ import copy
 import math
 import time
 import os
+import numpy as np
 
 current_dir = os.path.dirname(__file__)
 # current_dir = os.getcwd()  #用在ipynb
@@ -13,6 +14,7 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.abspath(os.path.join(current_dir, ".."))
 sys.path.append(parent_dir)
 import utility as util
+import greedy_engine as engine
 
 
 E_MAX_INPUT = 100
@@ -65,6 +67,14 @@ def E_function(x):
         return -0.004 * (x**2) + 0.8 * x
 
 
+def G_function_array(x):
+    return np.where(x > G_MAX_INPUT, 1, -0.000015 * (x**2) + 0.0095 * x)
+
+
+def E_function_array(x):
+    return np.where(x > E_MAX_INPUT, 40, -0.004 * (x**2) + 0.8 * x)
+
+
 def greedy_best_location(
     iter_config: dict,
     candidates: list,
@@ -73,6 +83,7 @@ def greedy_best_location(
     total_util_list: list,
     obj_e_this_round: int,
     verbose: int = 1,
+    evaluator: engine.CandidateEvaluator = None,
 ):
     """
     Finds the best location to allocate resources based on maximizing utility until a point can no longer accommodate more resources.
@@ -85,17 +96,29 @@ def greedy_best_location(
         total_util_list (list): List representing total utility.
         obj_e_this_round: maximun value for the attractiveness to reach. 平常是E_MAX_INPUT, 偶爾被影響變小在最後一輪
         verbose (bool, optional): Whether to print messages or not. Defaults to True.
+        evaluator (CandidateEvaluator, optional): Batched evaluator of the instance. Built from iter_config if not given.
 
     Returns:
         tuple: A tuple containing the updated configuration, the best objective value, the best location index,
         the compensation for attractiveness at the best location, the record of cars' usage, and the updated total utility list.
     """
-    best_iter_config, best_obj, best_loc = iter_config, -1, -1
+    best_iter_config, best_obj, best_loc, best_fill = iter_config, -1, -1, None
     best_compensate_attractiveness, best_cars_usage_record, best_total_util_list = (
         None,
         None,
         None,
     )
+    if evaluator is None:
+        evaluator = engine.CandidateEvaluator(
+            iter_config, G_function_array, E_function_array
+        )
+    objective_state = engine.ObjectiveState.from_solution(
+        evaluator,
+        candidates,
+        total_util_list,
+        compensate_attractiveness,
+        cars_usage_record,
+    )
 
     # Find the best location with the highest objective value
     for ind, facility in enumerate(candidates):
@@ -106,9 +129,9 @@ def greedy_best_location(
                 (value, index) for index, value in enumerate(iter_config["V"][ind])
             ]
             sorted_car_list = sorted(car_list, reverse=True)
-            quota_loc = copy.deepcopy(iter_config["U_L"][ind])
-            quota_loc_k = copy.deepcopy(iter_config["U_LT"][ind])
-            quota_k = copy.deepcopy(iter_config["U_T"])
+            quota_loc = iter_config["U_L"][ind]
+            quota_loc_k = copy.copy(iter_config["U_LT"][ind])
+            quota_k = copy.copy(iter_config["U_T"])
 
             cur_to_fill = []
             cur_util = 0
@@ -130,46 +153,55 @@ def greedy_best_location(
                 cur_util += num_to_fill * car_to_fill[0]
                 cur_to_fill.append((car_to_fill[1], num_to_fill))
 
-            # Update the temporary configuration and other related parameters
-            cur_config = copy.deepcopy(iter_config)
-            cur_config = update_config_each_iteration_build_j(cur_config, cur_to_fill)
-            tmp_candidates = copy.deepcopy(candidates)
-            tmp_candidates[ind] = 1
-            tmp_compensate_attractiveness = copy.deepcopy(compensate_attractiveness)
-            tmp_compensate_attractiveness[ind] = min(
-                max(0, obj_e_this_round - cur_util), iter_config["A_EX_bound"]
-            )
+            # 只記下這個點的填法, 選定的點最後才更新 config 和各個 list
+            extra_attr = min(max(0, obj_e_this_round - cur_util), iter_config["A_EX_bound"])
             if verbose:
+                print(f"地點{ind+1}的cur_util:{cur_util}, 蓋廁所數量：{extra_attr}")
                 print(
-                    f"地點{ind+1}的cur_util:{cur_util}, 蓋廁所數量：{tmp_compensate_attractiveness[ind]}"
+                    "廁所:",
+                    compensate_attractiveness[:ind]
+                    + [extra_attr]
+                    + compensate_attractiveness[ind + 1 :],
+                )
+            if verbose == 2:
+                print_objective_breakdown(
+                    evaluator,
+                    candidates[:ind] + [1] + candidates[ind + 1 :],
+                    total_util_list[:ind]
+                    + [cur_util + extra_attr]
+                    + total_util_list[ind + 1 :],
+                    compensate_attractiveness[:ind]
+                    + [extra_attr]
+                    + compensate_attractiveness[ind + 1 :],
+                    cars_usage_record + [(x[0], x[1], ind) for x in cur_to_fill],
                 )
-                print("廁所:", tmp_compensate_attractiveness)
-            tmp_cars_usage_record = copy.deepcopy(cars_usage_record)
-            tmp_cars_usage_record.extend([(x[0], x[1], ind) for x in cur_to_fill])
-            tmp_total_util_list = copy.deepcopy(total_util_list)
-            tmp_total_util_list[ind] = cur_util + tmp_compensate_attractiveness[ind]
 
             # Calculate the current objective value
-            cur_obj = calc_current_gain(
-                cur_config, tmp_candidates, tmp_total_util_list, verbose
-            ) - calc_current_cost(
-                cur_config,
-                tmp_candidates,
-                tmp_compensate_attractiveness,
-                tmp_cars_usage_record,
-                verbose,
+            cur_obj = objective_state.objective_if_built(
+                ind,
+                cur_util + extra_attr,
+                evaluator.location_cost(ind, extra_attr, cur_to_fill),
             )
             if verbose == 2:
                 print(f"地點 {ind+1}的 cur_obj: {cur_obj:.4f}\n")
             if cur_obj > best_obj:
                 best_obj = cur_obj
                 best_loc = ind
-                best_compensate_attractiveness = copy.deepcopy(
-                    tmp_compensate_attractiveness
-                )
-                best_cars_usage_record = copy.deepcopy(tmp_cars_usage_record)
-                best_iter_config = cur_config
-                best_total_util_list = copy.deepcopy(tmp_total_util_list)
+                best_fill = (ind, cur_util, extra_attr, cur_to_fill)
+
+    if best_fill is not None:
+        # Build the best location on a copy, iter_config itself is not changed
+        ind, cur_util, extra_attr, cur_to_fill = best_fill
+        best_iter_config = update_config_each_iteration_build_j(
+            {**iter_config, "U_T": copy.copy(iter_config["U_T"])}, cur_to_fill
+        )
+        best_compensate_attractiveness = copy.copy(compensate_attractiveness)
+        best_compensate_attractiveness[ind] = extra_attr
+        best_cars_usage_record = cars_usage_record + [
+            (x[0], x[1], ind) for x in cur_to_fill
+        ]
+        best_total_util_list = copy.copy(total_util_list)
+        best_total_util_list[ind] = cur_util + extra_attr
 
     if verbose:
         print(f"Iteration ended! Found the best location: {best_loc+1}")
@@ -201,119 +233,39 @@ def update_config_each_iteration_build_j(config: dict, cars_to_fill: list):
     return config
 
 
-def calc_current_gain(
-    config: dict, facility_is_built: list, total_util_list: list, verbose: int = 0
-):
-    """
-    Calculate the current gain based on the configuration, built facilities, and total utility list.
-
-    Args:
-        config (dict): The current configuration.
-        facility_is_built (list): List indicating whether a facility is built.
-        total_util_list (list): List representing total utility.
-
-    Returns:
-        float: Total gain.
-    """
-    total_gain = 0
-    for customer_pt_i in range(config["i_amount"]):
-        total_attr_i, our_vs_all_percentage = calc_total_attr_i(
-            config, customer_pt_i, facility_is_built, total_util_list
-        )
-        customer_gain = (
-            config["H"][customer_pt_i]
-            * G_function(total_attr_i)
-            * our_vs_all_percentage
-        )
-        total_gain += customer_gain
-        if verbose == 2:
-            print(
-                f"Customer {customer_pt_i} | total_attr={total_attr_i:.4f} | G={G_function(total_attr_i):.4f}, Our percentage={our_vs_all_percentage:.4f}, Earned money={customer_gain:.4f}"
-            )
-    if verbose == 2:
-        print(f"Total earned money: {total_gain:.4f}")
-    return total_gain
-
-
-def calc_total_attr_i(
-    config: dict, customer_pt_i: int, facility_is_built: list, total_util_list: list
-):
-    """
-    Calculate the total attractiveness for a given customer point i and our facility vs all facilities ratio.
-
-    Args:
-        config (dict): The current configuration.
-        customer_pt_i (int): Index of the customer point.
-        facility_is_built (list): List indicating whether a facility is built.
-        total_util_list (list): List representing total utility.
-
-    Returns:
-        tuple: A tuple containing the total attractiveness for the customer point i and our facility vs all facilities ratio.
-    """
-    total_attr_i = 0
-
-    # Calculate attractiveness contributed by our facilities
-    for j_idx, facility in enumerate(facility_is_built):
-        if facility == 1:
-            total_attr_i += E_function(total_util_list[j_idx]) / (
-                config["D"][customer_pt_i][j_idx] ** 2
-            )
-
-    only_our_facilities_total_attr = total_attr_i  # Temporary total attractiveness contributed only by our facilities
-
-    # Add attractiveness contributed by opponents' facilities
-    for l_idx in range(config["l_amount"]):
-        total_attr_i += config["A_opponent_bar"][l_idx] / (
-            config["D_comp"][customer_pt_i][l_idx] ** 2
-        )
-
-    our_vs_all_percentage = (
-        only_our_facilities_total_attr / total_attr_i
-    )  # Calculate the ratio of our facilities' attractiveness to all facilities'
-
-    return total_attr_i, our_vs_all_percentage
-
-
-def calc_current_cost(
-    config: dict,
+def print_objective_breakdown(
+    evaluator: engine.CandidateEvaluator,
     facility_is_built: list,
+    total_util_list: list,
     compensate_attractiveness: list,
     cars_usage_record: list,
-    verbose: int = 0,
 ):
     """
-    Calculate the current cost based on the configuration, built facilities, compensation for attractiveness, and cars usage record.
+    Print the earned money of each customer point and the cost breakdown of a solution (verbose == 2).
 
     Args:
-        config (dict): The current configuration.
+        evaluator (CandidateEvaluator): Batched evaluator of the instance.
         facility_is_built (list): List indicating whether a facility is built.
+        total_util_list (list): List representing total utility.
         compensate_attractiveness (list): List representing compensation for attractiveness.
         cars_usage_record (list): Record of cars' usage.
-
-    Returns:
-        float: Total current cost.
     """
-    total_cost = 0
-
-    # Calculate cost for building facilities
-    build_cost = sum(x * y for x, y in zip(facility_is_built, config["F"]))
-
-    # Calculate cost for compensating attractiveness
-    attr_cost = sum(x * y for x, y in zip(compensate_attractiveness, config["C"]))
-
-    # Calculate cost for using cars
-    for car_type, allocate_num, loc_j in cars_usage_record:
-        total_cost += config["B"][loc_j][car_type] * allocate_num
-
-    total_cost += build_cost + attr_cost
-
-    # Print cost breakdown
-    if verbose == 2:
+    breakdown = evaluator.objective_breakdown(
+        facility_is_built, total_util_list, compensate_attractiveness, cars_usage_record
+    )
+    for customer_pt_i, customer_gain in enumerate(breakdown["customer_gain"]):
         print(
-            f"Build cost: {build_cost} | Extra Attraction cost: {attr_cost} | Cars usage cost: {total_cost - build_cost - attr_cost} | Total cost: {total_cost}"
+            f"Customer {customer_pt_i} | total_attr={breakdown['total_attr'][customer_pt_i]:.4f} | G={breakdown['G'][customer_pt_i]:.4f}, Our percentage={breakdown['our_vs_all_percentage'][customer_pt_i]:.4f}, Earned money={customer_gain:.4f}"
         )
-
-    return total_cost
+    print(f"Total earned money: {breakdown['customer_gain'].sum():.4f}")
+    build_cost, attr_cost, cars_cost = (
+        breakdown["build_cost"],
+        breakdown["attr_cost"],
+        breakdown["cars_cost"],
+    )
+    print(
+        f"Build cost: {build_cost} | Extra Attraction cost: {attr_cost} | Cars usage cost: {cars_cost} | Total cost: {build_cost + attr_cost + cars_cost}"
+    )
 
 
 def heuristic_greedy_optimizeV2(config_path, verbose=1):
@@ -326,7 +278,8 @@ def heuristic_greedy_optimizeV2(config_path, verbose=1):
     Returns:
         float: Overall best objective value.
     """
-    config = util.load_specific_yaml(config_path)
+    config = util.load_instance(config_path)
+    evaluator = engine.CandidateEvaluator(config, G_function_array, E_function_array)
     improve = True
     overall_best_obj = 0
     candidates = [0 for _ in range(config["j_amount"])]
@@ -348,7 +301,6 @@ def heuristic_greedy_optimizeV2(config_path, verbose=1):
         print("===============================================================")
         print("New Iteration begins")
         improve = False
-        iter_best_config = copy.deepcopy(config)
         (
             cur_config,
             cur_obj,
@@ -357,13 +309,14 @@ def heuristic_greedy_optimizeV2(config_path, verbose=1):
             cur_cars_usage_record,
             cur_total_util_list,
         ) = greedy_best_location(
-            iter_best_config,
+            config,
             candidates,
             compensate_attractiveness,
             cars_usage_record,
             total_util_list,
             E_MAX_INPUT,
             verbose,
+            evaluator,
         )
         if cur_obj > overall_best_obj:
             improve = True
@@ -389,7 +342,6 @@ def heuristic_greedy_optimizeV2(config_path, verbose=1):
         else:
             print("No improvement in this iteration. End the loop\n\n")
     # TODO 這次改動：加入最後一次嘗試，不要規定要填滿E
-    iter_best_config = copy.deepcopy(config)
     for percentage in [64, 32, 16, 8, 4, 2, 1]:
         print("迴圈結束後, 嘗試不同的E%數:")
         (
@@ -400,13 +352,14 @@ def heuristic_greedy_optimizeV2(config_path, verbose=1):
             cur_cars_usage_record,
             cur_total_util_list,
         ) = greedy_best_location(
-            iter_best_config,
+            config,
             candidates,
             compensate_attractiveness,
             cars_usage_record,
             total_util_list,
             math.floor(E_MAX_INPUT * percentage / 100),
             verbose=0,
+            evaluator=evaluator,
         )
         if (
             cur_obj > overall_best_obj
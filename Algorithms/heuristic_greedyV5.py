@@ -4,10 +4,12 @@ G(x) = 1-2^(-0.02x), >0.99 when x >= 333
 E(x) = 40 - 40*2^(-0.05x) > 99% when x >= 132.877
 """
 import sys
-import copy
 import math
+import contextlib
 import time
 import os
+import logging
+import numpy as np
 
 current_dir = os.path.dirname(__file__)
 # current_dir = os.getcwd()  #用在ipynb
@@ -16,6 +18,9 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.abspath(os.path.join(current_dir, ".."))
 sys.path.append(parent_dir)
 import utility as util
+import greedy_engine as engine
+
+logger = util.get_logger("heuristic_greedyV5")
 
 G_MAX_INPUT = 333
 E_MAX_INPUT = 132.877
@@ -68,408 +73,696 @@ def E_function(x):
         return 40 - 40 * math.pow(2, -0.05 * x)
 
 
-def greedy_best_location(
-    iter_config: dict,
-    candidates: list,
-    compensate_attractiveness: list,
-    cars_usage_record: list,
-    total_util_list: list,
-    obj_e_this_round: int,
-    verbose: int = 1,
+def G_function_array(x):
+    return np.where(x > G_MAX_INPUT, 1, 1 - np.power(2, -0.02 * x))
+
+
+def E_function_array(x):
+    return np.where(x > E_MAX_INPUT, 40, 40 - 40 * np.power(2, -0.05 * x))
+
+
+def fill_location_targets(
+    config: dict,
+    loc: int,
+    obj_e_targets: list,
+    U_T,
+    fill_cache: engine.FillPlanCache = None,
 ):
     """
-    Finds the best location to allocate resources based on maximizing utility until a point can no longer accommodate more resources.
+    Fill a location with the cars of the largest utility (V) until it can't accommodate more or reaches the target,
+    the rest is made up with extra attractiveness (toilets). All targets are filled in one sweep over the sorted cars,
+    since every car type is visited once, its U_LT / U_T quota is the same for every target.
 
     Args:
-        iter_config (dict): A temporary copy of the configuration.
-        candidates (list): List indicating whether a facility has been built.
-        compensate_attractiveness (list): List representing compensation for attractiveness.
-        cars_usage_record (list): Record of cars' usage.
-        total_util_list (list): List representing total utility.
-        obj_e_this_round: maximun value for the attractiveness to reach. 平常是E_MAX_INPUT, 偶爾被影響變小在最後一輪
-        verbose (bool, optional): Whether to print messages or not. Defaults to True.
+        config (dict): The instance configuration.
+        loc (int): Index of the location.
+        obj_e_targets (list): Maximun values for the attractiveness to reach (obj_e_this_round).
+        U_T (array-like): Remaining amount of each car type.
+        fill_cache (FillPlanCache, optional): Plans of the previous iterations, only the missing targets are filled.
 
     Returns:
-        tuple: A tuple containing the updated configuration, the best objective value, the best location index,
-        the compensation for attractiveness at the best location, the record of cars' usage, and the updated total utility list.
+        list: For each target, a tuple containing the cars to fill [(car type, number), ...], the utility from the cars
+        and the extra attractiveness.
     """
-    best_iter_config, best_obj, best_loc = iter_config, -1, -1
-    best_compensate_attractiveness, best_cars_usage_record, best_total_util_list = (
-        None,
-        None,
-        None,
-    )
-
-    # Find the best location with the highest objective value
-    for ind, facility in enumerate(candidates):
-        if (
-            facility == 0
-        ):  # If the facility hasn't been built yet, start filling with the largest utility (V)
-            car_list = [
-                (value, index) for index, value in enumerate(iter_config["V"][ind])
-            ]
-            sorted_car_list = sorted(car_list, reverse=True)
-            quota_loc = copy.deepcopy(iter_config["U_L"][ind])
-            quota_loc_k = copy.deepcopy(iter_config["U_LT"][ind])
-            quota_k = copy.deepcopy(iter_config["U_T"])
-
-            cur_to_fill = []
-            cur_util = 0
-            while quota_loc > 0:
-                if len(sorted_car_list) == 0:  # 當下能丟在這的車都丟完了
-                    break
-                elif cur_util >= obj_e_this_round:  # 大於最高效益再丟都是浪費
-                    break
-                car_to_fill = sorted_car_list.pop(0)
-                num_to_fill = min(
-                    quota_loc,
-                    quota_loc_k[car_to_fill[1]],
-                    quota_k[car_to_fill[1]],
-                    math.ceil((obj_e_this_round - cur_util) / car_to_fill[0]),
-                )
-                quota_k[car_to_fill[1]] -= num_to_fill
-                quota_loc_k[car_to_fill[1]] -= num_to_fill
-                quota_loc -= num_to_fill
-                cur_util += num_to_fill * car_to_fill[0]
-                cur_to_fill.append((car_to_fill[1], num_to_fill))
-
-            # Update the temporary configuration and other related parameters
-            cur_config = copy.deepcopy(iter_config)
-            cur_config = update_config_each_iteration_build_j(cur_config, cur_to_fill)
-            tmp_candidates = copy.deepcopy(candidates)
-            tmp_candidates[ind] = 1
-            tmp_compensate_attractiveness = copy.deepcopy(compensate_attractiveness)
-            tmp_compensate_attractiveness[ind] = min(
-                max(0, obj_e_this_round - cur_util), iter_config["A_EX_bound"]
-            )
-            if verbose:
-                print(
-                    f"地點{ind+1}的cur_util:{cur_util}, 蓋廁所數量：{tmp_compensate_attractiveness[ind]}"
-                )
-                print("廁所:", tmp_compensate_attractiveness)
-            tmp_cars_usage_record = copy.deepcopy(cars_usage_record)
-            tmp_cars_usage_record.extend([(x[0], x[1], ind) for x in cur_to_fill])
-            tmp_total_util_list = copy.deepcopy(total_util_list)
-            tmp_total_util_list[ind] = cur_util + tmp_compensate_attractiveness[ind]
-
-            # Calculate the current objective value
-            cur_obj = calc_current_gain(
-                cur_config, tmp_candidates, tmp_total_util_list, verbose
-            ) - calc_current_cost(
-                cur_config,
-                tmp_candidates,
-                tmp_compensate_attractiveness,
-                tmp_cars_usage_record,
-                verbose,
+    if fill_cache is not None:
+        plans = [fill_cache.get(loc, obj_e) for obj_e in obj_e_targets]
+        missing = [e for e, plan in zip(obj_e_targets, plans) if plan is None]
+        if missing:
+            filled = dict(zip(missing, fill_location_targets(config, loc, missing, U_T)))
+            for obj_e_this_round, plan in filled.items():
+                fill_cache.put(loc, obj_e_this_round, plan)
+            plans = [filled.get(e, plan) for e, plan in zip(obj_e_targets, plans)]
+        return plans
+
+    U_T = np.asarray(U_T)
+    car_list = [(value, index) for index, value in enumerate(config["V"][loc])]
+    sorted_car_list = sorted(car_list, reverse=True)
+    quota_loc = [config["U_L"][loc]] * len(obj_e_targets)
+    cur_util = [0] * len(obj_e_targets)
+    cur_to_fill = [[] for _ in obj_e_targets]
+
+    for value, car_type in sorted_car_list:
+        still_filling = False
+        for t, obj_e_this_round in enumerate(obj_e_targets):
+            if quota_loc[t] <= 0:  # 此點容納不下車了
+                continue
+            elif cur_util[t] >= obj_e_this_round:  # 大於最高效益再丟都是浪費
+                continue
+            num_to_fill = min(
+                quota_loc[t],
+                config["U_LT"][loc][car_type],
+                U_T[car_type].item(),
+                math.ceil((obj_e_this_round - cur_util[t]) / value),
             )
-            if verbose == 2:
-                print(f"地點 {ind+1}的 cur_obj: {cur_obj:.4f}\n")
-            if cur_obj > best_obj:
-                best_obj = cur_obj
-                best_loc = ind
-                best_compensate_attractiveness = copy.deepcopy(
-                    tmp_compensate_attractiveness
-                )
-                best_cars_usage_record = copy.deepcopy(tmp_cars_usage_record)
-                best_iter_config = cur_config
-                best_total_util_list = copy.deepcopy(tmp_total_util_list)
+            quota_loc[t] -= num_to_fill
+            cur_util[t] += num_to_fill * value
+            cur_to_fill[t].append((car_type, num_to_fill))
+            still_filling = True
+        if not still_filling:
+            break
 
-    if verbose:
-        print(f"Iteration ended! Found the best location: {best_loc+1}")
-        print(f"Best obj: {best_obj}")
-
-    return (
-        best_iter_config,
-        best_obj,
-        best_loc,
-        best_compensate_attractiveness,
-        best_cars_usage_record,
-        best_total_util_list,
-    )
+    return [
+        (
+            cur_to_fill[t],
+            cur_util[t],
+            min(max(0, obj_e_this_round - cur_util[t]), config["A_EX_bound"]),
+        )
+        for t, obj_e_this_round in enumerate(obj_e_targets)
+    ]
 
 
-def update_config_each_iteration_build_j(config: dict, cars_to_fill: list):
+def fill_location(
+    config: dict,
+    loc: int,
+    obj_e_this_round: int,
+    U_T,
+    fill_cache: engine.FillPlanCache = None,
+):
+    """
+    Fill a location for a single target, see fill_location_targets.
+
+    Returns:
+        tuple: A tuple containing the cars to fill [(car type, number), ...], the utility from the cars and the extra attractiveness.
     """
-    Update the configuration after allocating cars to fill a facility.
+    return fill_location_targets(config, loc, [obj_e_this_round], U_T, fill_cache)[0]
+
+
+def fill_locations(
+    config: dict,
+    locs: list,
+    obj_e_targets: list,
+    U_T,
+    fill_cache: engine.FillPlanCache = None,
+    fill_kernel: engine.FillKernel = None,
+):
+    """
+    Fill several locations for several targets, same as calling fill_location_targets for each location.
+    With a FillKernel, the locations missing from the cache are filled in one batch per target.
 
     Args:
-        config (dict): The current configuration.
-        cars_to_fill (list): List of tuples indicating the car types and the number to allocate.
+        config (dict): The instance configuration.
+        locs (list): Index of each location.
+        obj_e_targets (list): Maximun values for the attractiveness to reach (obj_e_this_round).
+        U_T (array-like): Remaining amount of each car type.
+        fill_cache (FillPlanCache, optional): Plans of the previous iterations.
+        fill_kernel (FillKernel, optional): Batched fill of the instance.
 
     Returns:
-        dict: Updated configuration after allocating cars.
+        list: For each location, the result of fill_location_targets.
     """
-    for car_type, allocate_num in cars_to_fill:
-        config["U_T"][car_type] -= allocate_num
-    return config
+    if fill_kernel is None:
+        return [
+            fill_location_targets(config, loc, obj_e_targets, U_T, fill_cache)
+            for loc in locs
+        ]
+    fills = [[None] * len(obj_e_targets) for _ in locs]
+    for t, obj_e_this_round in enumerate(obj_e_targets):
+        missing = []
+        for n, loc in enumerate(locs):
+            if fill_cache is not None:
+                fills[n][t] = fill_cache.get(loc, obj_e_this_round)
+            if fills[n][t] is None:
+                missing.append(n)
+        if not missing:
+            continue
+        plans = fill_kernel.plans([locs[n] for n in missing], obj_e_this_round, U_T)
+        for n, plan in zip(missing, plans):
+            fills[n][t] = plan
+            if fill_cache is not None:
+                fill_cache.put(locs[n], obj_e_this_round, plan)
+    return fills
 
 
-def calc_current_gain(
-    config: dict, facility_is_built: list, total_util_list: list, verbose: int = 0
+def greedy_best_location(
+    config: dict,
+    state: engine.SolverState,
+    obj_e_this_round: int,
+    verbose: int = 1,
+    objective_state: engine.ObjectiveState = None,
+    lazy_queue: engine.LazyCandidateQueue = None,
+    parallel_scorer: engine.ParallelCandidateScorer = None,
+    fill_cache: engine.FillPlanCache = None,
+    fill_kernel: engine.FillKernel = None,
+    profiler: util.PhaseProfiler = None,
 ):
     """
-    Calculate the current gain based on the configuration, built facilities, and total utility list.
+    Finds the best location to allocate resources based on maximizing utility until a point can no longer accommodate more resources.
 
     Args:
-        config (dict): The current configuration.
-        facility_is_built (list): List indicating whether a facility is built.
-        total_util_list (list): List representing total utility.
+        config (dict): The instance configuration, never modified.
+        state (SolverState): The current solution, never modified.
+        obj_e_this_round: maximun value for the attractiveness to reach. 平常是E_MAX_INPUT, 偶爾被影響變小在最後一輪
+        verbose (bool, optional): Whether to print messages or not. Defaults to True.
+        objective_state (ObjectiveState, optional): Running objective terms of the current solution. Built from the state if not given.
+        lazy_queue (LazyCandidateQueue, optional): Queue of this obj_e_this_round for lazy evaluation. Every location is re-scored if not given.
+        parallel_scorer (ParallelCandidateScorer, optional): Worker pool to score the locations on, when not using lazy evaluation.
+        fill_cache (FillPlanCache, optional): Fill plans kept across iterations. Every location is filled again if not given.
+        fill_kernel (FillKernel, optional): Fill the locations in one batch instead of one by one.
+        profiler (PhaseProfiler, optional): Records the time of the fill / cost / gain phases and the candidates evaluated.
+            When tracing, the call is a span and a sample of the candidate evaluations are spans too.
 
     Returns:
-        float: Total gain.
+        tuple: A tuple containing the best objective value, the best location index (-1 if none) and its fill
+        (see fill_location, None if no location is found).
     """
-    total_gain = 0
-    for customer_pt_i in range(config["i_amount"]):
-        total_attr_i, our_vs_all_percentage = calc_total_attr_i(
-            config, customer_pt_i, facility_is_built, total_util_list
+    profiler = profiler or util.NULL_PROFILER
+    span_start = time.perf_counter()
+    best_obj, best_loc = -1, -1
+    if objective_state is None:
+        objective_state = engine.ObjectiveState.from_state(
+            engine.CandidateEvaluator(config, G_function_array, E_function_array),
+            state,
         )
-        customer_gain = (
-            config["H"][customer_pt_i]
-            * G_function(total_attr_i)
-            * our_vs_all_percentage
-        )
-        total_gain += customer_gain
-        if verbose == 2:
-            print(
-                f"Customer {customer_pt_i} | total_attr={total_attr_i:.4f} | G={G_function(total_attr_i):.4f}, Our percentage={our_vs_all_percentage:.4f}, Earned money={customer_gain:.4f}"
+
+    if lazy_queue is not None:
+        # Only re-score the top of the queue until it stays on top
+        def plan_location(ind):
+            with profiler.sampled_span("candidate", loc=ind + 1):
+                with profiler.phase("fill", span=False):
+                    cur_to_fill, cur_util, extra_attr = fill_location(
+                        config, ind, obj_e_this_round, state.U_T, fill_cache
+                    )
+                with profiler.phase("cost", span=False):
+                    location_cost = objective_state.evaluator.location_cost(
+                        ind, extra_attr, cur_to_fill
+                    )
+            return cur_to_fill, cur_util + extra_attr, location_cost
+
+        evaluations_before = lazy_queue.evaluations
+        with profiler.phase("lazy_queue"):
+            ind, cur_obj = lazy_queue.best(
+                objective_state, state.y, state.U_T, plan_location
+            )
+        profiler.count("candidates_evaluated", lazy_queue.evaluations - evaluations_before)
+        if ind != -1 and cur_obj > best_obj:
+            best_obj, best_loc = cur_obj, ind
+    elif parallel_scorer is not None:
+        # Fill and score the locations on the worker pool
+        with profiler.phase("parallel_scoring"):
+            ind, cur_obj = parallel_scorer.best(
+                objective_state, state.y, state.U_T, obj_e_this_round
+            )
+        profiler.count("candidates_evaluated", int((state.y == 0).sum()))
+        if ind != -1 and cur_obj > best_obj:
+            best_obj, best_loc = cur_obj, ind
+    else:
+        # Fill every location that hasn't been built yet, then score all of them in one batch
+        fill_plans = []  # (location, cars to fill, util from cars, extra attractiveness)
+        # If the facility hasn't been built yet, start filling with the largest utility (V)
+        unbuilt = state.unbuilt()
+        with profiler.phase("fill"):
+            fills = fill_locations(
+                config, unbuilt, [obj_e_this_round], state.U_T, fill_cache, fill_kernel
             )
-    if verbose == 2:
-        print(f"Total earned money: {total_gain:.4f}")
-    return total_gain
+        log_candidates = verbose and logger.isEnabledFor(logging.DEBUG)
+        for ind, ((cur_to_fill, cur_util, extra_attr),) in zip(unbuilt, fills):
+            if log_candidates:
+                logger.debug("地點%d的cur_util:%s, 蓋廁所數量：%s", ind + 1, cur_util, extra_attr)
+                tmp_compensate_attractiveness = state.A_EX.tolist()
+                tmp_compensate_attractiveness[ind] = extra_attr
+                logger.debug("廁所: %s", tmp_compensate_attractiveness)
+            fill_plans.append((ind, cur_to_fill, cur_util, extra_attr))
+
+        if fill_plans:
+            # Calculate the objective value of every candidate
+            loc_idx = [plan[0] for plan in fill_plans]
+            with profiler.phase("cost"):
+                location_costs = candidate_costs(
+                    objective_state,
+                    [(ind, cur_to_fill, extra_attr) for ind, cur_to_fill, _, extra_attr in fill_plans],
+                    profiler,
+                )
+            with profiler.phase("gain"):
+                objs = objective_state.score_candidates(
+                    loc_idx,
+                    [cur_util + extra_attr for _, _, cur_util, extra_attr in fill_plans],
+                    location_costs,
+                )
+            profiler.count("candidates_evaluated", len(loc_idx))
+            if log_candidates:
+                for ind, cur_obj in zip(loc_idx, objs):
+                    logger.debug("地點 %d的 cur_obj: %.4f\n", ind + 1, cur_obj)
+            best_plan = int(np.argmax(objs))  # first location with the highest objective
+            if objs[best_plan] > best_obj:
+                best_obj, best_loc = float(objs[best_plan]), loc_idx[best_plan]
+
+    if verbose:
+        logger.debug("Iteration ended! Found the best location: %d", best_loc + 1)
+        logger.debug("Best obj: %s", best_obj)
+
+    best_fill = None
+    if best_loc != -1:
+        with profiler.phase("fill"):
+            best_fill = fill_location(
+                config, best_loc, obj_e_this_round, state.U_T, fill_cache
+            )
+    profiler.record_span(
+        "greedy_best_location",
+        span_start,
+        E=obj_e_this_round,
+        best_loc=best_loc + 1,
+        best_obj=best_obj,
+    )
+    return best_obj, best_loc, best_fill
 
 
-def calc_total_attr_i(
-    config: dict, customer_pt_i: int, facility_is_built: list, total_util_list: list
+def candidate_costs(
+    objective_state: engine.ObjectiveState,
+    plans: list,
+    profiler: util.PhaseProfiler = None,
 ):
     """
-    Calculate the total attractiveness for a given customer point i and our facility vs all facilities ratio.
+    Cost of building each candidate with its fill.
 
     Args:
-        config (dict): The current configuration.
-        customer_pt_i (int): Index of the customer point.
-        facility_is_built (list): List indicating whether a facility is built.
-        total_util_list (list): List representing total utility.
+        objective_state (ObjectiveState): Running objective terms of the current solution.
+        plans (list): (location, cars to fill, extra attractiveness) of each candidate.
+        profiler (PhaseProfiler, optional): When tracing, a sample of the candidates are recorded as spans.
 
     Returns:
-        tuple: A tuple containing the total attractiveness for the customer point i and our facility vs all facilities ratio.
+        list: The cost of each candidate.
     """
-    total_attr_i = 0
+    evaluator = objective_state.evaluator
+    if profiler is None or not profiler.tracing:
+        return [
+            evaluator.location_cost(ind, extra_attr, cur_to_fill)
+            for ind, cur_to_fill, extra_attr in plans
+        ]
+    sampled = set(profiler.tracer.sampled_positions(len(plans)))
+    costs = []
+    for n, (ind, cur_to_fill, extra_attr) in enumerate(plans):
+        if n in sampled:
+            with profiler.span("candidate", loc=ind + 1):
+                costs.append(evaluator.location_cost(ind, extra_attr, cur_to_fill))
+        else:
+            costs.append(evaluator.location_cost(ind, extra_attr, cur_to_fill))
+    return costs
 
-    # Calculate attractiveness contributed by our facilities
-    for j_idx, facility in enumerate(facility_is_built):
-        if facility == 1:
-            total_attr_i += E_function(total_util_list[j_idx]) / (
-                config["D"][customer_pt_i][j_idx] ** 2
-            )
 
-    only_our_facilities_total_attr = total_attr_i  # Temporary total attractiveness contributed only by our facilities
+def build_location(
+    state: engine.SolverState,
+    objective_state: engine.ObjectiveState,
+    loc: int,
+    fill: tuple,
+    fill_cache: engine.FillPlanCache = None,
+    profiler: util.PhaseProfiler = None,
+):
+    """
+    Build the chosen location in the current solution and its objective terms.
 
-    # Add attractiveness contributed by opponents' facilities
-    for l_idx in range(config["l_amount"]):
-        total_attr_i += config["A_opponent_bar"][l_idx] / (
-            config["D_comp"][customer_pt_i][l_idx] ** 2
+    Args:
+        state (SolverState): The current solution.
+        objective_state (ObjectiveState): Running objective terms of the current solution.
+        loc (int): Index of the chosen location.
+        fill (tuple): Cars to fill, utility from the cars and extra attractiveness of the location (see fill_location).
+        fill_cache (FillPlanCache, optional): Fill plans to drop the ones that no longer fit the remaining U_T.
+        profiler (PhaseProfiler, optional): Records the time of the state update and counts the commits.
+    """
+    profiler = profiler or util.NULL_PROFILER
+    cur_to_fill, cur_util, extra_attr = fill
+    with profiler.phase("state_update"):
+        state.commit(loc, cur_to_fill, cur_util, extra_attr)
+        objective_state.commit(
+            loc,
+            cur_util + extra_attr,
+            objective_state.evaluator.location_cost(loc, extra_attr, cur_to_fill),
         )
+        if fill_cache is not None:
+            fill_cache.invalidate(state.U_T, cur_to_fill)
+    profiler.count("state_commits")
 
-    our_vs_all_percentage = (
-        only_our_facilities_total_attr / total_attr_i
-    )  # Calculate the ratio of our facilities' attractiveness to all facilities'
 
-    return total_attr_i, our_vs_all_percentage
-
-
-def calc_current_cost(
+def greedy_best_location_targets(
     config: dict,
-    facility_is_built: list,
-    compensate_attractiveness: list,
-    cars_usage_record: list,
-    verbose: int = 0,
+    state: engine.SolverState,
+    percentages: list,
+    verbose: int = 1,
+    objective_state: engine.ObjectiveState = None,
+    lazy_queues: dict = None,
+    parallel_scorer: engine.ParallelCandidateScorer = None,
+    fill_cache: engine.FillPlanCache = None,
+    fill_kernel: engine.FillKernel = None,
+    profiler: util.PhaseProfiler = None,
 ):
     """
-    Calculate the current cost based on the configuration, built facilities, compensation for attractiveness, and cars usage record.
+    greedy_best_location for several percentages of E_MAX_INPUT at once. Every location is filled for all
+    percentages in one sweep and all (location, percentage) pairs are scored in one batch.
 
     Args:
-        config (dict): The current configuration.
-        facility_is_built (list): List indicating whether a facility is built.
-        compensate_attractiveness (list): List representing compensation for attractiveness.
-        cars_usage_record (list): Record of cars' usage.
+        percentages (list): Percentages of E_MAX_INPUT to try.
+        lazy_queues (dict, optional): obj_e_this_round -> LazyCandidateQueue, for lazy evaluation.
+        Others are the same as greedy_best_location.
 
     Returns:
-        float: Total current cost.
+        dict: percentage -> the result of greedy_best_location for that percentage.
     """
-    total_cost = 0
-
-    # Calculate cost for building facilities
-    build_cost = sum(x * y for x, y in zip(facility_is_built, config["F"]))
-
-    # Calculate cost for compensating attractiveness
-    attr_cost = sum(x * y for x, y in zip(compensate_attractiveness, config["C"]))
-
-    # Calculate cost for using cars
-    for car_type, allocate_num, loc_j in cars_usage_record:
-        total_cost += config["B"][loc_j][car_type] * allocate_num
-
-    total_cost += build_cost + attr_cost
-
-    # Print cost breakdown
-    if verbose == 2:
-        print(
-            f"Build cost: {build_cost} | Extra Attraction cost: {attr_cost} | Cars usage cost: {total_cost - build_cost - attr_cost} | Total cost: {total_cost}"
+    profiler = profiler or util.NULL_PROFILER
+    span_start = time.perf_counter()
+    obj_e_targets = [math.floor(E_MAX_INPUT * p / 100) for p in percentages]
+    if lazy_queues is not None or parallel_scorer is not None:
+        # Lazy evaluation and the worker pool keep their own per-target evaluation
+        results = {
+            percentage: greedy_best_location(
+                config,
+                state,
+                obj_e_this_round,
+                verbose,
+                objective_state,
+                (
+                    get_lazy_queue(lazy_queues, percentage)
+                    if lazy_queues is not None
+                    else None
+                ),
+                parallel_scorer,
+                fill_cache,
+                fill_kernel,
+                profiler,
+            )
+            for percentage, obj_e_this_round in zip(percentages, obj_e_targets)
+        }
+        profiler.record_span("greedy_best_location_targets", span_start, percentages=percentages)
+        return results
+    if objective_state is None:
+        objective_state = engine.ObjectiveState.from_state(
+            engine.CandidateEvaluator(config, G_function_array, E_function_array),
+            state,
         )
 
-    return total_cost
-
+    unbuilt = state.unbuilt()
+    with profiler.phase("fill"):
+        fills = fill_locations(
+            config, unbuilt, obj_e_targets, state.U_T, fill_cache, fill_kernel
+        )
+    if verbose and logger.isEnabledFor(logging.DEBUG):
+        for ind, location_fills in zip(unbuilt, fills):
+            for obj_e_this_round, (_, cur_util, extra_attr) in zip(
+                obj_e_targets, location_fills
+            ):
+                logger.debug(
+                    "地點%d的cur_util:%s, 蓋廁所數量：%s (E=%d)",
+                    ind + 1,
+                    cur_util,
+                    extra_attr,
+                    obj_e_this_round,
+                )
 
-def heuristic_greedy_optimizeV5(config_path, verbose=1):
+    # Score every (target, location) pair in one batch, objs[t][n] is target t at location unbuilt[n]
+    objs = np.empty((len(percentages), len(unbuilt)))
+    if unbuilt:
+        with profiler.phase("cost"):
+            location_costs = candidate_costs(
+                objective_state,
+                [
+                    (ind, location_fills[t][0], location_fills[t][2])
+                    for t in range(len(percentages))
+                    for ind, location_fills in zip(unbuilt, fills)
+                ],
+                profiler,
+            )
+        with profiler.phase("gain"):
+            objs = objective_state.score_candidates(
+                [ind for _ in percentages for ind in unbuilt],
+                [
+                    location_fills[t][1] + location_fills[t][2]
+                    for t in range(len(percentages))
+                    for location_fills in fills
+                ],
+                location_costs,
+            ).reshape(len(percentages), len(unbuilt))
+        profiler.count("candidates_evaluated", len(location_costs))
+
+    results = {}
+    for t, percentage in enumerate(percentages):
+        best = int(np.argmax(objs[t])) if unbuilt else -1
+        if best == -1 or not objs[t][best] > -1:
+            results[percentage] = (-1, -1, None)
+            continue
+        results[percentage] = (float(objs[t][best]), unbuilt[best], fills[best][t])
+        if verbose:
+            logger.debug(
+                "E=%d ended! Found the best location: %d, Best obj: %s",
+                obj_e_targets[t],
+                unbuilt[best] + 1,
+                objs[t][best],
+            )
+    profiler.record_span("greedy_best_location_targets", span_start, percentages=percentages)
+    return results
+
+
+def get_lazy_queue(lazy_queues: dict, percentage: int):
+    """Get (or create) the lazy evaluation queue of a percentage of E_MAX_INPUT."""
+    obj_e_this_round = math.floor(E_MAX_INPUT * percentage / 100)
+    if obj_e_this_round not in lazy_queues:
+        lazy_queues[obj_e_this_round] = engine.LazyCandidateQueue()
+    return lazy_queues[obj_e_this_round]
+
+
+def heuristic_greedy_optimizeV5(
+    config_path,
+    verbose=1,
+    lazy=False,
+    n_workers=1,
+    log_json=None,
+    progress_interval=1.0,
+    profile=False,
+    trace=None,
+    trace_sample_rate=0.01,
+):
     """
     Optimize the configuration based on the provided YAML file.
 
     Args:
         config_path (str): Path to the YAML file containing the configuration.
+        verbose (int, optional): 0 only warnings, 1 progress lines, 2 every candidate (see util.get_logger). Defaults to 1.
+        lazy (bool, optional): Lazy evaluation, only re-score the best locations of the previous iteration (see LazyCandidateQueue). Defaults to False.
+        n_workers (int, optional): Number of processes to score the locations on (see ParallelCandidateScorer). Defaults to 1.
+        log_json (str, optional): Also write the log records of this solve to this JSON-lines file.
+        progress_interval (float, optional): Minimum seconds between two progress lines. Defaults to 1.0.
+        profile (bool, optional): Add a "profile" section to the result with the time of each phase
+            (load, setup, fill, cost, gain, state_update, main_loop, ladder), counters (see util.PhaseProfiler)
+            and the fill plan cache statistics. Defaults to False.
+        trace (str, optional): Write the spans of the solve (phases, iterations, greedy_best_location calls and a sample
+            of the candidate evaluations) to this Chrome trace JSON file. "{instance}" is replaced by the instance name.
+        trace_sample_rate (float, optional): Fraction of the candidate evaluations recorded as spans. Defaults to 0.01.
 
     Returns:
         float: Overall best objective value.
     """
-    config = util.load_specific_yaml(config_path)
-    improve = True
-    overall_best_obj = 0
-    candidates = [0 for _ in range(config["j_amount"])]
-    compensate_attractiveness = [
-        0 for _ in range(config["j_amount"])
-    ]  # addition attr to fulfill e
-    total_util_list = [
-        0 for _ in range(config["j_amount"])
-    ]  # 紀錄每個點的總attr (車子+廁所)
-    cars_usage_record = (
-        []
-    )  # 紀錄每次分了多少車給哪個j [(1, 5, 18),(0, 4, 18),(2, 3, 18),(2, 5, 2),...] (第k種車, 幾輛, 給哪個j)
-    print(
-        f"Locations: {config['j_amount']}, Customers: {config['i_amount']}, Cars: {config['k_amount']}, Competitors: {config['l_amount']}"
-    )
-    iteration_times = 0
-    start_time = time.time()
-    while improve and any(element != 1 for element in candidates):  # 每輪多建一個點
-        print("===============================================================")
-        print("New Iteration begins")
-        improve = False
-        iter_best_config = copy.deepcopy(config)
-        round_obj, chosen_percentage = -10000, 0
-        for percentage in [100, 50]:
-          (
-              _,
-              cur_obj,
-              _,
-              _,
-              _,
-              _,
-          ) = greedy_best_location(
-              iter_best_config,
-              candidates,
-              compensate_attractiveness,
-              cars_usage_record,
-              total_util_list,
-              math.floor(E_MAX_INPUT * percentage / 100),
-              verbose,
-          )
-          if cur_obj > round_obj:  # 嘗試100或50誰能找到最大的obj, 找到percentage後再完整做一次丟出去
-            round_obj, chosen_percentage = cur_obj, percentage
-          print(f"這次測試{percentage}%, 得到最好obj:{cur_obj}")
-        # 出迴圈了, 使用剛剛得到最佳的percentage(100或50) 得到對應的各項例如cur_config, cur_cars_usage_record
-        (
-            cur_config,
-            cur_obj,
-            cur_loc_to_build,
-            cur_compensate_attractiveness,
-            cur_cars_usage_record,
-            cur_total_util_list,
-        ) = greedy_best_location(
-            iter_best_config,
-            candidates,
-            compensate_attractiveness,
-            cars_usage_record,
-            total_util_list,
-            math.floor(E_MAX_INPUT * chosen_percentage / 100),
-            0,
+    util.get_logger("heuristic_greedyV5", verbose)
+    json_handler = None
+    if log_json is not None:
+        json_handler = util.JsonLinesHandler(log_json)
+        logger.addHandler(json_handler)
+    try:
+        return _optimize(
+            config_path,
+            verbose,
+            lazy,
+            n_workers,
+            progress_interval,
+            profile,
+            trace,
+            trace_sample_rate,
         )
-        if cur_obj > overall_best_obj:
-            improve = True
-            iteration_times += 1
-            config.update(cur_config)
-            overall_best_obj = cur_obj
-            candidates[cur_loc_to_build] = 1
-            compensate_attractiveness = copy.deepcopy(cur_compensate_attractiveness)
-            cars_usage_record = copy.deepcopy(cur_cars_usage_record)
-            total_util_list = copy.deepcopy(cur_total_util_list)
-            # print("\n\nRound result:")
-            # print("List of built facilities:", candidates)
-            # print(
-            #     "Cars usage record ((car type k , number, location)):",
-            #     cars_usage_record,
-            # )
-            # print(
-            #     "Extra attract for each location (Toilets):",
-            #     compensate_attractiveness,
-            # )
-            # print("Total utility list for each location:", total_util_list)
-            # print(f"Current objective: {cur_obj}")
-        else:
-            print("No improvement in this iteration. End the loop\n\n")
-    iter_best_config = copy.deepcopy(config)
-    for percentage in [64, 32, 16, 8, 4, 2, 1]:
-        print("迴圈結束後, 嘗試不同的E%數:")
-        (
-            cur_config,
-            cur_obj,
-            cur_loc_to_build,
-            cur_compensate_attractiveness,
-            cur_cars_usage_record,
-            cur_total_util_list,
-        ) = greedy_best_location(
-            iter_best_config,
-            candidates,
-            compensate_attractiveness,
-            cars_usage_record,
-            total_util_list,
-            math.floor(E_MAX_INPUT * percentage / 100),
-            verbose=0,
+    finally:
+        if json_handler is not None:
+            logger.removeHandler(json_handler)
+            json_handler.close()
+
+
+def _optimize(
+    config_path,
+    verbose,
+    lazy,
+    n_workers,
+    progress_interval,
+    profile,
+    trace,
+    trace_sample_rate,
+):
+    tracer = util.SpanTracer(trace_sample_rate) if trace else None
+    profiler = (
+        util.PhaseProfiler(tracer) if profile or trace else util.NULL_PROFILER
+    )
+    solve_start = time.perf_counter()
+    with profiler.phase("load"):
+        config = util.load_instance(config_path)
+    with profiler.phase("setup"):
+        state = engine.SolverState.from_config(config)  # 目前的解: 蓋了哪些點, 各點的車與廁所, 剩下的車
+        objective_state = engine.ObjectiveState.from_state(
+            engine.CandidateEvaluator(
+                config,
+                profiler.counted("G", G_function_array),
+                profiler.counted("E", E_function_array),
+            ),
+            state,
+        )  # 目前解的每個客戶吸引力與總成本, 每蓋一個點就更新
+        fill_cache = engine.FillPlanCache()  # 各點的填車方案, 蓋點後只重算被影響的點
+        fill_kernel = engine.FillKernel.from_config(config)  # 各點車種的排序只算一次
+        parallel_scorer = None
+        if n_workers > 1:
+            # G / E calls in the workers are not counted
+            parallel_scorer = engine.ParallelCandidateScorer(
+                config, G_function_array, E_function_array, n_workers
+            )
+    # 出錯或中斷時也要關掉 worker pool 並釋放 shared memory
+    with parallel_scorer or contextlib.nullcontext():
+        improve = True
+        overall_best_obj = 0
+        logger.info(
+            "Locations: %d, Customers: %d, Cars: %d, Competitors: %d",
+            config["j_amount"],
+            config["i_amount"],
+            config["k_amount"],
+            config["l_amount"],
         )
-        if (
-            cur_obj > overall_best_obj
-        ):  # 在這個%數，原本100%的E_MAX_INPUT沒有找到更好的卻在這找到更好的了
-            print(
-                f"!!!{percentage}%的嘗試({math.floor(E_MAX_INPUT * percentage / 100)})找到更好的obj, 此%數找到cur_obj:{cur_obj}大於原本{overall_best_obj}!!!"
+        progress = util.ProgressLogger(logger, progress_interval)
+        iteration_times = 0
+        lazy_queues = {}  # obj_e_this_round -> LazyCandidateQueue
+        lazy_evaluations_saved = []  # 每輪lazy evaluation省下幾次計算
+        start_time = time.time()
+        main_loop_start = time.perf_counter()
+        while improve and not state.y.all():  # 每輪多建一個點
+            iteration_start = time.perf_counter()
+            logger.debug("===============================================================")
+            logger.debug("New Iteration begins")
+            improve = False
+            saved_before = sum(q.evaluations_saved for q in lazy_queues.values())
+            round_results = greedy_best_location_targets(
+                config,
+                state,
+                [100, 50],
+                verbose,
+                objective_state,
+                lazy_queues if lazy else None,
+                parallel_scorer,
+                fill_cache,
+                fill_kernel,
+                profiler,
             )
-            config.update(cur_config)
-            overall_best_obj = cur_obj
-            candidates[cur_loc_to_build] = 1
-            compensate_attractiveness = copy.deepcopy(cur_compensate_attractiveness)
-            cars_usage_record = copy.deepcopy(cur_cars_usage_record)
-            total_util_list = copy.deepcopy(cur_total_util_list)
-            break
-        else:
-            print(
-                f"{percentage}%的嘗試({math.floor(E_MAX_INPUT * percentage / 100)})並沒有找到更好的obj, 此%數找到cur_obj:{cur_obj}"
+            round_obj, chosen_percentage = -10000, 0
+            for percentage in [100, 50]:
+                cur_obj = round_results[percentage][0]
+                if cur_obj > round_obj:  # 嘗試100或50誰能找到最大的obj
+                    round_obj, chosen_percentage = cur_obj, percentage
+                logger.debug("這次測試%d%%, 得到最好obj:%s", percentage, cur_obj)
+            # 使用剛剛得到最佳的percentage(100或50) 對應的點與填車方案
+            cur_obj, cur_loc_to_build, cur_fill = round_results[chosen_percentage]
+            if lazy:
+                lazy_evaluations_saved.append(
+                    sum(q.evaluations_saved for q in lazy_queues.values()) - saved_before
+                )
+            if cur_obj > overall_best_obj:
+                improve = True
+                iteration_times += 1
+                overall_best_obj = cur_obj
+                build_location(
+                    state, objective_state, cur_loc_to_build, cur_fill, fill_cache, profiler
+                )
+                progress.update(
+                    iteration=iteration_times,
+                    best_loc=cur_loc_to_build + 1,
+                    best_obj=overall_best_obj,
+                )
+                # print("\n\nRound result:")
+                # print("List of built facilities:", state.y.astype(int).tolist())
+                # print("Cars at each location (x_jk):", state.x_jk.tolist())
+                # print("Extra attract for each location (Toilets):", state.A_EX.tolist())
+                # print("Total utility list for each location:", state.total_util.tolist())
+                # print(f"Current objective: {cur_obj}")
+            else:
+                logger.info("No improvement in this iteration. End the loop\n\n")
+            profiler.record_span(
+                "iteration",
+                iteration_start,
+                iteration=iteration_times,
+                improved=improve,
+                best_obj=overall_best_obj,
             )
+        progress.finish()
+        profiler.add_time("main_loop", time.perf_counter() - main_loop_start, main_loop_start)
+        with profiler.phase("ladder"):
+            ladder_results = greedy_best_location_targets(
+                config,
+                state,
+                [64, 32, 16, 8, 4, 2, 1],
+                verbose=0,
+                objective_state=objective_state,
+                lazy_queues=lazy_queues if lazy else None,
+                parallel_scorer=parallel_scorer,
+                fill_cache=fill_cache,
+                fill_kernel=fill_kernel,
+                profiler=profiler,
+            )
+        for percentage in [64, 32, 16, 8, 4, 2, 1]:
+            logger.debug("迴圈結束後, 嘗試不同的E%%數:")
+            cur_obj, cur_loc_to_build, cur_fill = ladder_results[percentage]
+            if (
+                cur_obj > overall_best_obj
+            ):  # 在這個%數，原本100%的E_MAX_INPUT沒有找到更好的卻在這找到更好的了
+                logger.info(
+                    "!!!%d%%的嘗試(%d)找到更好的obj, 此%%數找到cur_obj:%s大於原本%s!!!",
+                    percentage,
+                    math.floor(E_MAX_INPUT * percentage / 100),
+                    cur_obj,
+                    overall_best_obj,
+                )
+                overall_best_obj = cur_obj
+                build_location(
+                    state, objective_state, cur_loc_to_build, cur_fill, fill_cache, profiler
+                )
+                break
+            else:
+                logger.debug(
+                    "%d%%的嘗試(%d)並沒有找到更好的obj, 此%%數找到cur_obj:%s",
+                    percentage,
+                    math.floor(E_MAX_INPUT * percentage / 100),
+                    cur_obj,
+                )
     # print(f"Final result: Overall best objective value: {overall_best_obj}")
-    # print("效用總表對於每個點：", total_util_list)
+    # print("效用總表對於每個點：", state.total_util.tolist())
     # End recording time
     end_time = time.time()
     execution_time = end_time - start_time
 
-    x_jk = [[0] * config["k_amount"] for _ in range(config["j_amount"])]
-    for k, value, j in cars_usage_record:
-        x_jk[j][k] = value
-
     result_formal = {
         "Method": "original problem",
-        # "cars_usage_record": cars_usage_record,
-        # "total_util_list": total_util_list,
         "OBJ_value": overall_best_obj,
-        "best_Y": candidates,
-        "best_X": x_jk,
-        "best_A_EX": compensate_attractiveness,
+        "best_Y": state.y.astype(int).tolist(),
+        "best_X": state.x_jk.tolist(),
+        "best_A_EX": state.A_EX.tolist(),
         "spend_time(s)": execution_time,
         "iteration_times": iteration_times,
     }
+    if lazy:
+        result_formal["lazy_evaluations_saved"] = lazy_evaluations_saved
+    if profile:
+        result_formal["profile"] = profiler.report()
+        result_formal["profile"]["fill_cache"] = fill_cache.stats()
+    if trace:
+        profiler.record_span("solve", solve_start, instance=config_path)
+        instance = os.path.basename(config_path).split(".")[0]
+        tracer.export(trace.format(instance=instance))
     return result_formal
 
 
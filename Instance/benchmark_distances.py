@@ -0,0 +1,80 @@
+"""This file benchmarks the distance matrix generation against the former per-pair implementation
+Sizes (I customers x J locations + L competitors) follow the S / M / L / XL benchmark instances
+--large I J: also time the chunked variant writing an I x J matrix into a memory-mapped .npy file"""
+import os
+import sys
+import math
+import time
+import tempfile
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+import utility as util
+
+# (I, J, L) of the instance_new benchmark sets
+SIZES = {"S": (3, 25, 4), "M": (6, 225, 9), "L": (9, 625, 16), "XL": (12, 1225, 25)}
+MAP_SIZE = 100
+REPEAT = 5
+
+
+def dist_list_generator_loop(customers, locations):
+    # 向量化之前的 dist_list_generator，作為比較基準
+    distances = np.zeros((len(customers), len(locations)))
+    for i, customer in enumerate(customers):
+        for j, location in enumerate(locations):
+            distances[i][j] = util.cal_distance(customer, location)
+    return distances
+
+
+def best_time(func, *args, **kwargs):
+    best = math.inf
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_sizes():
+    print(f"{'size':>4} {'I x (J+L)':>12} {'loop (ms)':>10} {'vector (ms)':>12} {'speedup':>8}  equal")
+    for size, (I, J, L) in SIZES.items():
+        customers = util.create_points(I, MAP_SIZE)
+        locations = util.create_points(J + L, MAP_SIZE)
+        loop_time, expected = best_time(dist_list_generator_loop, customers, locations)
+        vector_time, result = best_time(util.dist_list_generator, customers, locations)
+        print(
+            f"{size:>4} {f'{I} x {J + L}':>12} {loop_time * 1e3:>10.3f} {vector_time * 1e3:>12.3f}"
+            f" {loop_time / vector_time:>7.1f}x  {np.array_equal(expected, result)}"
+        )
+
+
+def benchmark_large(I, J, chunk_rows=1024):
+    customers = np.random.randint(MAP_SIZE, size=(I, 2))
+    locations = np.random.randint(MAP_SIZE, size=(J, 2))
+    sample = slice(0, min(I, 50))
+    expected = dist_list_generator_loop(customers[sample].tolist(), locations.tolist())
+
+    start = time.perf_counter()
+    in_memory = util.dist_list_generator_chunked(customers, locations, chunk_rows=chunk_rows)
+    print(f"chunked {I} x {J} in memory: {time.perf_counter() - start:.3f} s, "
+          f"equal on first rows: {np.array_equal(expected, in_memory[sample])}")
+    del in_memory
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "D.npy")
+        start = time.perf_counter()
+        mapped = util.dist_list_generator_chunked(customers, locations, out=path, chunk_rows=chunk_rows)
+        print(f"chunked {I} x {J} to memmap ({mapped.nbytes / 1024**2:.0f} MB): "
+              f"{time.perf_counter() - start:.3f} s, "
+              f"equal on first rows: {np.array_equal(expected, mapped[sample])}")
+        del mapped
+
+
+if __name__ == "__main__":
+    np.random.seed(0)
+    benchmark_sizes()
+    if "--large" in sys.argv:
+        position = sys.argv.index("--large")
+        benchmark_large(int(sys.argv[position + 1]), int(sys.argv[position + 2]))
@@ -0,0 +1,331 @@
+"""This file benchmarks the greedy versions across the instance sets and keeps a history keyed by git commit
+Every run samples the same instances (--sample N --seed S), solves each of them --repeats times after a warm-up run,
+and appends one JSON line per (commit, algorithm, instance) to the history file
+
+python benchmark_suite.py run --algorithms V3 V5 --sets instance instance_new --sizes S M L XL --sample 5 --repeats 3
+python benchmark_suite.py compare [BASE [HEAD]] --threshold 0.1: flag the time / objective regressions of HEAD
+against BASE (commit prefixes, the two latest commits of the history by default), exits with 1 if there are any
+python benchmark_suite.py commits: list the commits in the history"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..", "Algorithms")))
+from config import BASE_DIR, INSTANCES_DIR
+
+# 版本 -> (module, function), function(config_path, verbose) -> result dict
+ALGORITHMS = {
+    "V1": ("heuristic_greedyV1", "heuristic_greedy_optimize"),
+    "V2": ("heuristic_greedyV2", "heuristic_greedy_optimizeV2"),
+    "V3": ("heuristic_greedyV3", "heuristic_greedy_optimizeV3"),
+    "V4": ("heuristic_greedyV4", "heuristic_greedy_optimizeV4"),
+    "V5": ("heuristic_greedyV5", "heuristic_greedy_optimizeV5"),
+}
+INSTANCE_SETS = {
+    "instance": os.path.join("Benchmark-Test", "instance"),
+    "instance_new": os.path.join("Benchmark-Test", "instance_new"),
+}
+# gurobi_{size}.xlsx 是 instance/ 這組的 Gurobi 結果 (第 i 列 = instance i)
+GUROBI_RESULTS = {"instance": os.path.join("Benchmark-Test", "result")}
+HISTORY_FILE = os.path.join("Benchmark-Test", "result", "benchmark_history.jsonl")
+
+
+def git_commit():
+    """(commit hash, dirty) of the working tree, dirty if tracked files have uncommitted changes."""
+    commit = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    status = subprocess.run(
+        ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR, capture_output=True, text=True
+    ).stdout
+    return commit, bool(status.strip())
+
+
+def load_algorithm(version):
+    module_name, function_name = ALGORITHMS[version]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def sample_instances(instance_set, size, sample, seed=0):
+    """
+    The same sample of instance indices of a size on every run, so that two commits time the same instances.
+
+    Returns:
+    - indices (list of int): Sorted indices, all of them if sample is None or larger than the size class.
+    """
+    size_dir = os.path.join(INSTANCES_DIR, INSTANCE_SETS[instance_set], size)
+    if not os.path.isdir(size_dir):
+        return []
+    prefix, suffix = f"instance_{size}_", ".yaml"
+    indices = sorted(
+        int(name[len(prefix) : -len(suffix)])
+        for name in os.listdir(size_dir)
+        if name.startswith(prefix) and name.endswith(suffix)
+    )
+    if sample is None or sample >= len(indices):
+        return indices
+    return sorted(random.Random(f"{seed}-{instance_set}-{size}").sample(indices, sample))
+
+
+def load_gurobi_objectives(instance_set, size):
+    """{instance index: Gurobi OBJ_value} of gurobi_{size}.xlsx, empty when there is no Gurobi result for the size."""
+    if instance_set not in GUROBI_RESULTS:
+        return {}
+    file_path = os.path.join(INSTANCES_DIR, GUROBI_RESULTS[instance_set], f"gurobi_{size}.xlsx")
+    if not os.path.exists(file_path):
+        return {}
+    import pandas as pd  # 只有讀 xlsx 時需要 (與 visualize_compare.py 相同, 需要 openpyxl)
+
+    df = pd.read_excel(file_path, index_col=0)
+    return {int(i): float(value) for i, value in df["OBJ_value"].items() if not math.isnan(value)}
+
+
+def time_instance(algorithm, config_path, repeats, warmup=True):
+    """
+    Solve one instance repeats times with the output silenced.
+
+    Returns:
+    - times (list of float): Wall time of each repeat in seconds.
+    - objective (float): OBJ_value of the last repeat.
+    - consistent (bool): Whether every repeat found the same objective.
+    """
+    objectives, times = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        if warmup:
+            algorithm(config_path, 0)  # import / 快取 / 第一次配置記憶體不算在內
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = algorithm(config_path, 0)
+            times.append(time.perf_counter() - start)
+            objectives.append(result["OBJ_value"])
+    consistent = all(math.isclose(value, objectives[0], rel_tol=1e-9) for value in objectives)
+    return times, objectives[-1], consistent
+
+
+def run_benchmark(versions, instance_sets, sizes, sample=5, repeats=3, seed=0, history_file=HISTORY_FILE, warmup=True):
+    """
+    Time the algorithm versions on the sampled instances and append the records to the history file.
+
+    Args:
+    - versions (list of str): Keys of ALGORITHMS, e.g. ["V3", "V5"].
+    - instance_sets (list of str): Keys of INSTANCE_SETS.
+    - sizes (list of str): Size classes, the ones a set does not have are skipped.
+    - sample (int, optional): Instances per size class, None for all of them.
+    - repeats (int, optional): Timed solves per instance, the median is compared.
+    - seed (int, optional): Seed of the instance sample.
+    - history_file (str, optional): JSON lines history, relative to the instances folder.
+    - warmup (bool, optional): Solve each instance once before timing it.
+
+    Returns:
+    - records (list of dict): The appended records.
+    """
+    commit, dirty = git_commit()
+    history_file = os.path.join(INSTANCES_DIR, history_file)
+    os.makedirs(os.path.dirname(history_file), exist_ok=True)
+    print(f"Benchmark of {' '.join(versions)} at {commit[:10]}{' (dirty)' if dirty else ''}")
+    records = []
+    for version in versions:
+        algorithm = load_algorithm(version)
+        for instance_set in instance_sets:
+            for size in sizes:
+                indices = sample_instances(instance_set, size, sample, seed)
+                if not indices:
+                    continue
+                try:
+                    gurobi = load_gurobi_objectives(instance_set, size)
+                except ImportError as error:
+                    print(f"No Gurobi ratio for {instance_set}/{size}: {error}")
+                    gurobi = {}
+                size_times = []
+                for i in indices:
+                    config_path = os.path.join(INSTANCE_SETS[instance_set], size, f"instance_{size}_{i}.yaml")
+                    times, objective, consistent = time_instance(algorithm, config_path, repeats, warmup)
+                    median = statistics.median(times)
+                    record = {
+                        "commit": commit,
+                        "dirty": dirty,
+                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "algorithm": version,
+                        "instance_set": instance_set,
+                        "size": size,
+                        "index": i,
+                        "times(s)": times,
+                        "median_time(s)": median,
+                        "spread": (max(times) - min(times)) / median if median > 0 else 0.0,
+                        "OBJ_value": objective,
+                        "consistent": consistent,
+                        "gurobi_OBJ_value": gurobi.get(i),
+                        "gurobi_ratio": objective / gurobi[i] if gurobi.get(i) else None,
+                    }
+                    records.append(record)
+                    size_times.append(median)
+                    with open(history_file, "a") as file:
+                        file.write(json.dumps(record) + "\n")
+                print(
+                    f"{version} {instance_set}/{size}: {len(indices)} instances, "
+                    f"median {statistics.median(size_times):.4f}s, total {sum(size_times):.3f}s"
+                )
+    print(f"Appended {len(records)} records to {history_file}")
+    return records
+
+
+def load_history(history_file=HISTORY_FILE):
+    history_file = os.path.join(INSTANCES_DIR, history_file)
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def history_commits(records):
+    """The commits of the history, oldest first (by their first record)."""
+    return list(dict.fromkeys(record["commit"] for record in records))
+
+
+def resolve_commit(records, ref):
+    """The commit of the history starting with ref, "HEAD" is the current commit."""
+    if ref == "HEAD":
+        ref = git_commit()[0]
+    matches = [commit for commit in history_commits(records) if commit.startswith(ref)]
+    if len(matches) != 1:
+        raise ValueError(f"{ref} matches {len(matches)} commits of the history")
+    return matches[0]
+
+
+def _latest_by_instance(records, commit):
+    # 同一個 commit 跑過多次時, 取每個 instance 最後一次的紀錄
+    latest = {}
+    for record in records:
+        if record["commit"] == commit:
+            latest[(record["algorithm"], record["instance_set"], record["size"], record["index"])] = record
+    return latest
+
+
+def compare_commits(records, base, head, threshold=0.1, objective_tolerance=1e-6):
+    """
+    Compare the instances both commits ran, per (algorithm, instance set, size).
+
+    A group regresses when the geometric mean of its per-instance median time ratios (head / base) exceeds
+    1 + threshold, or when an instance's objective drops by more than objective_tolerance (relative).
+
+    Returns:
+    - rows (list of dict): One row per group with time_ratio, objective_change, gurobi ratios and regressions.
+    """
+    base_records, head_records = _latest_by_instance(records, base), _latest_by_instance(records, head)
+    groups = defaultdict(list)
+    for key in sorted(base_records.keys() & head_records.keys()):
+        groups[key[:3]].append((base_records[key], head_records[key]))
+
+    rows = []
+    for (version, instance_set, size), pairs in groups.items():
+        log_ratios = [
+            math.log(max(new["median_time(s)"], 1e-9) / max(old["median_time(s)"], 1e-9)) for old, new in pairs
+        ]
+        objective_changes = [
+            (new["OBJ_value"] - old["OBJ_value"]) / max(abs(old["OBJ_value"]), 1e-12) for old, new in pairs
+        ]
+        time_ratio = math.exp(sum(log_ratios) / len(log_ratios))
+        regressions = []
+        if time_ratio > 1 + threshold:
+            regressions.append(f"time x{time_ratio:.2f}")
+        dropped = [old["index"] for (old, _), change in zip(pairs, objective_changes) if change < -objective_tolerance]
+        if dropped:
+            regressions.append(f"objective down on instances {dropped}")
+        gurobi_ratios = [
+            [record["gurobi_ratio"] for record in side if record["gurobi_ratio"] is not None] for side in zip(*pairs)
+        ]
+        rows.append(
+            {
+                "algorithm": version,
+                "instance_set": instance_set,
+                "size": size,
+                "instances": len(pairs),
+                "base_time(s)": sum(old["median_time(s)"] for old, _ in pairs),
+                "head_time(s)": sum(new["median_time(s)"] for _, new in pairs),
+                "time_ratio": time_ratio,
+                "objective_change": statistics.mean(objective_changes),
+                "base_gurobi_ratio": statistics.mean(gurobi_ratios[0]) if gurobi_ratios[0] else None,
+                "head_gurobi_ratio": statistics.mean(gurobi_ratios[1]) if gurobi_ratios[1] else None,
+                "regressions": regressions,
+            }
+        )
+    return rows
+
+
+def print_comparison(rows, base, head, threshold):
+    print(f"Comparison {base[:10]} -> {head[:10]} (time threshold +{threshold:.0%})")
+    print(
+        f"{'algo':>4} {'set':>12} {'size':>4} {'n':>3} {'base (s)':>10} {'head (s)':>10} {'ratio':>7} "
+        f"{'obj change':>11} {'gurobi %':>15}  regressions"
+    )
+    for row in rows:
+        gurobi = "-"
+        if row["head_gurobi_ratio"] is not None:
+            gurobi = f"{100 * (row['base_gurobi_ratio'] or 0):.1f} -> {100 * row['head_gurobi_ratio']:.1f}"
+        print(
+            f"{row['algorithm']:>4} {row['instance_set']:>12} {row['size']:>4} {row['instances']:>3} "
+            f"{row['base_time(s)']:>10.4f} {row['head_time(s)']:>10.4f} {row['time_ratio']:>7.3f} "
+            f"{100 * row['objective_change']:>10.4f}% {gurobi:>15}  {'; '.join(row['regressions']) or 'ok'}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite of the greedy versions")
+    parser.add_argument("--history", default=HISTORY_FILE, help="history file, relative to the instances folder")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time the versions and append to the history")
+    run_parser.add_argument("--algorithms", nargs="+", default=["V5"], choices=sorted(ALGORITHMS))
+    run_parser.add_argument("--sets", nargs="+", default=sorted(INSTANCE_SETS), choices=sorted(INSTANCE_SETS))
+    run_parser.add_argument("--sizes", nargs="+", default=["S", "M", "L", "XL"])
+    run_parser.add_argument("--sample", type=int, default=5, help="instances per size class, 0 for all")
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--no-warmup", action="store_true")
+
+    compare_parser = commands.add_parser("compare", help="flag the regressions between two commits")
+    compare_parser.add_argument("base", nargs="?", help="commit prefix, the second latest of the history by default")
+    compare_parser.add_argument("head", nargs="?", help="commit prefix or HEAD, the latest of the history by default")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+
+    commands.add_parser("commits", help="list the commits in the history")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_benchmark(
+            args.algorithms,
+            args.sets,
+            args.sizes,
+            args.sample or None,
+            args.repeats,
+            args.seed,
+            args.history,
+            not args.no_warmup,
+        )
+    else:
+        records = load_history(args.history)
+        commits = history_commits(records)
+        if args.command == "commits":
+            for commit in commits:
+                runs = [record for record in records if record["commit"] == commit]
+                print(f"{commit[:10]} {runs[0]['timestamp']} {len(runs)} records")
+            sys.exit(0)
+        if len(commits) < 2 and not (args.base and args.head):
+            parser.error("the history needs two commits to compare")
+        base = resolve_commit(records, args.base) if args.base else commits[-2]
+        head = resolve_commit(records, args.head) if args.head else commits[-1]
+        rows = compare_commits(records, base, head, args.threshold)
+        print_comparison(rows, base, head, args.threshold)
+        sys.exit(1 if any(row["regressions"] for row in rows) else 0)
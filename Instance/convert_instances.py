@@ -0,0 +1,20 @@
+"""This file converts the benchmark instances (YAML) to the binary instance format (.npz) next to them
+--coordinates: write coordinate-based instances (.coord.npz) without the D / D_comp matrices"""
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+import utility as util
+
+if __name__ == "__main__":
+    overwrite = "--overwrite" in sys.argv
+    coordinates = "--coordinates" in sys.argv
+    for instance_path in [
+        os.path.join("Benchmark-Test", "instance"),
+        os.path.join("Benchmark-Test", "instance_new"),
+    ]:
+        converted = util.convert_instances_to_npz(
+            instance_path, overwrite, coordinates
+        )
+        print(f"Converted {converted} instances in {instance_path}")
@@ -1,13 +1,27 @@
-"""This file is used to generate instances"""
-import random
-import yaml
+"""This file is used to generate instances
+Every instance is seeded from (--seed, size, index), so a family is the same whatever the number of workers
+
+python instance.py --sizes S M L XL --count 100 --seed 0 --out Benchmark-Test/generated
+--format yaml | npz | coord: YAML, the binary format (.npz) or coordinate-based .coord.npz without D / D_comp
+--size NAME=I,J,K,L: add a custom size, J has to be a square number (the candidates form a grid)
+--metric euclidean | manhattan: distance of D and D_comp (and DIST_METHOD of a coord instance), euclidean by default
+--distribution uniform | normal: customers spread over the whole map, or normally around its center
+--workers N: number of processes, all CPUs by default"""
+import argparse
+import math
+import multiprocessing as mp
 import os
 import sys
+import time
+import zlib
 
-sys.path.append("../")
-import utility as util
 import numpy as np
 
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+import utility as util
+from config import INSTANCES_DIR
+
 """
 Instance Parameters
 ===============================
@@ -26,73 +40,234 @@ D_comp : Distance between customer i and competitor l, Dim : (i, l)
 F : Fixed cost for building facility j, Dim : (j)
 C : Cost per unit of extra attractiveness at facility j, Dim : (j)
 B : Cost of allocating a unit of resource k to facility j, Dim : (j, k)
-A_comp : The attractiveness level of competitor l, Dim: (l)
+A_opponent_bar : The attractiveness level of competitor l, Dim: (l)
+CONSUMERS / CANDIDATES / COMPETITORS : Coordinates of the customers, facilities and competitors
+NET_SIZE : Width of the map, the candidates are a grid of GRID_SPACING over it
 ===============================
 """
 
-loc_nums = [5, 25, 50]
-opponent_nums = [5, 25, 50]
-dist_formulas = ["euclidean", "manhattan"]
-cus_gen_distribution = ["uniform", "normal"]
-resource_nums = [1, 5, 10]
-resource_benefit = []
-
-ITERATION = 10
-MAP_SIZE = 100
-CUSTOMER_NUM = 5  # 客戶
-FACILITY_NUM = 5  # 設廠地點
-RESOURCE_NUM = 2  # 可分配資源
-OPPONENT_NUM = 2  # 對手
-
-for i in range(ITERATION):
-    customers = util.create_points(CUSTOMER_NUM, MAP_SIZE)
-    locations = util.create_points(FACILITY_NUM, MAP_SIZE)
-    locations_oppo = util.create_points(OPPONENT_NUM, MAP_SIZE)
-
-    U_L = [random.randint(5, 15) for _ in range(FACILITY_NUM)]
-    U_T = [random.randint(5, 15) for _ in range(RESOURCE_NUM)]
-    U_LT = [
-        [random.randint(1, 5) for _ in range(RESOURCE_NUM)] for _ in range(FACILITY_NUM)
-    ]
-    F = [random.randint(1, 10) for _ in range(FACILITY_NUM)]
-    C = [random.uniform(1, 3) for _ in range(FACILITY_NUM)]
-    H = [random.randint(200, 4000) for _ in range(CUSTOMER_NUM)]
-    D = util.dist_list_generator(customers, locations)
-    D_comp = util.dist_list_generator(customers, locations_oppo)
-    V = np.random.randint(10000, 500000, size=(FACILITY_NUM, RESOURCE_NUM)).tolist()
-    B = np.random.randint(1, 5, size=(FACILITY_NUM, RESOURCE_NUM)).tolist()
-    A_comp = [random.randint(1000, 15000) for _ in range(OPPONENT_NUM)]
+
+def size_family(level):
+    # 與 Benchmark-Test/instance_new 相同的成長方式: S = 1, M = 2, L = 3, XL = 4, ...
+    return 3 * level, (10 * level - 5) ** 2, 2 * level - 1, (level + 1) ** 2
+
+
+SIZE_FAMILIES = {
+    name: size_family(level)
+    for level, name in enumerate(["S", "M", "L", "XL", "XXL", "XXXL"], start=1)
+}
+SIZE_FAMILIES["10K"] = (30, 100**2, 19, 121)  # 10k 個候選地點
+
+GRID_SPACING = 3
+FORMAT_SUFFIX = {"yaml": ".yaml", "npz": ".npz", "coord": ".coord.npz"}
+METRICS = ("euclidean", "manhattan")
+DISTRIBUTIONS = ("uniform", "normal")
+
+
+def instance_rng(seed, size, idx):
+    """Random generator of one instance, seeded from the family seed, the size name and the index."""
+    return np.random.default_rng([seed, zlib.crc32(size.encode()), idx])
+
+
+def draw_consumers(i_amount, net_size, rng, distribution="uniform"):
+    """
+    Integer coordinates of the customers on the map, none of them on a candidate location.
+
+    Args:
+    - i_amount (int): Number of customers.
+    - net_size (int): Width of the map.
+    - rng (numpy.random.Generator): The random generator of the instance.
+    - distribution (str, optional): "uniform" over the map (default), or "normal" around its center
+      (standard deviation net_size / 6, points falling outside the map are drawn again).
+
+    Returns:
+    - consumers (2D numpy array): Dim: (i, 2)
+    """
+
+    def draw(amount):
+        if distribution == "uniform":
+            return rng.integers(0, net_size, size=(amount, 2), endpoint=True)
+        return np.rint(rng.normal(net_size / 2, net_size / 6, size=(amount, 2))).astype(int)
+
+    def rejected(points):
+        on_grid = (points % GRID_SPACING == 0).all(axis=1)
+        return on_grid | ((points < 0) | (points > net_size)).any(axis=1)
+
+    consumers = draw(i_amount)
+    redraw = rejected(consumers)
+    while redraw.any():
+        consumers[redraw] = draw(redraw.sum())
+        redraw = rejected(consumers)
+    return consumers
+
+
+def generate_instance(
+    i_amount, j_amount, k_amount, l_amount, rng, coordinates=False, metric="euclidean", distribution="uniform"
+):
+    """
+    Generate one instance with the parameter ranges of the benchmark instances.
+
+    Args:
+    - i_amount (int): Number of customers.
+    - j_amount (int): Number of candidate locations, a square number.
+    - k_amount (int): Number of resource types.
+    - l_amount (int): Number of competitors.
+    - rng (numpy.random.Generator): The random generator of the instance.
+    - coordinates (bool, optional): Leave out D and D_comp, see util.to_coordinate_instance. Defaults to False.
+    - metric (str, optional): "euclidean" (default) or "manhattan" distances, as in util.cal_distance.
+    - distribution (str, optional): "uniform" (default) or "normal" customers, see draw_consumers.
+
+    Returns:
+    - config (dict): The instance configuration, its lists as NumPy arrays.
+    """
+    side = math.isqrt(j_amount)
+    if side * side != j_amount:
+        raise ValueError(f"j_amount must be a square number, got {j_amount}")
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}, got {metric}")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}, got {distribution}")
+    net_size = GRID_SPACING * (side - 1)
+    grid = np.arange(0, net_size + 1, GRID_SPACING)
+    candidates = np.stack(np.meshgrid(grid, grid, indexing="ij"), axis=-1).reshape(-1, 2)
+
+    # 顧客不落在候選地點上
+    consumers = draw_consumers(i_amount, net_size, rng, distribution)
+
+    # 對手位在地圖中央, 不重複且不在格線上
+    margin = min(10, net_size // 3)
+    axis = np.arange(margin, net_size - margin + 1)
+    axis = axis[axis % GRID_SPACING != 0]
+    if len(axis) ** 2 < l_amount:
+        raise ValueError(f"The map of {j_amount} candidates has no room for {l_amount} competitors")
+    picks = rng.choice(len(axis) ** 2, size=l_amount, replace=False)
+    competitors = np.stack([axis[picks // len(axis)], axis[picks % len(axis)]], axis=1)
 
     config = {
-        "A_EX_bound": 100,
-        "lambda_for_G": 3e-6,
-        "i_amount": CUSTOMER_NUM,
-        "j_amount": FACILITY_NUM,
-        "k_amount": RESOURCE_NUM,
-        "l_amount": OPPONENT_NUM,
-        "U_LT": U_LT,
-        "U_T": U_T,
-        "U_L": U_L,
-        "V": V,
-        "H": H,
-        "D": D.tolist(),
-        "D_comp": D_comp.tolist(),
-        "A_comp": A_comp,
-        "F": F,
-        "C": C,
-        "B": B,
+        "A_EX_bound": int(rng.integers(30, 50, endpoint=True)),
+        "i_amount": i_amount,
+        "j_amount": j_amount,
+        "k_amount": k_amount,
+        "l_amount": l_amount,
+        "NET_SIZE": net_size,
+        "CANDIDATES": candidates,
+        "CONSUMERS": consumers,
+        "COMPETITORS": competitors,
+        "U_LT": rng.integers(5, 10, size=(j_amount, k_amount), endpoint=True),
+        "U_T": rng.integers(50, 100, size=k_amount, endpoint=True),
+        "U_L": rng.integers(1, 20, size=j_amount, endpoint=True),
+        "V": rng.integers(1, 10, size=(j_amount, k_amount), endpoint=True),
+        "H": rng.integers(100, 1000, size=i_amount, endpoint=True),
+        "A_opponent_bar": rng.integers(10, 100, size=l_amount, endpoint=True),
+        "F": rng.integers(3, 30, size=j_amount, endpoint=True),
+        "C": rng.integers(1, 3, size=j_amount, endpoint=True),
+        "B": rng.integers(3, 5, size=(j_amount, k_amount), endpoint=True),
     }
+    if coordinates:
+        return util.to_coordinate_instance(config, metric)
+    config["D"] = util.pairwise_distances(consumers, candidates, metric)
+    config["D_comp"] = util.pairwise_distances(consumers, competitors, metric)
+    return config
+
+
+def write_instance(task):
+    """Generate instance idx of a size and write it, returns its path."""
+    size, amounts, idx, seed, output_dir, file_format, metric, distribution = task
+    config = generate_instance(
+        *amounts,
+        instance_rng(seed, size, idx),
+        coordinates=file_format == "coord",
+        metric=metric,
+        distribution=distribution,
+    )
+    file_path = os.path.join(output_dir, size, f"instance_{size}_{idx}{FORMAT_SUFFIX[file_format]}")
+    if file_format == "yaml":
+        util.write_instance_yaml(config, file_path)
+    else:
+        util.save_instance_npz(config, file_path)
+    return file_path
+
+
+def generate_instances(
+    sizes,
+    count,
+    seed=0,
+    output_dir="Instances",
+    file_format="yaml",
+    workers=None,
+    start_idx=1,
+    metric="euclidean",
+    distribution="uniform",
+):
+    """
+    Generate count instances of every size, in parallel across processes.
+
+    Args:
+    - sizes (dict): {size name: (I, J, K, L)}.
+    - count (int): Number of instances per size.
+    - seed (int, optional): Seed of the whole family.
+    - output_dir (str, optional): Output folder, relative to the instances folder. Instances go to {output_dir}/{size}/.
+    - file_format (str, optional): "yaml", "npz" or "coord".
+    - workers (int, optional): Number of processes, all CPUs by default. 1 generates in this process.
+    - start_idx (int, optional): Index of the first instance of each size.
+    - metric (str, optional): "euclidean" or "manhattan" distances.
+    - distribution (str, optional): "uniform" or "normal" customers.
+
+    Returns:
+    - file_paths (list of str): Paths of the generated instances.
+    """
+    output_dir = os.path.join(INSTANCES_DIR, output_dir)
+    for size in sizes:
+        os.makedirs(os.path.join(output_dir, size), exist_ok=True)
+    # 大的先做, 讓各個 process 的工作量平均
+    tasks = [
+        (size, amounts, idx, seed, output_dir, file_format, metric, distribution)
+        for size, amounts in sorted(sizes.items(), key=lambda item: -np.prod(item[1]))
+        for idx in range(start_idx, start_idx + count)
+    ]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        return [write_instance(task) for task in tasks]
+    with mp.get_context("spawn").Pool(min(workers, len(tasks))) as pool:
+        return list(pool.imap_unordered(write_instance, tasks))
+
+
+def parse_size(text):
+    name, _, amounts = text.partition("=")
+    amounts = tuple(int(value) for value in amounts.split(","))
+    if len(amounts) != 4:
+        raise argparse.ArgumentTypeError(f"expected NAME=I,J,K,L, got {text}")
+    return name, amounts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate instance families")
+    parser.add_argument("--sizes", nargs="*", default=[], choices=sorted(SIZE_FAMILIES))
+    parser.add_argument("--size", action="append", type=parse_size, default=[], help="NAME=I,J,K,L")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=sorted(FORMAT_SUFFIX), default="yaml")
+    parser.add_argument("--metric", choices=METRICS, default="euclidean")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--out", default="Instances")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
 
-    # Write data to YAML file
-    # current_time = datetime.datetime.now()
-    # time_str = current_time.strftime("%m-%d_%H-%M")
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    dir_path = os.path.join(script_dir, "Instances")
-    if not os.path.exists(dir_path):
-        os.makedirs(dir_path)
-    file_path = os.path.join(dir_path, f"instance_F_{i+1}.yaml")
-
-    # 寫入 yaml 檔案
-    with open(file_path, "w") as yaml_file:
-        yaml.dump(config, yaml_file, default_flow_style=False)
-    print("Data saved to", file_path)
+    sizes = {size: SIZE_FAMILIES[size] for size in args.sizes}
+    sizes.update(args.size)
+    if not sizes:
+        parser.error("no sizes given, use --sizes and/or --size")
+    start = time.time()
+    file_paths = generate_instances(
+        sizes,
+        args.count,
+        args.seed,
+        args.out,
+        args.format,
+        args.workers,
+        args.start,
+        args.metric,
+        args.distribution,
+    )
+    print(f"Generated {len(file_paths)} instances in {os.path.join(INSTANCES_DIR, args.out)}: {time.time() - start:.2f}s")
@@ -0,0 +1,314 @@
+"""This file measures how the greedy versions scale with each instance dimension
+Starting from a base size (--base M = I 6, J 225, K 3, L 9), one dimension at a time is swept over --values while the
+others stay at the base, --count seeded instances per point are generated (.npz, reused on later runs) and timed
+An empirical exponent is fitted per dimension (time ~ x^a on the log-log sweep), plus a joint fit
+time ~ I^b * J^a * K^c * L^d over all the points; local exponents between neighbouring points show where a blowup starts
+
+python scaling_study.py --algorithms V3 V5 --dims J I --values J=225,625,1225,2500,5041,10000,20164 --max-time 60
+--max-time T: stop sweeping a dimension upwards once a point takes more than T seconds (median per instance)
+The measurements, the fit table and the log-log plots (matplotlib) go to --out; each base size is fitted on its own and
+the runs of several --seed at a point are combined by their median time"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(current_dir, "..")))
+import utility as util
+from config import INSTANCES_DIR
+from instance import SIZE_FAMILIES, generate_instance, instance_rng
+from benchmark_suite import ALGORITHMS, load_algorithm, time_instance
+
+DIMENSIONS = ("I", "J", "K", "L")
+# J 要是平方數 (候選地點是格子), 最大到約 20k 個候選地點
+DEFAULT_VALUES = {
+    "I": [3, 6, 12, 24, 48, 96],
+    "J": [225, 625, 1225, 2500, 5041, 10000, 20164],
+    "K": [1, 3, 5, 7, 9],
+    "L": [4, 9, 16, 25, 49],
+}
+
+
+def sweep_points(base, dims, values):
+    """[(dim, value, (I, J, K, L))] of the one-at-a-time sweep around base, in increasing value per dimension."""
+    points = []
+    for dim in dims:
+        position = DIMENSIONS.index(dim)
+        for value in sorted(values[dim]):
+            amounts = list(base)
+            amounts[position] = value
+            points.append((dim, value, tuple(amounts)))
+    return points
+
+
+def point_instances(dim, value, amounts, count, seed, output_dir):
+    """Paths (relative to the instances folder) of the count instances of a point, generated when missing."""
+    # 檔名要包含整個 (I, J, K, L) 和 seed, 換了 --base 或 --seed 就不會拿到上次的 instance
+    name = f"{dim}{value}-{'x'.join(map(str, amounts))}"
+    file_paths = []
+    for idx in range(1, count + 1):
+        file_path = os.path.join(output_dir, "instances", dim, f"instance_{name}_seed{seed}_{idx}.npz")
+        if not os.path.exists(os.path.join(INSTANCES_DIR, file_path)):
+            os.makedirs(os.path.dirname(os.path.join(INSTANCES_DIR, file_path)), exist_ok=True)
+            config = generate_instance(*amounts, instance_rng(seed, name, idx))
+            util.save_instance_npz(config, file_path)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def run_sweep(versions, base, dims, values, count=3, repeats=1, seed=0, output_dir="scaling", max_time=None):
+    """
+    Time every algorithm version on every point of the sweep.
+
+    Args:
+    - versions (list of str): Keys of benchmark_suite.ALGORITHMS.
+    - base (tuple of int): (I, J, K, L) the other dimensions stay at.
+    - dims (list of str): The swept dimensions, among "I", "J", "K", "L".
+    - values (dict): {dim: values of the sweep}.
+    - count (int, optional): Instances per point.
+    - repeats (int, optional): Timed solves per instance, the median is kept.
+    - seed (int, optional): Seed of the generated instances.
+    - output_dir (str, optional): Output folder, relative to the instances folder.
+    - max_time (float, optional): Skip the larger values of a dimension once a point takes longer (s per instance).
+
+    Returns:
+    - measurements (list of dict): One per (version, point), also appended to {output_dir}/measurements.jsonl.
+    """
+    measurements = []
+    points = sweep_points(base, dims, values)
+    measurement_file = os.path.join(INSTANCES_DIR, output_dir, "measurements.jsonl")
+    os.makedirs(os.path.dirname(measurement_file), exist_ok=True)
+    for version in versions:
+        algorithm = load_algorithm(version)
+        stopped = set()
+        for dim, value, amounts in points:
+            if dim in stopped:
+                continue
+            file_paths = point_instances(dim, value, amounts, count, seed, output_dir)
+            times = []
+            for file_path in file_paths:
+                instance_times, _, _ = time_instance(algorithm, file_path, repeats, warmup=False)
+                times.append(statistics.median(instance_times))
+            measurement = {
+                "algorithm": version,
+                "dim": dim,
+                "value": value,
+                **dict(zip(DIMENSIONS, amounts)),
+                "base": list(base),
+                "seed": seed,
+                "time(s)": statistics.median(times),
+                "times(s)": times,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            measurements.append(measurement)
+            with open(measurement_file, "a") as file:
+                file.write(json.dumps(measurement) + "\n")
+            print(f"{version} {dim}={value:<6} I={amounts[0]} J={amounts[1]} K={amounts[2]} L={amounts[3]}: "
+                  f"{measurement['time(s)']:.4f}s")
+            if max_time is not None and measurement["time(s)"] > max_time:
+                print(f"{version}: {measurement['time(s)']:.1f}s > {max_time}s, stop sweeping {dim}")
+                stopped.add(dim)
+    return measurements
+
+
+def fit_exponent(xs, ys):
+    """
+    Least-squares fit of log y = log c + a log x.
+
+    Returns:
+    - a (float): The exponent, None with less than two distinct x.
+    - r2 (float): Coefficient of determination of the log-log fit.
+    """
+    if len(set(xs)) < 2:
+        return None, None
+    log_x, log_y = np.log(xs), np.log(np.maximum(ys, 1e-9))
+    a, log_c = np.polyfit(log_x, log_y, 1)
+    residual = log_y - (a * log_x + log_c)
+    total = ((log_y - log_y.mean()) ** 2).sum()
+    return float(a), float(1 - (residual**2).sum() / total) if total > 0 else 1.0
+
+
+def local_exponents(xs, ys):
+    # 相鄰兩點的斜率: 越往右越大代表超線性的成長
+    return [
+        math.log(max(y2, 1e-9) / max(y1, 1e-9)) / math.log(x2 / x1)
+        for (x1, y1), (x2, y2) in zip(zip(xs, ys), zip(xs[1:], ys[1:]))
+    ]
+
+
+def fit_joint(measurements):
+    """
+    Joint fit of log t = log c + sum over the dimensions of exponent * log dim, over all points of a version.
+    Dimensions that never vary are left out (None).
+    """
+    varying = [dim for dim in DIMENSIONS if len({m[dim] for m in measurements}) > 1]
+    if not varying or len(measurements) <= len(varying):
+        return {dim: None for dim in DIMENSIONS}
+    design = np.column_stack([np.log([m[dim] for m in measurements]) for dim in varying] + [np.ones(len(measurements))])
+    target = np.log(np.maximum([m["time(s)"] for m in measurements], 1e-9))
+    coefficients, *_ = np.linalg.lstsq(design, target, rcond=None)
+    exponents = dict(zip(varying, coefficients[:-1].tolist()))
+    return {dim: exponents.get(dim) for dim in DIMENSIONS}
+
+
+def base_name(measurement):
+    """The (I, J, K, L) a measurement was swept around, e.g. "6x225x3x9" ("?" for records without a base)."""
+    base = measurement.get("base")
+    return "x".join(map(str, base)) if base else "?"
+
+
+def sweep_times(measurements, dim):
+    """Sorted values of dim and the median time at each value (over seeds), from the measurements sweeping dim."""
+    times = {}
+    for m in measurements:
+        if m["dim"] == dim:
+            times.setdefault(m["value"], []).append(m["time(s)"])
+    xs = sorted(times)
+    return xs, [statistics.median(times[x]) for x in xs]
+
+
+def fit_table(measurements):
+    """
+    The fitted exponents of every version, separately for each base size.
+
+    Returns:
+    - rows (list of dict): One per (version, base, dim) with exponent, r2 and local exponents.
+    - joint (dict): {(version, base): {dim: exponent}} of fit_joint.
+    """
+    # 同一點 (同一個 base, 同一個 seed) 量過多次時取最後一次, 不同 seed 的量測都保留
+    measurements = list(
+        {
+            (m["algorithm"], m["dim"], m["value"], *(m[dim] for dim in DIMENSIONS), base_name(m), m.get("seed")): m
+            for m in measurements
+        }.values()
+    )
+    rows, joint = [], {}
+    for version, base in dict.fromkeys((m["algorithm"], base_name(m)) for m in measurements):
+        group = [m for m in measurements if m["algorithm"] == version and base_name(m) == base]
+        joint[version, base] = fit_joint(group)
+        for dim in dict.fromkeys(m["dim"] for m in group):
+            xs, ys = sweep_times(group, dim)
+            exponent, r2 = fit_exponent(xs, ys)
+            rows.append(
+                {
+                    "algorithm": version,
+                    "base": base,
+                    "dim": dim,
+                    "points": len(xs),
+                    "range": f"{xs[0]}-{xs[-1]}",
+                    "exponent": exponent,
+                    "r2": r2,
+                    "local": local_exponents(xs, ys),
+                }
+            )
+    return rows, joint
+
+
+def format_table(rows, joint):
+    lines = [
+        f"{'algo':>4} {'base':>14} {'dim':>3} {'points':>6} {'range':>12} {'exponent':>9} {'R^2':>6}  local exponents"
+    ]
+    for row in rows:
+        exponent = "-" if row["exponent"] is None else f"{row['exponent']:.2f}"
+        r2 = "-" if row["r2"] is None else f"{row['r2']:.3f}"
+        local = " ".join(f"{value:.2f}" for value in row["local"])
+        lines.append(
+            f"{row['algorithm']:>4} {row['base']:>14} {row['dim']:>3} {row['points']:>6} {row['range']:>12} {exponent:>9} {r2:>6}  {local}"
+        )
+    lines.append("")
+    for (version, base), exponents in joint.items():
+        terms = " * ".join(f"{dim}^{value:.2f}" for dim, value in exponents.items() if value is not None)
+        lines.append(f"{version} (base {base}): time ~ {terms or '(not enough points)'}")
+    return "\n".join(lines)
+
+
+def plot_sweeps(measurements, rows, output_dir):
+    """Log-log plot of time against each swept dimension, one line per (version, base) with its fitted exponent."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    exponents = {(row["algorithm"], row["base"], row["dim"]): row["exponent"] for row in rows}
+    file_paths = []
+    for dim in dict.fromkeys(m["dim"] for m in measurements):
+        plt.figure(figsize=(10, 6))
+        for version, base in dict.fromkeys((m["algorithm"], base_name(m)) for m in measurements):
+            xs, ys = sweep_times(
+                [m for m in measurements if m["algorithm"] == version and base_name(m) == base], dim
+            )
+            if not xs:
+                continue
+            exponent = exponents.get((version, base, dim))
+            label = f"{version} {base}" if exponent is None else f"{version} {base} (~{dim}^{exponent:.2f})"
+            plt.plot(xs, ys, marker="o", label=label)
+        plt.xscale("log")
+        plt.yscale("log")
+        plt.xlabel(dim)
+        plt.ylabel("Spend Time (s)")
+        plt.title(f"Scaling with {dim}")
+        plt.grid(True, which="both")
+        plt.legend()
+        file_path = os.path.join(INSTANCES_DIR, output_dir, f"scaling_{dim}.png")
+        plt.savefig(file_path)
+        plt.close()
+        file_paths.append(file_path)
+    return file_paths
+
+
+def parse_values(text):
+    dim, _, values = text.partition("=")
+    if dim not in DIMENSIONS:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(DIMENSIONS)}=v1,v2,..., got {text}")
+    return dim, [int(value) for value in values.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling study of the greedy versions")
+    parser.add_argument("--algorithms", nargs="+", default=["V5"], choices=sorted(ALGORITHMS))
+    parser.add_argument("--base", default="M", choices=sorted(SIZE_FAMILIES))
+    parser.add_argument("--dims", nargs="+", default=list(DIMENSIONS), choices=DIMENSIONS)
+    parser.add_argument("--values", action="append", type=parse_values, default=[], help="DIM=v1,v2,...")
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-time", type=float, default=None)
+    parser.add_argument("--out", default=os.path.join("Benchmark-Test", "scaling"))
+    parser.add_argument("--fit-only", action="store_true", help="refit {out}/measurements.jsonl without timing")
+    args = parser.parse_args()
+
+    values = {**DEFAULT_VALUES, **dict(args.values)}
+    if args.fit_only:
+        with open(os.path.join(INSTANCES_DIR, args.out, "measurements.jsonl"), "r") as file:
+            measurements = [json.loads(line) for line in file if line.strip()]
+    else:
+        measurements = run_sweep(
+            args.algorithms,
+            SIZE_FAMILIES[args.base],
+            args.dims,
+            values,
+            args.count,
+            args.repeats,
+            args.seed,
+            args.out,
+            args.max_time,
+        )
+
+    rows, joint = fit_table(measurements)
+    table = format_table(rows, joint)
+    print(table)
+    table_file = os.path.join(INSTANCES_DIR, args.out, "scaling_fit.txt")
+    with open(table_file, "w") as file:
+        file.write(table + "\n")
+    print(f"Fit table saved to {table_file}")
+    try:
+        for file_path in plot_sweeps(measurements, rows, args.out):
+            print(f"Plot saved to {file_path}")
+    except ImportError as error:
+        print(f"No plots: {error}")
@@ -1,5 +1,10 @@
 from gurobipy import Model, GRB, quicksum
 import math
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import utility as util
 
 """
 Decision Variables
@@ -529,4 +534,50 @@ def OG_GE_RF2(config: dict):
         m.addConstr(
             A_EX[j] <= config["A_EX_bound"] * Y[j], "decoration_limit_" + str(j)
         )
-    return m
\ No newline at end of file
+    return m
+
+
+def _trace_incumbents(tracer):
+    # Gurobi callback: 每找到一個新的可行解就記錄一個 instant event
+    def callback(model, where):
+        if where == GRB.Callback.MIPSOL:
+            tracer.instant(
+                "incumbent",
+                obj=model.cbGet(GRB.Callback.MIPSOL_OBJ),
+                bound=model.cbGet(GRB.Callback.MIPSOL_OBJBND),
+                nodes=model.cbGet(GRB.Callback.MIPSOL_NODCNT),
+            )
+
+    return callback
+
+
+def solve_model(build_model, config: dict, trace: str = None):
+    """
+    Build and optimize a model, optionally tracing both steps.
+
+    Args:
+        build_model (callable): One of the model functions above, e.g. OG_GE_RF2.
+        config (dict): The instance configuration.
+        trace (str, optional): Write the model_build and model_optimize spans, and an instant event for every
+            new incumbent, to this Chrome trace JSON file (see util.SpanTracer).
+
+    Returns:
+        Model: The optimized model.
+    """
+    tracer = util.SpanTracer() if trace else None
+    if tracer is None:
+        model = build_model(config)
+        model.optimize()
+        return model
+
+    with tracer.span("model_build", model=build_model.__name__) as span:
+        model = build_model(config)
+        model.update()  # 變數與限制式在 update 時才真正加入
+        span.args.update(variables=model.NumVars, constraints=model.NumConstrs)
+    with tracer.span("model_optimize", model=build_model.__name__) as span:
+        model.optimize(_trace_incumbents(tracer))
+        span.args.update(status=model.Status, runtime=model.Runtime)
+        if model.SolCount > 0:
+            span.args.update(obj=model.ObjVal, bound=model.ObjBound, nodes=model.NodeCount)
+    tracer.export(trace)
+    return model
@@ -1,3 +1,6 @@
 import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INSTANCES_DIR = os.path.join(BASE_DIR, "Instance")
+# 解析過的 instance 快取 (見 instance_io.InstanceCache)
+INSTANCE_CACHE_DIR = os.path.join(BASE_DIR, ".instance_cache")
+INSTANCE_CACHE_MAX_BYTES = 2 * 1024**3
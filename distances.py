@@ -0,0 +1,241 @@
+"""Distances between customer points, candidate locations and competitors, computed in bulk or on use."""
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+
+def cal_distance(point_1, point_2, cal_method="euclidean"):
+    """
+    Calculate the distance between two points.
+
+    Both points may also be arrays of coordinates, Dim: (..., 2), which broadcast against each other,
+    the distances are then computed at once and returned as a numpy array with the same rounding.
+
+    Args:
+    - point_1 (tuple or array-like): The coordinates of the first point.
+    - point_2 (tuple or array-like): The coordinates of the second point.
+    - cal_method (str, optional): The method to use for distance calculation.
+      Can be "euclidean" (default) or "manhattan".
+
+    Returns:
+    - distance (float or numpy array): The calculated distance between the two points.
+    """
+
+    if np.ndim(point_1) > 1 or np.ndim(point_2) > 1:
+        point_1 = np.asarray(point_1, dtype=float)
+        point_2 = np.asarray(point_2, dtype=float)
+        dx = point_2[..., 0] - point_1[..., 0]
+        dy = point_2[..., 1] - point_1[..., 1]
+        return round_distances(_distance_from_deltas(dx, dy, cal_method), 2)
+
+    x1, y1 = point_1
+    x2, y2 = point_2
+    if cal_method == "euclidean":
+        distance = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+    elif cal_method == "manhattan":
+        distance = abs(x2 - x1) + abs(y2 - y1)
+    return round(distance, 2)
+
+
+def _distance_from_deltas(dx, dy, cal_method):
+    if cal_method == "euclidean":
+        return np.sqrt(dx**2 + dy**2)
+    if cal_method == "manhattan":
+        return np.abs(dx) + np.abs(dy)
+    raise ValueError(f"Unknown distance method: {cal_method}")
+
+
+def round_distances(values, decimals):
+    """
+    Round an array the way Python's round(value, decimals) rounds each of its floats.
+
+    np.round scales by 10**decimals before rounding, so a value whose scaled form lands on .5 may be
+    rounded to the other neighbour than round() would pick from its exact decimal value.
+    Only those few ties are rounded again with round(), everything else stays vectorized.
+
+    Args:
+    - values (array-like): The values to round.
+    - decimals (int): Number of decimals to keep.
+
+    Returns:
+    - rounded (numpy array): The rounded values, Dim: same as values
+    """
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, decimals)
+    scaled = values * 10.0**decimals
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if ties.any():
+        rounded[ties] = [round(float(value), decimals) for value in values[ties]]
+    return rounded
+
+
+def create_points(num_points, map_size):
+    """
+    Generate random points on the map.
+
+    Args:
+    - num_points (int): The number of points to generate.
+
+    Returns:
+    - points (list of tuples): List of generated points.
+    """
+    points = []
+    for _ in range(num_points):
+        x = np.random.randint(map_size)
+        y = np.random.randint(map_size)
+        points.append((x, y))
+    return points
+
+
+def dist_list_generator(customers, locations, cal_method="euclidean"):
+    """
+    Generate a 2D array of distances between customers and locations.
+
+    The distances are rounded to 2 decimals exactly as cal_distance rounds them.
+
+    Args:
+    - customers (list of tuples): List of tuples representing customer coordinates.
+    - locations (list of tuples): List of tuples representing location coordinates.
+    - cal_method (str, optional): "euclidean" (default) or "manhattan", as in cal_distance.
+
+    Returns:
+    - distances (2D numpy array): Array of distances between each customer and location.
+    """
+    return pairwise_distances(customers, locations, cal_method, decimals=2)
+
+
+def dist_list_generator_chunked(customers, locations, out=None, chunk_rows=1024, cal_method="euclidean", decimals=2):
+    """
+    Same distances as dist_list_generator, computed chunk_rows customers at a time.
+
+    Only one block of rows is held as temporaries, so the matrix can be written straight into a
+    preallocated array or a memory-mapped .npy file larger than what fits in memory.
+
+    Args:
+    - customers (array-like): Customer coordinates, Dim: (I, 2)
+    - locations (array-like): Location coordinates, Dim: (J, 2)
+    - out (numpy array or str, optional): Preallocated float array of Dim (I, J), or the path of a .npy
+      file to create as a memory map. A new array is allocated by default.
+    - chunk_rows (int, optional): Number of customers per block.
+    - cal_method (str, optional): "euclidean" (default) or "manhattan".
+    - decimals (int, optional): Round the distances to this many decimals, None to keep them unrounded.
+
+    Returns:
+    - distances (2D numpy array or numpy.memmap): The filled output, Dim: (I, J)
+    """
+    customers = np.asarray(customers, dtype=float).reshape(-1, 2)
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+    shape = (len(customers), len(locations))
+    if out is None:
+        out = np.empty(shape)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode="w+", dtype=float, shape=shape)
+    elif out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, expected {shape}")
+
+    for start in range(0, shape[0], chunk_rows):
+        stop = min(start + chunk_rows, shape[0])
+        out[start:stop] = pairwise_distances(customers[start:stop], locations, cal_method, decimals)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+def pairwise_distances(points_1, points_2, cal_method="euclidean", decimals=None):
+    """
+    Calculate the distances between every pair of points of two sets at once.
+
+    Args:
+    - points_1 (array-like): Coordinates of the first set of points, Dim: (n, 2)
+    - points_2 (array-like): Coordinates of the second set of points, Dim: (m, 2)
+    - cal_method (str, optional): "euclidean" (default) or "manhattan", as in cal_distance.
+    - decimals (int, optional): Round the distances to this many decimals, as round() does. Not rounded by default.
+
+    Returns:
+    - distances (2D numpy array): Distance between each pair of points, Dim: (n, m)
+    """
+    points_1 = np.asarray(points_1, dtype=float).reshape(-1, 2)
+    points_2 = np.asarray(points_2, dtype=float).reshape(-1, 2)
+    dx = points_2[None, :, 0] - points_1[:, None, 0]
+    dy = points_2[None, :, 1] - points_1[:, None, 1]
+    distances = _distance_from_deltas(dx, dy, cal_method)
+    if decimals is not None:
+        distances = round_distances(distances, decimals)
+    return distances
+
+
+class DistanceMatrix:
+    """
+    Distances between two sets of points, computed from their coordinates when they are used
+    instead of being stored (D and D_comp of a coordinate-based instance).
+
+    Indexing a row (D[i], D[i][j], D[i, j]) computes and keeps that row, only the most recently used
+    max_cached_rows rows are kept. columns(...) computes a block of columns and np.asarray(D) the whole matrix.
+
+    Args:
+    - points_1 (array-like): Coordinates of the row points (customers), Dim: (n, 2)
+    - points_2 (array-like): Coordinates of the column points (locations or competitors), Dim: (m, 2)
+    - cal_method (str, optional): "euclidean" (default) or "manhattan".
+    - decimals (int, optional): Round the distances to this many decimals, as round() does. Not rounded by default.
+    - max_cached_rows (int, optional): Number of rows to keep. Defaults to 256.
+    """
+
+    def __init__(
+        self, points_1, points_2, cal_method="euclidean", decimals=None, max_cached_rows=256
+    ):
+        self.points_1 = np.asarray(points_1, dtype=float).reshape(-1, 2)
+        self.points_2 = np.asarray(points_2, dtype=float).reshape(-1, 2)
+        self.cal_method = cal_method
+        self.decimals = decimals
+        self.max_cached_rows = max_cached_rows
+        self.shape = (len(self.points_1), len(self.points_2))
+        self.ndim = 2
+        self._rows = OrderedDict()
+
+    def block(self, rows=slice(None), cols=slice(None)):
+        """Distances between the given rows and columns, Dim: (rows, cols)"""
+        return pairwise_distances(
+            self.points_1[rows], self.points_2[cols], self.cal_method, self.decimals
+        )
+
+    def columns(self, cols):
+        """Distances from every row point to the given columns, Dim: (n, cols)"""
+        return self.block(slice(None), cols)
+
+    def row(self, i):
+        """Distances from row point i to every column point, Dim: (m)"""
+        if i in self._rows:
+            self._rows.move_to_end(i)
+            return self._rows[i]
+        row = self.block([i])[0]
+        row.flags.writeable = False
+        self._rows[i] = row
+        if len(self._rows) > self.max_cached_rows:
+            self._rows.popitem(last=False)
+        return row
+
+    def __getitem__(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, (int, np.integer)):
+            return self.row(int(rows))[cols]
+        if isinstance(cols, (int, np.integer)):
+            return self.block(rows, [cols])[:, 0]
+        return self.block(rows, cols)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def __array__(self, dtype=None, copy=None):
+        distances = self.block()
+        return distances if dtype is None else distances.astype(dtype)
+
+    def tolist(self):
+        return self.block().tolist()
+
+    def __deepcopy__(self, memo):
+        return self  # read-only, the algorithms deep copy the config every iteration
@@ -0,0 +1,528 @@
+"""Running an algorithm over a set of instances: scheduling, isolated persistent workers, profiles and results."""
+import cProfile
+import heapq
+import importlib
+import io
+import json
+import multiprocessing as mp
+import os
+import pstats
+import re
+import time
+import traceback
+from collections import Counter, deque
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from config import INSTANCES_DIR
+from instance_io import _TOP_LEVEL_INT, _yaml_number, save_yaml, to_builtin
+from profiling import MEMORY_MODES, PROFILE_SUFFIX, MemoryTracker, StackSampler
+
+
+INSTANCE_AMOUNTS = ("i_amount", "j_amount", "k_amount", "l_amount")
+_SPEND_TIME = re.compile(r"^spend_time\(s\):\s*(\S+)\s*$")
+
+
+def instance_dimensions(filename):
+    """
+    Read (i_amount, j_amount, k_amount, l_amount) of an instance without loading its matrices.
+
+    Args:
+    - filename (str): The instance file (.yaml or .npz), relative to the instances folder.
+
+    Returns:
+    - dimensions (tuple of int): (I, J, K, L)
+    """
+    file_path = os.path.join(INSTANCES_DIR, filename)
+    if file_path.endswith(".npz"):
+        with np.load(file_path) as arrays:
+            return tuple(int(arrays[name]) for name in INSTANCE_AMOUNTS)
+    amounts = {}
+    with open(file_path, "r") as file:
+        for line in file:
+            match = _TOP_LEVEL_INT.match(line)
+            if match and match.group(1) in INSTANCE_AMOUNTS:
+                amounts[match.group(1)] = int(match.group(2))
+    return tuple(amounts[name] for name in INSTANCE_AMOUNTS)
+
+
+def _historic_spend_time(result_file):
+    # 只掃描最上層的 spend_time(s), 不解析整個結果檔
+    try:
+        with open(os.path.join(INSTANCES_DIR, result_file), "r") as file:
+            for line in file:
+                match = _SPEND_TIME.match(line)
+                if match:
+                    value = _yaml_number(match.group(1))
+                    return float(value) if isinstance(value, (int, float)) else None
+    except OSError:
+        pass
+    return None
+
+
+def predict_task_costs(tasks, result_paths):
+    """
+    Predict the solve time of each experiment task.
+
+    A task whose instance already has a spend_time(s) in one of result_paths gets that time (the first
+    folder that has it). The others get the median time of the solved instances with the same dimensions,
+    or else a power law time = a * (I * J * K) ** b fitted on all solved instances. Without any history the
+    prediction is I * J * K itself, only good for ordering the tasks.
+
+    Args:
+    - tasks (list of tuple): (instance_type, i, config_path) as built by run_experiments.
+    - result_paths (list of str): Result folders with earlier result_{type}_{i}.yaml, relative to the instances folder.
+
+    Returns:
+    - costs (list of float): Predicted time of each task.
+    - in_seconds (bool): False if there was no history, the costs are then in units of I * J * K.
+    """
+    dimensions = []
+    for _, _, config_path in tasks:
+        try:
+            dimensions.append(instance_dimensions(config_path))
+        except (OSError, KeyError, ValueError):
+            dimensions.append((0, 0, 0, 0))  # 讀不到的 instance 會馬上失敗, 預測為 0
+    work = np.array([float(I * J * K) for I, J, K, _ in dimensions])
+    known = []
+    for instance_type, i, _ in tasks:
+        times = (
+            _historic_spend_time(os.path.join(path, instance_type, f"result_{instance_type}_{i}.yaml"))
+            for path in result_paths
+        )
+        known.append(next((time_ for time_ in times if time_ is not None), None))
+
+    solved = [index for index, time_ in enumerate(known) if time_ is not None and work[index] > 0]
+    if not solved:
+        return work.tolist(), False
+    solved_work = work[solved]
+    solved_times = np.maximum([known[index] for index in solved], 1e-6)
+    if len(np.unique(solved_work)) > 1:
+        slope, intercept = np.polyfit(np.log(solved_work), np.log(solved_times), 1)
+    else:
+        slope, intercept = 1.0, np.log(np.median(solved_times / solved_work))
+
+    costs = []
+    for index, time_ in enumerate(known):
+        if work[index] == 0:
+            time_ = 0.0
+        elif time_ is None:
+            same = [known[other] for other in solved if dimensions[other] == dimensions[index]]
+            time_ = float(np.median(same)) if same else float(np.exp(intercept) * work[index] ** slope)
+        costs.append(time_)
+    return costs, True
+
+
+def lpt_makespan(costs, n_workers):
+    """Makespan of dispatching the tasks in the given order to the first free of n_workers workers."""
+    finish = [0.0] * n_workers
+    for cost in costs:
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+
+def _solve_profiled(algorithm, config_path, verbose, algorithm_kwargs, profile_mode, profile_file):
+    if profile_mode is None:
+        return algorithm(config_path, verbose, **algorithm_kwargs)
+    if profile_mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return algorithm(config_path, verbose, **algorithm_kwargs)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+    if profile_mode == "sampling":
+        with StackSampler() as sampler:
+            try:
+                return algorithm(config_path, verbose, **algorithm_kwargs)
+            finally:
+                sampler.save(profile_file)
+    raise ValueError(f"Unknown profile mode: {profile_mode}")
+
+
+def solve_instance(
+    algorithm, config_path, verbose=1, algorithm_kwargs=None, profile_mode=None, profile_file=None, memory_mode=None
+):
+    """
+    Call algorithm(config_path, verbose, **algorithm_kwargs), profiled when profile_mode is given.
+
+    Args:
+    - profile_mode (str, optional): "cprofile" (deterministic, pstats file) or "sampling" (StackSampler, JSON file).
+    - profile_file (str, optional): Where to write the profile, required with profile_mode.
+    - memory_mode (str, optional): "rss" (peak RSS) or "tracemalloc" (peak RSS and the Python allocations),
+      measured with MemoryTracker and added to the result as its "memory" section.
+
+    Returns:
+    - result (dict): The result of the algorithm.
+    """
+    algorithm_kwargs = algorithm_kwargs or {}
+    if memory_mode is None:
+        return _solve_profiled(algorithm, config_path, verbose, algorithm_kwargs, profile_mode, profile_file)
+    if memory_mode not in MEMORY_MODES:
+        raise ValueError(f"Unknown memory mode: {memory_mode}")
+    with MemoryTracker(trace_python=memory_mode == "tracemalloc") as tracker:
+        result = _solve_profiled(algorithm, config_path, verbose, algorithm_kwargs, profile_mode, profile_file)
+    return {**result, "memory": tracker.memory}
+
+
+def aggregate_profiles(result_path, instance_type, profile_mode, top=40):
+    """
+    Merge the per-instance profiles of one size class into a ranked report {result_path}/profile_{type}.txt.
+    A result folder holds the results of one algorithm version, so the report is per version and size class.
+
+    Args:
+    - result_path (str): Folder of the results, relative to the instances folder.
+    - instance_type (str): The size class, e.g. "XL".
+    - profile_mode (str): "cprofile" or "sampling", as passed to run_experiments.
+    - top (int, optional): Number of functions in the report.
+
+    Returns:
+    - report_file (str): Path of the report, None if there are no profiles.
+    """
+    suffix = PROFILE_SUFFIX[profile_mode]
+    result_dir = os.path.join(INSTANCES_DIR, result_path, instance_type)
+    files = sorted(
+        os.path.join(result_dir, name)
+        for name in (os.listdir(result_dir) if os.path.isdir(result_dir) else [])
+        if name.startswith(f"result_{instance_type}_") and name.endswith(suffix)
+    )
+    if not files:
+        return None
+
+    report = io.StringIO()
+    report.write(f"{profile_mode} profile of {len(files)} instances in {os.path.join(result_path, instance_type)}\n\n")
+    if profile_mode == "cprofile":
+        stats = pstats.Stats(*files, stream=report)
+        stats.strip_dirs()
+        for sort in ("cumulative", "tottime"):
+            report.write(f"==== sorted by {sort} ====\n")
+            stats.sort_stats(sort).print_stats(top)
+    else:
+        self_samples, total_samples, samples = Counter(), Counter(), 0
+        for file_path in files:
+            with open(file_path, "r") as file:
+                profile = json.load(file)
+            samples += profile["samples"]
+            self_samples.update(profile["self"])
+            total_samples.update(profile["total"])
+        report.write(f"{samples} samples\n{'self %':>8} {'total %':>8}  function\n")
+        for function, count in self_samples.most_common(top):
+            report.write(
+                f"{100 * count / max(samples, 1):>8.2f} {100 * total_samples[function] / max(samples, 1):>8.2f}  {function}\n"
+            )
+        report.write(f"\n==== sorted by total ====\n{'total %':>8}  function\n")
+        for function, count in total_samples.most_common(top):
+            report.write(f"{100 * count / max(samples, 1):>8.2f}  {function}\n")
+
+    report_file = os.path.join(INSTANCES_DIR, result_path, f"profile_{instance_type}.txt")
+    with open(report_file, "w") as file:
+        file.write(report.getvalue())
+    return report_file
+
+
+PRELOAD_MODULES = ("numpy", "yaml", "utility")
+
+
+def _experiment_worker(algorithm, verbose, algorithm_kwargs, preload, profile_mode, memory_mode, connection):
+    """
+    Long-lived worker process: imports the preloaded modules once, then solves the (config path, profile file)
+    tasks it receives over connection until it receives None. Sends ("ready", None, 0) once warmed up, then
+    (status, result, solve_time) for every task.
+    """
+    for name in preload:
+        importlib.import_module(name)
+    connection.send(("ready", None, 0.0))
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        config_path, profile_file = task
+        start = time.perf_counter()
+        try:
+            result = to_builtin(
+                solve_instance(
+                    algorithm, config_path, verbose, algorithm_kwargs, profile_mode, profile_file, memory_mode
+                )
+            )
+            status = "ok"
+        except Exception:
+            status, result = "crashed", traceback.format_exc()
+        connection.send((status, result, time.perf_counter() - start))
+    connection.close()
+
+
+class _ExperimentWorker:
+    """A worker process of _run_isolated and the task it is solving."""
+
+    def __init__(self, context, algorithm, verbose, algorithm_kwargs, preload, profile_mode, memory_mode):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_experiment_worker,
+            args=(algorithm, verbose, algorithm_kwargs, preload, profile_mode, memory_mode, child_connection),
+            daemon=False,  # 演算法本身可能還會開 process (例如 V5 的 n_workers)
+        )
+        self.started = time.perf_counter()
+        self.process.start()
+        child_connection.close()
+        self.startup = None  # 從啟動到 ready 的時間, 算在它的第一個 task 上
+        self.task = None
+        self.dispatched = None
+
+    def dispatch(self, task, profile_file=None):
+        self.task, self.dispatched = task, time.perf_counter()
+        self.connection.send((task[2], profile_file))
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self.connection.close()
+
+
+def _save_experiment_result(result_path, instance_type, i, result):
+    result_dir = os.path.join(result_path, instance_type)
+    os.makedirs(result_dir, exist_ok=True)
+    save_yaml(result, os.path.join(result_dir, f"result_{instance_type}_{i}.yaml"))
+
+
+def _profile_file(result_path, instance_type, i, profile_mode):
+    # 存在結果 YAML 旁邊: result_{type}_{i}.prof / .samples.json
+    if profile_mode is None:
+        return None
+    result_dir = os.path.join(INSTANCES_DIR, result_path, instance_type)
+    os.makedirs(result_dir, exist_ok=True)
+    return os.path.join(result_dir, f"result_{instance_type}_{i}{PROFILE_SUFFIX[profile_mode]}")
+
+
+def _failed_result(status, **details):
+    # 與正常結果相同的鍵, 讓 visualize_* 和 yaml_to_csv 照常讀取 (值為 None)
+    return {"status": status, "OBJ_value": None, "spend_time(s)": None, **details}
+
+
+def _run_isolated(
+    tasks,
+    algorithm,
+    verbose,
+    algorithm_kwargs,
+    result_path,
+    n_workers,
+    timeout,
+    preload=PRELOAD_MODULES,
+    profile_mode=None,
+    memory_mode=None,
+):
+    """
+    Solve the tasks on a pool of n_workers long-lived processes, which import preload and the algorithm's
+    module once when they start. Each result is saved as soon as its task ends. A task still running after
+    timeout seconds is killed with its worker and saved as a "timeout" result, a task that raises or whose
+    worker dies is saved as a "crashed" result; neither stops the other tasks, the worker is replaced.
+    The startup time of the workers and the solve time of the tasks are printed separately.
+    With profile_mode, every solve is profiled (see solve_instance) and its profile saved next to its result.
+    With memory_mode, the memory of every solve is added to its result (see MemoryTracker).
+    """
+    context = mp.get_context()
+    pending = deque(tasks)
+    workers = {}  # connection -> _ExperimentWorker
+
+    def start_worker():
+        worker = _ExperimentWorker(context, algorithm, verbose, algorithm_kwargs, preload, profile_mode, memory_mode)
+        workers[worker.connection] = worker
+
+    statuses = {}
+    startup_total, solve_total, round_trip_total, n_started = 0.0, 0.0, 0.0, 0
+    try:
+        for _ in range(min(n_workers, len(tasks))):
+            start_worker()
+            n_started += 1
+        while pending or any(worker.task for worker in workers.values()):
+            wait_time = None
+            if timeout is not None:
+                deadlines = [w.dispatched + timeout for w in workers.values() if w.task]
+                if deadlines:
+                    wait_time = max(0.0, min(deadlines) - time.perf_counter())
+            ready = wait(list(workers), wait_time)
+
+            for connection, worker in list(workers.items()):
+                task = worker.task
+                if connection in ready:
+                    try:
+                        status, result, solve_time = connection.recv()
+                    except EOFError:
+                        worker.process.join()
+                        status, result, solve_time = "crashed", f"worker exited with code {worker.process.exitcode}", None
+                elif task and timeout is not None and time.perf_counter() - worker.dispatched >= timeout:
+                    status, result, solve_time = "timeout", None, None
+                else:
+                    continue
+
+                if status == "crashed" and worker.startup is None:
+                    raise RuntimeError(f"Experiment worker failed to start: {result}")
+                if status == "ready":
+                    worker.startup = time.perf_counter() - worker.started
+                    startup_total += worker.startup
+                elif task:
+                    instance_type, i, _ = task
+                    round_trip = time.perf_counter() - worker.dispatched
+                    if status == "timeout":
+                        result = _failed_result(status, **{"timeout(s)": timeout})
+                    elif status == "crashed":
+                        result = _failed_result(status, error=result)
+                    _save_experiment_result(result_path, instance_type, i, result)
+                    statuses[(instance_type, i)] = status
+                    if solve_time is not None:
+                        solve_total += solve_time
+                        round_trip_total += round_trip
+                    startup = worker.startup or 0.0
+                    worker.startup, worker.task = 0.0, None
+                    print(
+                        f"Saved result for instance {instance_type}_{i} to {result_path} ({status}, "
+                        f"solve {round_trip if solve_time is None else solve_time:.3f}s, startup {startup:.3f}s)"
+                    )
+
+                if status in ("ok", "crashed", "ready") and worker.process.is_alive() and worker.startup is not None:
+                    if pending:
+                        task = pending.popleft()
+                        worker.dispatch(task, _profile_file(result_path, task[0], task[1], profile_mode))
+                    continue
+                # 被中止或已結束的 worker: 換一個新的
+                worker.stop(kill=True)
+                del workers[connection]
+                if pending:
+                    start_worker()
+                    n_started += 1
+    finally:
+        for worker in workers.values():
+            worker.stop(kill=bool(worker.task))
+
+    print(
+        f"Worker startup {startup_total:.2f}s over {n_started} workers, solve {solve_total:.2f}s over "
+        f"{len(statuses)} tasks, dispatch overhead {max(0.0, round_trip_total - solve_total):.2f}s"
+    )
+    return statuses
+
+
+def run_experiments(
+    instance_path,
+    result_path,
+    algorithm,
+    instance_types,
+    instance_start_idx,
+    instance_end_idx,
+    specify=False,
+    verbose=1,
+    algorithm_kwargs=None,
+    instance_suffix=".yaml",
+    n_workers=None,
+    timeout=None,
+    longest_first=True,
+    history_paths=(),
+    preload=PRELOAD_MODULES,
+    profile_mode=None,
+    memory_mode=None,
+):
+    """
+    Run an algorithm on instances {instance_path}/{type}/instance_{type}_{i} and save each result to
+    {result_path}/{type}/result_{type}_{i}.yaml.
+
+    By default the instances are solved one after another in this process. With n_workers or timeout,
+    they are solved on a pool of n_workers pre-warmed worker processes instead (see _run_isolated):
+    an instance is killed after timeout seconds, and a crash only fails its own instance. The failed instances get a result with
+    "status": "timeout" or "crashed" and OBJ_value / spend_time(s) set to None.
+    The algorithm has to be picklable then (a module-level function).
+    The tasks are then also dispatched longest first, from the times predicted by predict_task_costs,
+    and the predicted and actual makespan are printed.
+
+    Args:
+    - instance_path (str): Folder of the instances, relative to the instances folder.
+    - result_path (str): Folder of the results, relative to the instances folder.
+    - algorithm (callable): algorithm(config_path, verbose, **algorithm_kwargs) -> result dict.
+    - instance_types (list of str): The instance sizes, e.g. ["S", "M"].
+    - instance_start_idx (int): Index of the first instance.
+    - instance_end_idx (int): Index of the last instance (included).
+    - verbose (int, optional): Verbosity passed to the algorithm.
+    - algorithm_kwargs (dict, optional): Extra keyword arguments of the algorithm.
+    - instance_suffix (str, optional): ".yaml", ".npz" or ".coord.npz".
+    - n_workers (int, optional): Number of instances solved at once in separate processes.
+    - timeout (float, optional): Wall-clock limit per instance in seconds.
+    - longest_first (bool, optional): Dispatch the longest predicted tasks first. Defaults to True.
+    - history_paths (list of str, optional): More result folders with earlier spend_time(s), besides result_path.
+    - preload (tuple of str, optional): Modules the workers import when they start, e.g. add "gurobipy".
+    - profile_mode (str, optional): Profile every solve, "cprofile" (deterministic) or "sampling" (StackSampler).
+      The profiles are saved next to the results and merged into {result_path}/profile_{type}.txt (see aggregate_profiles).
+    - memory_mode (str, optional): Add a "memory" section to every result, "rss" (peak RSS of the solve) or
+      "tracemalloc" (also the Python allocation peak and top allocation sites, much slower), see MemoryTracker.
+
+    Returns:
+    - statuses (dict): {(instance_type, i): "ok" | "timeout" | "crashed"}
+    """
+    print(
+        f"Running experiments -> | algorithm:  {algorithm.__name__} | instance_types: {' '.join(instance_types)}"
+    )
+    tasks = [
+        (
+            instance_type,
+            i,
+            os.path.join(instance_path, instance_type, f"instance_{instance_type}_{i}{instance_suffix}"),
+        )
+        for instance_type in instance_types
+        for i in range(instance_start_idx, instance_end_idx + 1)
+    ]
+    if n_workers is not None or timeout is not None:
+        n_workers = n_workers or 1
+        costs, in_seconds = predict_task_costs(tasks, [result_path, *history_paths])
+        if longest_first:
+            order = sorted(range(len(tasks)), key=lambda index: -costs[index])
+            tasks, costs = [tasks[index] for index in order], [costs[index] for index in order]
+        predicted = lpt_makespan(costs, n_workers)
+        start = time.time()
+        statuses = _run_isolated(
+            tasks,
+            algorithm,
+            verbose,
+            algorithm_kwargs or {},
+            result_path,
+            n_workers,
+            timeout,
+            preload,
+            profile_mode,
+            memory_mode,
+        )
+        unit = "s" if in_seconds else " (I*J*K units, no earlier results)"
+        print(
+            f"Makespan with {n_workers} workers ({'longest first' if longest_first else 'in order'}): "
+            f"predicted {predicted:.2f}{unit}, actual {time.time() - start:.2f}s"
+        )
+    else:
+        statuses = {}
+        for instance_type, i, config_path in tasks:
+            print(f"Instance {instance_type}_{i}/100")
+            result = solve_instance(
+                algorithm,
+                config_path,
+                verbose,
+                algorithm_kwargs,
+                profile_mode,
+                _profile_file(result_path, instance_type, i, profile_mode),
+                memory_mode,
+            )
+            _save_experiment_result(result_path, instance_type, i, result)
+            statuses[(instance_type, i)] = "ok"
+            print(f"Saved result for instance {instance_type}_{i} to {result_path}")
+            print("!!! instance end !!!")
+            print(
+                "=====================================================================\n\n"
+            )
+
+    if profile_mode is not None:
+        for instance_type in instance_types:
+            report_file = aggregate_profiles(result_path, instance_type, profile_mode)
+            if report_file:
+                print(f"Profile of {instance_type} saved to {report_file}")
+    return statuses
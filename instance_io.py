@@ -0,0 +1,583 @@
+"""Reading and writing instances: the YAML and binary (.npz) formats, coordinate-based instances and the on-disk cache."""
+import contextlib
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import struct
+import time
+import zipfile
+
+import numpy as np
+import yaml
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from config import INSTANCES_DIR, INSTANCE_CACHE_DIR, INSTANCE_CACHE_MAX_BYTES
+from distances import DistanceMatrix
+
+logger = logging.getLogger(__name__)
+
+
+# libyaml 的 C loader/dumper 快很多, 沒有安裝時退回純 Python 版
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper)
+
+
+class InstanceCache:
+    """
+    On-disk LRU cache of parsed instances, stored in the binary instance format (see save_instance_npz).
+
+    Entries are keyed on the SHA-1 of the YAML content, so copies of an instance share one entry, and on the
+    format version: entries written with another CACHE_FORMAT_VERSION are misses and are removed.
+    The (mtime, size) of every path is kept with its hash, an unchanged file is not even hashed again.
+    The least recently used entries are evicted once the cache is larger than max_bytes.
+    Several processes can share the cache: an entry is written to a temporary file and renamed into place,
+    and the index is re-read, merged and written under a file lock. Eviction also counts the entry files
+    the index doesn't know about, e.g. left by a process killed before it updated the index.
+
+    Args:
+    - cache_dir (str, optional): Folder of the cache. Defaults to config.INSTANCE_CACHE_DIR.
+    - max_bytes (int, optional): Size limit of the cache. Defaults to config.INSTANCE_CACHE_MAX_BYTES.
+    - format_version (int, optional): Version of the cached arrays. Defaults to CACHE_FORMAT_VERSION.
+    """
+
+    def __init__(self, cache_dir=INSTANCE_CACHE_DIR, max_bytes=INSTANCE_CACHE_MAX_BYTES, format_version=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.format_version = CACHE_FORMAT_VERSION if format_version is None else format_version
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock_path = os.path.join(cache_dir, "index.lock")
+        self.hits = 0
+        self.misses = 0
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"files": {}, "entries": {}}
+
+    def _save_index(self, index):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(index, file)
+        os.replace(tmp_path, self.index_path)  # 讀的人不會看到寫一半的 index
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # index 的 讀 -> 合併 -> 寫 要在同一把鎖裡, 否則最後寫的 process 會蓋掉別人的 entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _entry_key(self, content_hash):
+        return f"{content_hash}.v{self.format_version}"
+
+    def _entry_path(self, entry_key):
+        return os.path.join(self.cache_dir, f"{entry_key}.npz")
+
+    def content_hash(self, file_path, index):
+        """SHA-1 of the file content, reused from the index while its mtime and size don't change."""
+        stat = os.stat(file_path)
+        known = index["files"].get(file_path)
+        if known and known["mtime"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+            return known["hash"]
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha1.update(block)
+        index["files"][file_path] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": sha1.hexdigest(),
+        }
+        return sha1.hexdigest()
+
+    def load(self, file_path, parse):
+        """
+        Load an instance from the cache, or parse it and add it to the cache.
+
+        Args:
+        - file_path (str): Path of the instance file.
+        - parse (callable): parse(file_path) -> dict, used on a cache miss.
+
+        Returns:
+        - config (dict): The instance configuration with its lists as NumPy arrays.
+        """
+        # 雜湊和解析不用鎖, 多個 process 可以同時做
+        snapshot = self._load_index()
+        content_hash = self.content_hash(file_path, snapshot)
+        entry_key = self._entry_key(content_hash)
+        entry_path = self._entry_path(entry_key)
+        if os.path.exists(entry_path):  # 只會存在寫完的檔案
+            self.hits += 1
+        else:
+            self.misses += 1
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = os.path.join(self.cache_dir, f"{entry_key}.{os.getpid()}.tmp.npz")
+            try:
+                save_instance_npz(parse(file_path), tmp_path)
+                os.replace(tmp_path, entry_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        with self._locked():
+            index = self._load_index()
+            if file_path in snapshot["files"]:
+                index["files"][file_path] = snapshot["files"][file_path]
+            index["entries"][entry_key] = {"bytes": os.path.getsize(entry_path), "last_used": time.time()}
+            self._evict(index, keep=entry_key)
+            self._save_index(index)
+            return load_instance_npz(entry_path)  # 在鎖裡 map, 不會被別的 process 剛好刪掉
+
+    def _evict(self, index, keep):
+        # 以資料夾裡實際的檔案為準: 沒有 index 的檔案照 mtime 算, 檔案不見的 entry 拿掉, 別的版本的 entry 刪掉
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            match = _CACHE_ENTRY.match(name)
+            if match and match.group(2) != str(self.format_version):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            elif match:
+                entry_key = name[: -len(".npz")]
+                entries[entry_key] = index["entries"].get(entry_key) or {
+                    "bytes": os.path.getsize(path),
+                    "last_used": os.path.getmtime(path),
+                }
+            elif name.endswith(".tmp.npz") and time.time() - os.path.getmtime(path) > _STALE_TMP_SECONDS:
+                os.remove(path)  # 寫到一半就中止的 process 留下的
+        total = sum(entry["bytes"] for entry in entries.values())
+        for entry_key in sorted(entries, key=lambda key: entries[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if entry_key == keep:
+                continue
+            total -= entries.pop(entry_key)["bytes"]
+            try:
+                os.remove(self._entry_path(entry_key))
+            except FileNotFoundError:
+                pass
+        index["entries"] = entries
+        index["files"] = {
+            path: known
+            for path, known in index["files"].items()
+            if self._entry_key(known["hash"]) in entries
+        }
+
+
+# 改變解析結果 (型別、欄位) 時加一, 舊的 entry 會被當成 miss 並刪除
+# 2: 串流解析保留 V, B, U_LT 的小數
+CACHE_FORMAT_VERSION = 2
+_CACHE_ENTRY = re.compile(r"^([0-9a-f]{40})(?:\.v(\d+))?\.npz$")
+_STALE_TMP_SECONDS = 3600
+
+
+INSTANCE_CACHE = InstanceCache()
+
+
+def _parse_yaml(file_path):
+    with open(file_path, "r") as file:
+        return yaml.load(file, Loader=YAML_LOADER)
+
+
+# 大矩陣直接填入預先配置的 array, shape 由 i/j/k/l_amount 決定
+STREAMED_ARRAY_SHAPES = {
+    "D": ("i_amount", "j_amount"),
+    "D_comp": ("i_amount", "l_amount"),
+    "V": ("j_amount", "k_amount"),
+    "B": ("j_amount", "k_amount"),
+    "U_LT": ("j_amount", "k_amount"),
+}
+STREAMED_ARRAY_DTYPES = {"D": float, "D_comp": float}  # 其他先當整數, 遇到小數時轉成 float
+_TOP_LEVEL_INT = re.compile(r"^([A-Za-z_]\w*):\s*(-?\d+)\s*$")
+# 常見的十進位數字直接轉換, 其餘 (true, ~, 0x1f, 012, ...) 交給 yaml 的 resolver, 與 SafeLoader 相同
+_PLAIN_INT = re.compile(r"^-?(?:0|[1-9][0-9]*)$")
+_PLAIN_FLOAT = re.compile(r"^-?[0-9]+\.[0-9]*(?:[eE][-+][0-9]+)?$")
+_YAML_RESOLVER = yaml.resolver.Resolver()
+_YAML_CONSTRUCTOR = yaml.constructor.SafeConstructor()
+
+
+def _yaml_value(event):
+    """The value yaml.SafeLoader gives a scalar event."""
+    value = event.value
+    if event.tag in (None, "!") and event.implicit[0]:
+        if _PLAIN_INT.match(value):
+            return int(value)
+        if _PLAIN_FLOAT.match(value):
+            return float(value)
+    tag = event.tag
+    if tag in (None, "!"):
+        tag = _YAML_RESOLVER.resolve(yaml.ScalarNode, value, event.implicit)
+    constructor = _YAML_CONSTRUCTOR.yaml_constructors.get(tag)
+    if constructor is None:
+        raise ValueError(f"Unsupported YAML tag {tag}")
+    return constructor(_YAML_CONSTRUCTOR, yaml.ScalarNode(tag, value, style=event.style))
+
+
+def _yaml_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value  # 字串, 例如 DIST_METHOD
+
+
+def read_instance_yaml(file_path):
+    """
+    Read a block-style instance YAML by streaming its parse events, without building the nested lists
+    of the large matrices. The amounts (i_amount, ...) are read from the top-level lines first,
+    then D, D_comp, V, B and U_LT are written straight into preallocated NumPy arrays, integer until
+    a non-integer value shows up. The small lists (H, F, C, coordinates, ...) are converted to arrays as well.
+    Scalars are resolved as yaml.SafeLoader does (true -> True, ~ -> None, 0x1f -> 31, ...).
+    Raises ValueError on files it can't stream (no amounts, non-numeric matrices, ...), see parse_instance_yaml.
+
+    Args:
+    - file_path (str): Path of the instance file.
+
+    Returns:
+    - config (dict): The instance configuration with its lists as NumPy arrays.
+    """
+    amounts = {}
+    with open(file_path, "r") as file:
+        for line in file:
+            match = _TOP_LEVEL_INT.match(line)
+            if match and match.group(1).endswith("_amount"):
+                amounts[match.group(1)] = int(match.group(2))
+    missing = {name for shape in STREAMED_ARRAY_SHAPES.values() for name in shape}
+    missing -= set(amounts)
+    if missing:
+        raise ValueError(f"{file_path} has no top-level {', '.join(sorted(missing))}")
+
+    config = {}
+    key = None  # top-level key whose value is being read
+    stack = []  # nested lists of the value being read (small lists only)
+    flat, position, depth = None, 0, 0  # the preallocated array being filled
+    with open(file_path, "r") as file:
+        for event in yaml.parse(file, Loader=YAML_LOADER):
+            if isinstance(event, yaml.ScalarEvent):
+                if key is None and not stack and flat is None:
+                    key = event.value
+                    continue
+                value = _yaml_value(event)
+                if flat is not None:
+                    if position >= flat.size:
+                        raise ValueError(f"{key} in {file_path} is larger than {config[key].shape}")
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        raise ValueError(f"{key} in {file_path} has a non-numeric value {value!r}")
+                    if isinstance(value, float) and flat.dtype.kind == "i":
+                        # 已經填入的整數轉成 float 不會失真
+                        config[key] = config[key].astype(float)
+                        flat = config[key].reshape(-1)
+                    flat[position] = value
+                    position += 1
+                elif stack:
+                    stack[-1].append(value)
+                else:
+                    config[key], key = value, None
+            elif isinstance(event, yaml.SequenceStartEvent):
+                if flat is None and not stack and key in STREAMED_ARRAY_SHAPES:
+                    shape = tuple(amounts[name] for name in STREAMED_ARRAY_SHAPES[key])
+                    config[key] = np.empty(shape, STREAMED_ARRAY_DTYPES.get(key, np.int64))
+                    flat, position, depth = config[key].reshape(-1), 0, 0
+                if flat is not None:
+                    depth += 1
+                else:
+                    stack.append([])
+            elif isinstance(event, yaml.SequenceEndEvent):
+                if flat is not None:
+                    depth -= 1
+                    if depth == 0:
+                        if position != flat.size:
+                            raise ValueError(f"{key} in {file_path} doesn't match {shape}")
+                        flat, key = None, None
+                    continue
+                values = stack.pop()
+                if stack:
+                    stack[-1].append(values)
+                else:
+                    config[key], key = np.asarray(values), None
+            elif isinstance(event, (yaml.MappingStartEvent, yaml.AliasEvent)) and (
+                key is not None
+            ):
+                raise ValueError(f"{key} in {file_path} is not a list or a number")
+    return config
+
+
+def parse_instance_yaml(file_path):
+    """read_instance_yaml, or the full yaml loader for the files it can't stream."""
+    try:
+        return read_instance_yaml(file_path)
+    except (ValueError, KeyError):
+        return _parse_yaml(file_path)
+
+
+def _yaml_scalar(value):
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        if math.isnan(value):
+            return ".nan"
+        if math.isinf(value):
+            return ".inf" if value > 0 else "-.inf"
+        text = repr(value)
+        # YAML 1.1 只把有小數點的指數表示法當成 float
+        return text.replace("e", ".0e") if "e" in text and "." not in text else text
+    return str(value)
+
+
+def write_instance_yaml(config, file_path):
+    """
+    Write an instance as block-style YAML one row at a time, the counterpart of read_instance_yaml.
+    The output is the same as yaml.dump(config, default_flow_style=False) for numbers, strings and
+    lists of up to 2 dimensions, without building the whole document in memory.
+
+    Args:
+    - config (dict): The instance configuration, its values are numbers, strings, lists or NumPy arrays.
+    - file_path (str): Path of the instance file.
+    """
+    with open(file_path, "w") as file:
+        for key in sorted(config):
+            value = config[key]
+            if isinstance(value, str) or np.ndim(value) == 0:
+                file.write(f"{key}: {_yaml_scalar(value)}\n")
+                continue
+            value = np.asarray(value)
+            if value.size == 0 or value.ndim > 2:
+                file.write(yaml.dump({key: to_builtin(value)}, default_flow_style=False, Dumper=YAML_DUMPER))
+                continue
+            file.write(f"{key}:\n")
+            if value.ndim == 1:
+                file.write("".join(f"- {_yaml_scalar(item)}\n" for item in value.tolist()))
+                continue
+            for row in value.tolist():
+                file.write("- - " + "\n  - ".join(map(_yaml_scalar, row)) + "\n")
+
+
+# coordinate-based instance 的點與距離矩陣: D 為客戶到設施點, D_comp 為客戶到對手
+COORDINATE_DISTANCES = {"D": ("CONSUMERS", "CANDIDATES"), "D_comp": ("CONSUMERS", "COMPETITORS")}
+
+
+def to_coordinate_instance(config, cal_method="euclidean", decimals=None):
+    """
+    Drop the distance matrices of an instance, keeping only the coordinates and how to compute the distances.
+
+    Args:
+    - config (dict): The instance configuration with CONSUMERS, CANDIDATES and COMPETITORS.
+    - cal_method (str, optional): "euclidean" (default) or "manhattan".
+    - decimals (int, optional): Decimals the distances were rounded to, None if they aren't rounded.
+
+    Returns:
+    - config (dict): The coordinate-based instance.
+    """
+    config = {key: value for key, value in config.items() if key not in COORDINATE_DISTANCES}
+    config["DIST_METHOD"] = cal_method
+    if decimals is not None:
+        config["DIST_DECIMALS"] = decimals
+    return config
+
+
+def with_distances(config):
+    """
+    Add D and D_comp as DistanceMatrix to a coordinate-based instance (one with DIST_METHOD), they are computed when used.
+    Instances that store D and D_comp are returned unchanged.
+    """
+    if "DIST_METHOD" not in config:
+        return config
+    for key, (points_1, points_2) in COORDINATE_DISTANCES.items():
+        if key not in config:
+            config[key] = DistanceMatrix(
+                config[points_1],
+                config[points_2],
+                config["DIST_METHOD"],
+                config.get("DIST_DECIMALS"),
+            )
+    return config
+
+
+def load_specific_yaml(filename, use_cache=True):
+    """
+    Load the content of a YAML file from the instances folder.
+    Parsed instances are cached (see InstanceCache), a cached instance is returned with its lists as NumPy arrays.
+    If the cache fails, it is disabled for the rest of the process.
+
+    Parameters:
+    filename (str): 在 instances 資料夾中的 YAML 檔案名。
+    use_cache (bool, optional): 使用解析過的 instance 快取. Defaults to True.
+
+    Returns:
+    dict: YAML 檔案內容。
+    """
+    global INSTANCE_CACHE
+    file_path = os.path.abspath(os.path.join(INSTANCES_DIR, filename))
+    if use_cache and INSTANCE_CACHE is not None:
+        try:
+            return INSTANCE_CACHE.load(file_path, parse_instance_yaml)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            # 快取不能用 (唯讀、磁碟滿) 時只警告一次, 之後的 instance 都直接解析
+            logger.warning("Instance cache unavailable (%s), parsing instances without it", e)
+            INSTANCE_CACHE = None
+    return with_distances(_parse_yaml(file_path))
+
+
+def save_instance_npz(config, filename):
+    """
+    Save an instance as an uncompressed .npz file (one .npy array per key), so it can be memory-mapped.
+
+    Args:
+    - config (dict): The instance configuration.
+    - filename (str): The name of the .npz file, relative to the instances folder.
+    """
+    file_path = os.path.join(INSTANCES_DIR, filename)
+    np.savez(file_path, **{key: np.asarray(value) for key, value in config.items()})
+
+
+def _memmap_npz(file_path):
+    """
+    Memory-map every array of an uncompressed .npz file.
+    The members of the zip are stored as is, so each array is a read-only view of the file at its data offset.
+    """
+    arrays = {}
+    with zipfile.ZipFile(file_path) as archive, open(file_path, "rb") as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{file_path} is compressed and can't be memory-mapped")
+            # local file header: 30 bytes, then the file name and the extra field
+            file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", file.read(30)[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            key = info.filename[: -len(".npy")]
+            if not shape:  # scalars (i_amount, A_EX_bound, ...)
+                arrays[key] = np.fromfile(file, dtype=dtype, count=1).reshape(())
+                continue
+            arrays[key] = np.asarray(
+                np.memmap(
+                    file_path,
+                    dtype=dtype,
+                    mode="r",
+                    offset=file.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+            )
+    return arrays
+
+
+def load_instance_npz(filename, mmap=True):
+    """
+    Load an instance saved by save_instance_npz.
+
+    Args:
+    - filename (str): The name of the .npz file, relative to the instances folder.
+    - mmap (bool, optional): Memory-map the arrays (read-only, zero-copy) instead of reading them. Defaults to True.
+
+    Returns:
+    - config (dict): The instance configuration, scalars as Python numbers and the rest as NumPy arrays.
+    """
+    file_path = os.path.join(INSTANCES_DIR, filename)
+    if mmap:
+        arrays = _memmap_npz(file_path)
+    else:
+        with np.load(file_path) as data:
+            arrays = {key: data[key] for key in data.files}
+    return with_distances(
+        {key: array.item() if array.ndim == 0 else array for key, array in arrays.items()}
+    )
+
+
+def load_instance(filename):
+    """
+    Load an instance from the instances folder, as YAML or as the binary format (.npz) by its extension.
+
+    Parameters:
+    filename (str): 在 instances 資料夾中的 instance 檔案名。
+
+    Returns:
+    dict: instance 內容。
+    """
+    if filename.endswith(".npz"):
+        return load_instance_npz(filename)
+    return load_specific_yaml(filename)
+
+
+def convert_instances_to_npz(instance_path, overwrite=False, coordinates=False):
+    """
+    Convert every instance_*.yaml under a folder to a .npz file next to it.
+
+    Args:
+    - instance_path (str): Folder of the instances, relative to the instances folder.
+    - overwrite (bool, optional): Convert again when the .npz file already exists. Defaults to False.
+    - coordinates (bool, optional): Write coordinate-based instances (.coord.npz, euclidean distances) without D and D_comp. Defaults to False.
+
+    Returns:
+    - converted (int): Number of converted instances.
+    """
+    converted = 0
+    for root, _, files in os.walk(os.path.join(INSTANCES_DIR, instance_path)):
+        for name in sorted(files):
+            if not (name.startswith("instance_") and name.endswith(".yaml")):
+                continue
+            yaml_path = os.path.join(root, name)
+            npz_path = yaml_path[: -len(".yaml")] + (".coord.npz" if coordinates else ".npz")
+            if os.path.exists(npz_path) and not overwrite:
+                continue
+            config = read_instance_yaml(yaml_path)
+            if coordinates:
+                config = to_coordinate_instance(config)
+            save_instance_npz(config, npz_path)
+            converted += 1
+    return converted
+
+
+def to_builtin(data):
+    """
+    Convert NumPy scalars and arrays (e.g. from instances loaded as arrays) in nested data to Python types,
+    so yaml.dump writes plain values instead of python/object tags.
+    """
+    if isinstance(data, dict):
+        return {key: to_builtin(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(to_builtin(value) for value in data)
+    if isinstance(data, (np.ndarray, np.generic)):
+        return data.tolist()
+    return data
+
+
+def save_yaml(data, filename):
+    """
+    Save data to a YAML file in the instances folder.
+
+    Args:
+    - data (dict): The data to save to the file.
+    - filename (str): The name of the file to save the data to.
+    """
+    file_path = os.path.join(INSTANCES_DIR, filename)
+    with open(file_path, "w") as file:
+        yaml.dump(
+            to_builtin(data), file, default_flow_style=False, Dumper=YAML_DUMPER
+        )
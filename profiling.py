@@ -0,0 +1,497 @@
+"""Logging, span tracing, phase timing, stack sampling and memory tracking of the solves."""
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from instance_io import to_builtin
+
+
+VERBOSE_LEVELS = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout, so redirect_stdout captures the messages as it did the prints."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Logging handler writing one JSON object per record: time, level, logger, message and the
+    structured fields passed as extra={"fields": {...}}.
+
+    Args:
+    - file_path (str): The .jsonl file, appended to.
+    """
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.file = open(file_path, "a")
+
+    def emit(self, record):
+        try:
+            entry = {
+                "time": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **to_builtin(getattr(record, "fields", {})),
+            }
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def get_logger(name, verbose=None):
+    """
+    Logger "cfl.{name}" of the solvers. The "cfl" loggers print the bare message to stdout, like print did.
+
+    Args:
+    - name (str): Name of the module.
+    - verbose (int, optional): Set the level from the verbose of the solvers: 0 warnings only,
+      1 progress (INFO), 2 every candidate (DEBUG). The level is left as it is if not given.
+
+    Returns:
+    - logger (logging.Logger)
+    """
+    root = logging.getLogger("cfl")
+    if not root.handlers:
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+        root.setLevel(logging.INFO)
+    logger = logging.getLogger(f"cfl.{name}")
+    if verbose is not None:
+        logger.setLevel(VERBOSE_LEVELS.get(verbose, logging.DEBUG if verbose > 2 else logging.WARNING))
+    return logger
+
+
+class ProgressLogger:
+    """
+    Rate-limited progress lines: update() logs at most one line every interval seconds, with the
+    elapsed time and the given fields, finish() logs the last update if it was skipped.
+    Nothing is formatted when the level of the logger is disabled.
+
+    Args:
+    - logger (logging.Logger): The logger to write to.
+    - interval (float, optional): Minimum number of seconds between two lines.
+    - level (int, optional): Level of the lines. Defaults to INFO.
+    """
+
+    def __init__(self, logger, interval=1.0, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self.start = time.perf_counter()
+        self.last = None  # 上一次輸出的時間
+        self.skipped = None  # 被略過的最後一次 update
+
+    def update(self, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.perf_counter()
+        if self.last is not None and now - self.last < self.interval:
+            self.skipped = fields
+            return
+        self._emit(fields, now)
+
+    def finish(self):
+        if self.skipped is not None and self.logger.isEnabledFor(self.level):
+            self._emit(self.skipped, time.perf_counter())
+
+    def _emit(self, fields, now):
+        self.last, self.skipped = now, None
+        fields = {**fields, "elapsed": round(now - self.start, 3)}
+        self.logger.log(
+            self.level,
+            " | ".join(["%s: %s"] * len(fields)),
+            *(item for pair in fields.items() for item in pair),
+            extra={"fields": fields},
+        )
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer, self.name, self.args = tracer, name, args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, time.perf_counter() - self.start, **self.args)
+
+
+class SpanTracer:
+    """
+    Records spans of a solve and exports them as Chrome trace-event JSON (chrome://tracing, Perfetto).
+
+    with tracer.span("model_build", model="OG_G") as span: ...   # span.args can be updated inside
+    tracer.complete("iteration", start, duration, best_loc=3)      # a span timed by the caller
+    with tracer.sampled_span("candidate", loc=7): ...              # only 1 in round(1 / sample_rate) calls
+
+    Args:
+    - sample_rate (float, optional): Fraction of the sampled spans to record. Defaults to 0.01.
+    """
+
+    def __init__(self, sample_rate=0.01):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.stride = round(1 / sample_rate) if sample_rate > 0 else 0
+        self.sampled_calls = 0
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def sampled_span(self, name, **args):
+        self.sampled_calls += 1
+        if self.stride and self.sampled_calls % self.stride == 0:
+            return _Span(self, name, args)
+        return _NULL_CONTEXT
+
+    def sampled_positions(self, n):
+        """Positions among the next n sampled spans that are recorded, for loops that skip the others entirely."""
+        if not self.stride:
+            return range(0)
+        first = (-self.sampled_calls - 1) % self.stride
+        self.sampled_calls += n
+        return range(first, n, self.stride)
+
+    def complete(self, name, start, duration, **args):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": self.pid,
+            "tid": 0,
+        }
+        if args:
+            event["args"] = to_builtin(args)
+        self.events.append(event)
+
+    def instant(self, name, **args):
+        event = {"name": name, "ph": "i", "s": "p", "ts": (time.perf_counter() - self.origin) * 1e6, "pid": self.pid, "tid": 0}
+        if args:
+            event["args"] = to_builtin(args)
+        self.events.append(event)
+
+    def export(self, file_path):
+        """Write the spans to a Chrome trace JSON file, the folders are created if needed."""
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        with open(file_path, "w") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start", "span")
+
+    def __init__(self, profiler, name, span):
+        self.profiler, self.name, self.span = profiler, name, span
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(
+            self.name, time.perf_counter() - self.start, self.start if self.span else None
+        )
+
+
+class PhaseProfiler:
+    """
+    Accumulates the wall-clock time of named phases (time.perf_counter) and named counters of a solve.
+
+    with profiler.phase("fill"): ...   # adds the time and one call to "fill"
+    profiler.count("candidates", n)
+    G = profiler.counted("G", G)       # counts the calls of G and the values it is evaluated on
+
+    Phases may be nested, the time of the inner phase is then also in the outer one.
+    With a SpanTracer every phase is also recorded as a span, and span / sampled_span / record_span add
+    spans that are not phases.
+
+    Args:
+    - tracer (SpanTracer, optional): Also record the phases as spans.
+    """
+
+    def __init__(self, tracer=None):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.tracer = tracer
+        self.tracing = tracer is not None
+
+    def phase(self, name, span=True):
+        """Time a phase, span=False leaves it out of the trace (phases run once per candidate)."""
+        return _Phase(self, name, span)
+
+    def add_time(self, name, seconds, start=None):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.tracing and start is not None:
+            self.tracer.complete(name, start, seconds)
+
+    def span(self, name, **args):
+        return self.tracer.span(name, **args) if self.tracing else _NULL_CONTEXT
+
+    def sampled_span(self, name, **args):
+        return self.tracer.sampled_span(name, **args) if self.tracing else _NULL_CONTEXT
+
+    def record_span(self, name, start, **args):
+        """Record a span from start (time.perf_counter) to now."""
+        if self.tracing:
+            self.tracer.complete(name, start, time.perf_counter() - start, **args)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def counted(self, name, func):
+        def counted_func(x, *args, **kwargs):
+            self.count(f"{name}_calls")
+            self.count(f"{name}_values", int(np.size(x)))
+            return func(x, *args, **kwargs)
+
+        return counted_func
+
+    def report(self):
+        """The "profile" section of a result: {"phases": {name: {"time(s)", "calls"}}, "counters": {...}}"""
+        return {
+            "phases": {
+                name: {"time(s)": self.times[name], "calls": self.calls[name]}
+                for name in self.times
+            },
+            "counters": dict(self.counters),
+        }
+
+
+class _NullProfiler(PhaseProfiler):
+    """A PhaseProfiler that records nothing, used when profiling is off."""
+
+    def phase(self, name, span=True):
+        return _NULL_CONTEXT
+
+    def add_time(self, name, seconds, start=None):
+        pass
+
+    def record_span(self, name, start, **args):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def counted(self, name, func):
+        return func
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+PROFILE_SUFFIX = {"cprofile": ".prof", "sampling": ".samples.json"}
+
+
+def _frame_key(code):
+    # 與 pstats 相同的函式名稱格式
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class StackSampler:
+    """
+    Low-overhead statistical profiler: a background thread takes the stack of one thread every interval seconds.
+    self_samples counts the function on top of the stack, total_samples every function on it (once per sample).
+    The sampling thread needs the GIL, so a sample is taken between two bytecodes of the sampled thread:
+    time in a long C call (NumPy) goes to the Python frame around it, and there are fewer samples than interval asks for.
+
+    Args:
+    - interval (float, optional): Seconds between two samples. Defaults to 0.005.
+    - thread_id (int, optional): The thread to sample. Defaults to the thread creating the sampler.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.self_samples[_frame_key(frame.f_code)] += 1
+            on_stack = set()
+            while frame is not None:
+                on_stack.add(_frame_key(frame.f_code))
+                frame = frame.f_back
+            self.total_samples.update(on_stack)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def save(self, file_path):
+        with open(file_path, "w") as file:
+            json.dump(
+                {
+                    "interval": self.interval,
+                    "samples": self.samples,
+                    "self": dict(self.self_samples),
+                    "total": dict(self.total_samples),
+                },
+                file,
+            )
+
+
+def _proc_status_kb(field):
+    # VmRSS / VmHWM of /proc/self/status (kB), None when not on Linux
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    # Linux >= 4.0: 寫入 5 會把 VmHWM 重設為目前的 RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 if sys.platform == "darwin" else max_rss  # macOS 的單位是 bytes
+
+
+class MemoryTracker:
+    """
+    Measure the memory of the code run inside the with block.
+    The peak RSS is the peak of the block when the kernel lets it be reset (Linux /proc/self/clear_refs),
+    otherwise the peak of the whole process so far ("peak_rss_scope": "process"); RSS includes NumPy buffers.
+    With tracemalloc, the peak of the Python-level allocations (NumPy arrays included) is recorded too, with the
+    top allocation sites near that peak: a background thread polls the traced memory every interval seconds and
+    takes a snapshot whenever it reaches a new high, so temporaries freed before the block ends are still reported.
+    An allocation living for less than interval can be missed by the snapshot, not by python_peak(MB).
+    tracemalloc slows allocation-heavy code down a lot, so its times are not comparable with plain runs.
+
+    Args:
+    - trace_python (bool, optional): Also trace the Python allocations with tracemalloc. Defaults to False.
+    - top (int, optional): Number of allocation sites in the report. Defaults to 10.
+    - frames (int, optional): Frames kept per allocation, the sites are grouped by their innermost frame. Defaults to 1.
+    - interval (float, optional): Seconds between two polls of the traced memory. Defaults to 0.01.
+    """
+
+    def __init__(self, trace_python=False, top=10, frames=1, interval=0.01):
+        self.trace_python = trace_python
+        self.top = top
+        self.frames = frames
+        self.interval = interval
+        self.memory = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _snapshot_if_higher(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self._snapshot_current:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_current = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._snapshot_if_higher()
+
+    def __enter__(self):
+        self._scope = "solve" if _reset_peak_rss() else "process"
+        self._rss_before = _proc_status_kb("VmRSS")
+        self._started_tracing = self.trace_python and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(self.frames)
+        elif self.trace_python:
+            tracemalloc.reset_peak()
+        if self.trace_python:
+            self._snapshot, self._snapshot_current = None, -1
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        peak_rss = _proc_status_kb("VmHWM") or _max_rss_kb()
+        memory = {
+            "peak_rss(MB)": None if peak_rss is None else peak_rss / 1024,
+            "rss_before(MB)": None if self._rss_before is None else self._rss_before / 1024,
+            "peak_rss_scope": self._scope,
+        }
+        if self.trace_python:
+            self._stop.set()
+            self._thread.join()
+            current, peak = tracemalloc.get_traced_memory()
+            self._snapshot_if_higher()  # 結束時仍是最高點
+            snapshot = self._snapshot.filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>"))
+            )
+            if self._started_tracing:
+                tracemalloc.stop()
+            memory["python_peak(MB)"] = peak / 1024**2
+            memory["python_current(MB)"] = current / 1024**2
+            memory["top_allocations_at(MB)"] = self._snapshot_current / 1024**2
+            memory["top_allocations"] = [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size(KB)": stat.size / 1024,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[: self.top]
+            ]
+            self._snapshot = None
+        self.memory = memory
+
+
+MEMORY_MODES = ("rss", "tracemalloc")
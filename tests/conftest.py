@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "Algorithms"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "Instance"))
+sys.path.insert(0, ROOT_DIR)
+
+import instance_io  # noqa: E402
+import utility as util  # noqa: E402
+
+BENCHMARK_DIR = os.path.join(ROOT_DIR, "Instance", "Benchmark-Test")
+
+
+def instance_file(instance_set, size, idx):
+    """Absolute path of a bundled benchmark instance."""
+    return os.path.join(BENCHMARK_DIR, instance_set, size, f"instance_{size}_{idx}.yaml")
+
+
+def load_config(instance_set, size, idx):
+    """The bundled instance as parsed by yaml.safe_load."""
+    with open(instance_file(instance_set, size, idx), "r") as file:
+        return yaml.safe_load(file)
+
+
+@pytest.fixture(autouse=True)
+def isolated_instance_cache(tmp_path, monkeypatch):
+    # 測試不寫入 repo 的 .instance_cache
+    cache = util.InstanceCache(str(tmp_path / "instance_cache"))
+    monkeypatch.setattr(instance_io, "INSTANCE_CACHE", cache)
+    return cache
@@ -0,0 +1,16 @@
+"""Algorithms for the run_experiments tests, picked by the instance index: module-level so the workers can load them."""
+import os
+import time
+
+TIMEOUT_INDEX, RAISE_INDEX, EXIT_INDEX = 2, 3, 4
+
+
+def scripted(config_path, verbose=0):
+    i = int(config_path.rsplit("_", 1)[1].split(".")[0])
+    if i == TIMEOUT_INDEX:
+        time.sleep(60)
+    if i == RAISE_INDEX:
+        raise RuntimeError("scripted failure")
+    if i == EXIT_INDEX:
+        os._exit(3)  # worker 直接死掉
+    return {"OBJ_value": float(i), "spend_time(s)": 0.0, "buffer": len(bytearray(1 << 20)), "worker": os.getpid()}
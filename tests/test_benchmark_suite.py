@@ -0,0 +1,55 @@
+"""The benchmark suite history and its regression report."""
+import pytest
+
+import benchmark_suite as suite
+
+
+def record(commit, index, time_, objective, version="V5", size="S"):
+    return {
+        "commit": commit,
+        "algorithm": version,
+        "instance_set": "instance_new",
+        "size": size,
+        "index": index,
+        "median_time(s)": time_,
+        "OBJ_value": objective,
+        "gurobi_ratio": None,
+    }
+
+
+def test_sample_instances_is_stable():
+    sample = suite.sample_instances("instance_new", "S", 3, seed=1)
+    assert sample == sorted(sample) and len(set(sample)) == 3
+    assert suite.sample_instances("instance_new", "S", 3, seed=1) == sample
+    assert suite.sample_instances("instance_new", "S", None) == sorted(suite.sample_instances("instance_new", "S", 10_000))
+    assert suite.sample_instances("instance_new", "missing", 3) == []
+
+
+def test_run_benchmark_appends_to_the_history(tmp_path):
+    history_file = str(tmp_path / "history.jsonl")
+    records = suite.run_benchmark(["V5"], ["instance_new"], ["S"], sample=1, repeats=2, history_file=history_file)
+    [record_] = records
+    assert record_["consistent"] and len(record_["times(s)"]) == 2 and record_["OBJ_value"] > 0
+    assert suite.load_history(history_file) == records
+    assert suite.history_commits(records) == [record_["commit"]]
+
+
+def test_compare_commits_flags_time_and_objective_regressions():
+    records = [
+        record("aaa111", 1, 1.0, 10.0),
+        record("aaa111", 2, 2.0, 20.0),
+        record("aaa111", 1, 1.0, 10.0, version="V3"),
+        record("bbb222", 1, 1.5, 10.0),
+        record("bbb222", 2, 3.0, 19.0),
+        record("bbb222", 1, 1.05, 10.0, version="V3"),
+        record("bbb222", 3, 9.0, 30.0),  # base 沒有跑的 instance 不比較
+    ]
+    rows = {row["algorithm"]: row for row in suite.compare_commits(records, "aaa111", "bbb222", threshold=0.1)}
+    assert rows["V5"]["instances"] == 2
+    assert rows["V5"]["time_ratio"] == pytest.approx(1.5)
+    assert rows["V5"]["regressions"] == ["time x1.50", "objective down on instances [2]"]
+    assert rows["V3"]["time_ratio"] == pytest.approx(1.05) and rows["V3"]["regressions"] == []
+
+    assert suite.resolve_commit(records, "bbb") == "bbb222"
+    with pytest.raises(ValueError):
+        suite.resolve_commit(records, "ccc")
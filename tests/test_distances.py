@@ -0,0 +1,108 @@
+"""Coordinate-based instances and the distances computed from the coordinates."""
+import math
+
+import numpy as np
+import pytest
+
+import greedy_engine as engine
+import heuristic_greedyV5 as v5
+import utility as util
+from conftest import instance_file, load_config
+
+POINT_DISTANCE = {
+    "euclidean": lambda p1, p2: math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2),
+    "manhattan": lambda p1, p2: abs(p1[0] - p2[0]) + abs(p1[1] - p2[1]),
+}
+
+
+@pytest.mark.parametrize("cal_method", ["euclidean", "manhattan"])
+def test_distance_matrix_matches_pointwise_distances(cal_method):
+    rng = np.random.default_rng(0)
+    customers, locations = rng.uniform(0, 100, (7, 2)), rng.uniform(0, 100, (11, 2))
+    D = util.DistanceMatrix(customers, locations, cal_method, max_cached_rows=3)
+    distance = POINT_DISTANCE[cal_method]
+    expected = [[distance(c, l) for l in locations] for c in customers]
+    np.testing.assert_allclose(np.asarray(D), expected, rtol=1e-12)
+    np.testing.assert_allclose(D.columns([2, 5]), np.asarray(expected)[:, [2, 5]], rtol=1e-12)
+    for i in range(len(customers)):
+        assert D[i][4] == pytest.approx(expected[i][4], rel=1e-12)
+        assert D[i, 4] == pytest.approx(expected[i][4], rel=1e-12)
+    assert len(D._rows) == 3  # 只保留最近用過的列
+    with pytest.raises(ValueError):
+        D[0][0] = 1  # 唯讀
+
+
+def test_bundled_distances_match_the_coordinates():
+    config = load_config("instance_new", "M", 1)
+    coordinate_config = util.with_distances(util.to_coordinate_instance(config))
+    for key in ("D", "D_comp"):
+        np.testing.assert_allclose(np.asarray(coordinate_config[key]), config[key], rtol=1e-12)
+
+
+def test_evaluator_on_coordinates_matches_stored_distances():
+    config = load_config("instance_new", "M", 1)
+    coordinate_config = util.with_distances(util.to_coordinate_instance(config))
+    evaluator = engine.CandidateEvaluator(config, v5.G_function_array, v5.E_function_array)
+    coordinate_evaluator = engine.CandidateEvaluator(coordinate_config, v5.G_function_array, v5.E_function_array)
+    rng = np.random.default_rng(5)
+    facility_is_built = (rng.random(config["j_amount"]) < 0.2).astype(int)
+    total_util_list = rng.integers(1, 80, config["j_amount"]) * facility_is_built
+    own_attr = evaluator.own_attraction(facility_is_built, total_util_list)
+    np.testing.assert_allclose(
+        coordinate_evaluator.own_attraction(facility_is_built, total_util_list), own_attr, rtol=1e-12
+    )
+    locs = np.flatnonzero(facility_is_built == 0)
+    total_util = rng.integers(1, 80, len(locs))
+    location_cost = rng.uniform(0, 50, len(locs))
+    expected = evaluator.score_candidates(own_attr, 10.0, locs, total_util, location_cost)
+    np.testing.assert_allclose(
+        coordinate_evaluator.score_candidates(own_attr, 10.0, locs, total_util, location_cost), expected, rtol=1e-12
+    )
+    # 區塊大小由 I 和記憶體上限決定
+    coordinate_evaluator.block_bytes = 8 * config["i_amount"] * 7
+    assert coordinate_evaluator.block_size == 7
+    np.testing.assert_allclose(
+        coordinate_evaluator.score_candidates(own_attr, 10.0, locs, total_util, location_cost), expected, rtol=1e-12
+    )
+
+
+def test_solve_coordinate_instance(tmp_path):
+    file_path = str(tmp_path / "instance_S_1.coord.npz")
+    util.save_instance_npz(util.to_coordinate_instance(load_config("instance_new", "S", 1)), file_path)
+    config = util.load_instance(file_path)
+    assert isinstance(config["D"], util.DistanceMatrix) and isinstance(config["D_comp"], util.DistanceMatrix)
+    result = v5.heuristic_greedy_optimizeV5(file_path, verbose=0)
+    expected = v5.heuristic_greedy_optimizeV5(instance_file("instance_new", "S", 1), verbose=0)
+    assert result["OBJ_value"] == pytest.approx(expected["OBJ_value"], abs=1e-6)
+    assert result["best_Y"] == expected["best_Y"] and result["best_X"] == expected["best_X"]
+    parallel = v5.heuristic_greedy_optimizeV5(file_path, verbose=0, n_workers=2)
+    assert parallel["best_Y"] == expected["best_Y"] and parallel["best_X"] == expected["best_X"]
+
+
+@pytest.mark.parametrize("cal_method", ["euclidean", "manhattan"])
+def test_dist_list_generator_matches_cal_distance(cal_method):
+    rng = np.random.default_rng(1)
+    customers = [tuple(point) for point in rng.integers(0, 100, (20, 2)).tolist()]
+    locations = [tuple(point) for point in rng.uniform(0, 100, (30, 2)).round(3).tolist()]
+    expected = [[util.cal_distance(c, l, cal_method) for l in locations] for c in customers]
+    np.testing.assert_array_equal(util.dist_list_generator(customers, locations, cal_method), expected)
+    np.testing.assert_array_equal(
+        util.cal_distance(np.asarray(customers)[:, None], np.asarray(locations)[None], cal_method), expected
+    )
+
+
+def test_round_distances_matches_round_on_ties():
+    values = [0.125, 0.375, 1.005, 2.675, 1.115, 0.285, 10.005, 3.14159, 2.5]
+    assert util.round_distances(values, 2).tolist() == [round(value, 2) for value in values]
+
+
+def test_chunked_distances_match_dist_list_generator(tmp_path):
+    rng = np.random.default_rng(2)
+    customers, locations = rng.uniform(0, 100, (50, 2)), rng.uniform(0, 100, (40, 2))
+    expected = util.dist_list_generator(customers, locations)
+    np.testing.assert_array_equal(util.dist_list_generator_chunked(customers, locations, chunk_rows=7), expected)
+    out = util.dist_list_generator_chunked(customers, locations, str(tmp_path / "D.npy"), chunk_rows=16)
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(np.load(tmp_path / "D.npy"), expected)
+    with pytest.raises(ValueError):
+        util.dist_list_generator_chunked(customers, locations, np.empty((50, 39)))
@@ -0,0 +1,316 @@
+"""The batched evaluator, the objective state and the fills against the scalar greedy V5 code on the bundled instances."""
+import math
+
+import numpy as np
+import pytest
+
+import greedy_engine as engine
+import heuristic_greedyV5 as v5
+from conftest import load_config
+
+INSTANCES = [("instance_new", "S", 1), ("instance_new", "S", 2), ("instance_new", "M", 1), ("instance", "M", 2)]
+# V5 主迴圈和最後嘗試的 E%數
+PERCENTAGES = [100, 50, 64, 32, 16, 8, 4, 2, 1]
+ALL_TARGETS = [math.floor(v5.E_MAX_INPUT * percentage / 100) for percentage in PERCENTAGES]
+
+
+def random_solution(config, rng, built_ratio=0.2):
+    facility_is_built = (rng.random(config["j_amount"]) < built_ratio).astype(int).tolist()
+    utils = rng.integers(1, 80, config["j_amount"])
+    total_util_list = [int(util) if built else 0 for built, util in zip(facility_is_built, utils)]
+    return facility_is_built, total_util_list
+
+
+def scalar_gain(config, facility_is_built, total_util_list):
+    # 原本 calc_current_gain / calc_total_attr_i 的逐一加總, 演算法裡已經移除, 只留在這裡當參考
+    total_gain = 0
+    for customer_pt_i in range(config["i_amount"]):
+        our_attr = sum(
+            v5.E_function(total_util_list[j]) / config["D"][customer_pt_i][j] ** 2
+            for j, built in enumerate(facility_is_built)
+            if built == 1
+        )
+        total_attr = our_attr + sum(
+            config["A_opponent_bar"][l] / config["D_comp"][customer_pt_i][l] ** 2 for l in range(config["l_amount"])
+        )
+        total_gain += config["H"][customer_pt_i] * v5.G_function(total_attr) * our_attr / total_attr
+    return total_gain
+
+
+def scalar_fill(config, loc, obj_e):
+    # 原本 greedy_best_location 裡逐台車填的迴圈
+    sorted_car_list = sorted(((value, index) for index, value in enumerate(config["V"][loc])), reverse=True)
+    quota_loc = config["U_L"][loc]
+    quota_loc_k = list(config["U_LT"][loc])
+    quota_k = list(config["U_T"])
+    cur_to_fill, cur_util = [], 0
+    while quota_loc > 0 and sorted_car_list and cur_util < obj_e:
+        value, car_type = sorted_car_list.pop(0)
+        num_to_fill = min(quota_loc, quota_loc_k[car_type], quota_k[car_type], math.ceil((obj_e - cur_util) / value))
+        quota_k[car_type] -= num_to_fill
+        quota_loc_k[car_type] -= num_to_fill
+        quota_loc -= num_to_fill
+        cur_util += num_to_fill * value
+        cur_to_fill.append((car_type, num_to_fill))
+    return cur_to_fill, cur_util, min(max(0, obj_e - cur_util), config["A_EX_bound"])
+
+
+def make_evaluator(config):
+    return engine.CandidateEvaluator(config, v5.G_function_array, v5.E_function_array)
+
+
+def scalar_location_cost(config, loc, extra_attr, cars_to_fill):
+    return config["F"][loc] + config["C"][loc] * extra_attr + sum(config["B"][loc][k] * num for k, num in cars_to_fill)
+
+
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_gain_matches_scalar(instance):
+    config = load_config(*instance)
+    evaluator = make_evaluator(config)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        facility_is_built, total_util_list = random_solution(config, rng)
+        own_attr = evaluator.own_attraction(facility_is_built, total_util_list)
+        assert evaluator.gain(own_attr) == pytest.approx(
+            scalar_gain(config, facility_is_built, total_util_list), rel=1e-9
+        )
+
+
+def test_objective_breakdown_matches_scalar():
+    config = load_config("instance_new", "S", 1)
+    evaluator = make_evaluator(config)
+    facility_is_built, total_util_list = random_solution(config, np.random.default_rng(1), built_ratio=0.5)
+    compensate_attractiveness = [3 * built for built in facility_is_built]
+    cars_usage_record = [(0, 2, j) for j, built in enumerate(facility_is_built) if built]
+    breakdown = evaluator.objective_breakdown(
+        facility_is_built, total_util_list, compensate_attractiveness, cars_usage_record
+    )
+    assert breakdown["customer_gain"].sum() == pytest.approx(
+        scalar_gain(config, facility_is_built, total_util_list), rel=1e-9
+    )
+    assert breakdown["build_cost"] + breakdown["attr_cost"] + breakdown["cars_cost"] == pytest.approx(
+        sum(
+            scalar_location_cost(config, j, 3, [(0, 2)])
+            for j, built in enumerate(facility_is_built)
+            if built
+        )
+    )
+
+
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_score_candidates_matches_scalar(instance):
+    config = load_config(*instance)
+    evaluator = make_evaluator(config)
+    rng = np.random.default_rng(1)
+    facility_is_built, total_util_list = random_solution(config, rng)
+    base_cost = float(rng.uniform(0, 100))
+    unbuilt = [j for j, built in enumerate(facility_is_built) if not built][:40]
+    total_util = rng.integers(1, 80, len(unbuilt))
+    location_cost = rng.uniform(0, 50, len(unbuilt))
+
+    objs = evaluator.score_candidates(
+        evaluator.own_attraction(facility_is_built, total_util_list),
+        base_cost,
+        unbuilt,
+        total_util,
+        location_cost,
+    )
+    for obj, loc, util, cost in zip(objs, unbuilt, total_util, location_cost):
+        built, utils = list(facility_is_built), list(total_util_list)
+        built[loc], utils[loc] = 1, int(util)
+        assert obj == pytest.approx(scalar_gain(config, built, utils) - (base_cost + cost), rel=1e-9, abs=1e-9)
+
+
+def test_objective_state_matches_scalar_after_commits():
+    config = load_config("instance_new", "M", 1)
+    evaluator = make_evaluator(config)
+    facility_is_built = [0] * config["j_amount"]
+    total_util_list = [0] * config["j_amount"]
+    compensate_attractiveness = [0] * config["j_amount"]
+    cars_usage_record = []
+    objective_state = engine.ObjectiveState(evaluator)
+    for loc, cars_to_fill, extra_attr in ((3, [(0, 4), (2, 1)], 5), (100, [(1, 2)], 0), (57, [(2, 3)], 12)):
+        cur_util = sum(config["V"][loc][k] * num for k, num in cars_to_fill)
+        cost = evaluator.location_cost(loc, extra_attr, cars_to_fill)
+        assert cost == pytest.approx(scalar_location_cost(config, loc, extra_attr, cars_to_fill), rel=1e-12)
+        # objective_if_built 不改變 state, commit 之後的 objective 與它相同
+        obj_if_built = objective_state.objective_if_built(loc, cur_util + extra_attr, cost)
+        objective_state.commit(loc, cur_util + extra_attr, cost)
+        assert objective_state.objective() == pytest.approx(obj_if_built, rel=1e-12)
+        facility_is_built[loc], total_util_list[loc], compensate_attractiveness[loc] = 1, cur_util + extra_attr, extra_attr
+        cars_usage_record.extend((k, num, loc) for k, num in cars_to_fill)
+
+    expected = scalar_gain(config, facility_is_built, total_util_list) - sum(
+        scalar_location_cost(config, loc, compensate_attractiveness[loc], [(k, num) for k, num, j in cars_usage_record if j == loc])
+        for loc in range(config["j_amount"])
+        if facility_is_built[loc]
+    )
+    assert objective_state.objective() == pytest.approx(expected, rel=1e-9)
+    rebuilt = engine.ObjectiveState.from_solution(
+        evaluator, facility_is_built, total_util_list, compensate_attractiveness, cars_usage_record
+    )
+    assert rebuilt.objective() == pytest.approx(expected, rel=1e-9)
+
+
+def test_lazy_queue_returns_freshly_scored_best():
+    config = load_config("instance_new", "M", 1)
+    evaluator = make_evaluator(config)
+    objective_state = engine.ObjectiveState(evaluator)
+    candidates = [0] * config["j_amount"]
+    U_T = list(config["U_T"])
+    obj_e = math.floor(v5.E_MAX_INPUT)
+
+    def plan_location(loc):
+        cars_to_fill, cur_util, extra_attr = v5.fill_location(config, loc, obj_e, U_T)
+        return cars_to_fill, cur_util + extra_attr, evaluator.location_cost(loc, extra_attr, cars_to_fill)
+
+    queue = engine.LazyCandidateQueue()
+    plans = [plan_location(loc) for loc in range(config["j_amount"])]
+    objs = objective_state.score_candidates(
+        range(config["j_amount"]), [plan[1] for plan in plans], [plan[2] for plan in plans]
+    )
+    best_loc, best_obj = queue.best(objective_state, candidates, U_T, plan_location)
+    # 第一次全部都評估過, 與一次算完全部的結果相同
+    assert best_loc == int(np.argmax(objs)) and best_obj == pytest.approx(float(objs.max()), rel=1e-12)
+
+    for _ in range(3):
+        cars_to_fill, total_util, location_cost = queue.plans[best_loc]
+        objective_state.commit(best_loc, total_util, location_cost)
+        candidates[best_loc] = 1
+        for car_type, num in cars_to_fill:
+            U_T[car_type] -= num
+        best_loc, best_obj = queue.best(objective_state, candidates, U_T, plan_location)
+        # 回傳的點一定是用目前的 state 重新評估過的
+        _, total_util, location_cost = plan_location(best_loc)
+        assert candidates[best_loc] == 0
+        assert best_obj == pytest.approx(objective_state.objective_if_built(best_loc, total_util, location_cost), rel=1e-12)
+    assert queue.evaluations_saved > 0
+
+
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_fill_location_targets_matches_scalar(instance):
+    config = load_config(*instance)
+    rng = np.random.default_rng(2)
+    for U_T in (list(config["U_T"]), rng.integers(0, 5, config["k_amount"]).tolist()):
+        config["U_T"] = U_T
+        for loc in range(0, config["j_amount"], 7):
+            fills = v5.fill_location_targets(config, loc, ALL_TARGETS, U_T)
+            for obj_e, fill in zip(ALL_TARGETS, fills):
+                expected = scalar_fill(config, loc, obj_e)
+                # 丟 0 台的車不影響結果
+                assert [(k, n) for k, n in fill[0] if n] == [(k, n) for k, n in expected[0] if n]
+                assert fill[1:] == expected[1:]
+
+
+def test_greedy_best_location_targets_matches_single_target():
+    config = load_config("instance_new", "M", 1)
+    evaluator = make_evaluator(config)
+    state = engine.SolverState.from_config(config)
+    objective_state = engine.ObjectiveState.from_state(evaluator, state)
+    for _ in range(3):
+        results = v5.greedy_best_location_targets(config, state, PERCENTAGES, verbose=0, objective_state=objective_state)
+        for percentage in PERCENTAGES:
+            single = v5.greedy_best_location(
+                config, state, math.floor(v5.E_MAX_INPUT * percentage / 100), verbose=0, objective_state=objective_state
+            )
+            assert results[percentage][1:] == single[1:], percentage
+            assert results[percentage][0] == pytest.approx(single[0], rel=1e-12), percentage
+        # 用 100% 的結果蓋下一個點
+        _, loc, fill = results[100]
+        v5.build_location(state, objective_state, loc, fill)
+
+
+def test_fill_plan_cache_stays_equal_to_fresh_fills():
+    config = load_config("instance_new", "M", 1)
+    config["U_T"] = [20] * config["k_amount"]  # 車不多, 蓋幾個點後方案就要重算
+    fill_cache = engine.FillPlanCache()
+    rng = np.random.default_rng(3)
+    locs = range(config["j_amount"])
+    for _ in range(6):
+        for loc in locs:
+            v5.fill_location_targets(config, loc, ALL_TARGETS, config["U_T"], fill_cache)
+        # 蓋一個點: 拿走它 100% 方案的車
+        loc = int(rng.integers(config["j_amount"]))
+        cars_to_fill = v5.fill_location(config, loc, ALL_TARGETS[0], config["U_T"])[0]
+        for car_type, num in cars_to_fill:
+            config["U_T"][car_type] -= num
+        fill_cache.invalidate(config["U_T"], cars_to_fill)
+        for (loc, obj_e), plan in fill_cache.plans.items():
+            assert plan == v5.fill_location(config, loc, obj_e, config["U_T"])
+    stats = fill_cache.stats()
+    assert stats["hits"] > 0 and stats["invalidations"] > 0
+    assert stats["hit_rate"] == stats["hits"] / (stats["hits"] + stats["misses"])
+
+
+@pytest.mark.parametrize("instance", INSTANCES)
+def test_fill_kernel_and_costs_match_scalar(instance):
+    config = load_config(*instance)
+    evaluator = make_evaluator(config)
+    kernel = engine.FillKernel.from_config(config)
+    locs = list(range(config["j_amount"]))
+    rng = np.random.default_rng(4)
+    for U_T in (list(config["U_T"]), rng.integers(0, 5, config["k_amount"]).tolist()):
+        config["U_T"] = U_T
+        for obj_e in ALL_TARGETS:
+            cars_to_fill, cur_util, extra_attr, _ = kernel.fill(locs, obj_e, U_T)
+            costs = evaluator.location_costs(locs, extra_attr, cars_to_fill)
+            for loc in locs:
+                plan, plan_util, plan_extra = v5.fill_location(config, loc, obj_e, U_T)
+                expected = np.zeros(config["k_amount"])
+                for car_type, num in plan:
+                    expected[car_type] = num
+                np.testing.assert_array_equal(cars_to_fill[loc], expected)
+                assert cur_util[loc] == plan_util
+                assert extra_attr[loc] == plan_extra
+                cost = scalar_location_cost(config, loc, plan_extra, plan)
+                assert costs[loc] == pytest.approx(cost, rel=1e-12)
+                assert evaluator.location_cost(loc, plan_extra, plan) == pytest.approx(cost, rel=1e-12)
+
+
+
+def test_fill_kernel_fractional_capacities_with_integer_V():
+    config = load_config("instance_new", "S", 1)
+    config["U_L"] = [value + 0.5 for value in config["U_L"]]
+    assert np.asarray(config["V"]).dtype.kind == "i"
+    kernel = engine.FillKernel.from_config(config)
+    locs = list(range(config["j_amount"]))
+    for obj_e in ALL_TARGETS:
+        cars_to_fill, cur_util, extra_attr, _ = kernel.fill(locs, obj_e, config["U_T"])
+        assert cars_to_fill.dtype.kind == "f" and cur_util.dtype.kind == "f"
+        for loc in locs:
+            plan, plan_util, plan_extra = v5.fill_location(config, loc, obj_e, config["U_T"])
+            assert (cur_util[loc], extra_attr[loc]) == (plan_util, plan_extra)
+
+def test_solver_state_and_objective_state_match_scalar():
+    config = load_config("instance_new", "M", 1)
+    evaluator = make_evaluator(config)
+    state = engine.SolverState.from_config(config)
+    objective_state = engine.ObjectiveState.from_state(evaluator, state)
+    for loc in (3, 100, 57):
+        fill = v5.fill_location(config, loc, ALL_TARGETS[0], state.U_T)
+        v5.build_location(state, objective_state, loc, fill)
+    expected = scalar_gain(config, state.y.astype(int).tolist(), state.total_util.tolist()) - sum(
+        scalar_location_cost(config, loc, state.A_EX[loc], [(k, n) for k, n in enumerate(state.x_jk[loc]) if n])
+        for loc in np.flatnonzero(state.y)
+    )
+    assert objective_state.objective() == pytest.approx(expected, rel=1e-9)
+    assert state.cost(evaluator.F, evaluator.C, evaluator.B) == pytest.approx(objective_state.cost, rel=1e-12)
+    assert engine.ObjectiveState.from_state(evaluator, state).objective() == pytest.approx(expected, rel=1e-9)
+
+    # rollback 還原最後一次 commit
+    U_T, cars = state.U_T.copy(), state.x_jk[57].copy()
+    assert state.rollback() == 57
+    assert state.unbuilt() == [j for j in range(config["j_amount"]) if j not in (3, 100)]
+    assert not state.x_jk[57].any() and state.A_EX[57] == 0 and state.total_util[57] == 0
+    np.testing.assert_array_equal(state.U_T, U_T + cars)
+
+
+def test_solver_state_keeps_fractional_data():
+    config = load_config("instance_new", "S", 1)
+    assert engine.SolverState.from_config(config).A_EX.dtype.kind == "i"
+    config["A_EX_bound"] = 30.5
+    config["U_T"] = [value + 0.5 for value in config["U_T"]]
+    state = engine.SolverState.from_config(config)
+    assert state.A_EX.dtype.kind == "f" and state.U_T.dtype.kind == "f"
+    state.commit(0, [(0, 1.5)], 2.5, 0.25)
+    assert (state.x_jk[0, 0], state.A_EX[0], state.total_util[0]) == (1.5, 0.25, 2.75)
@@ -0,0 +1,29 @@
+"""Greedy V2-V4 against their stored results on the instance/ set."""
+import os
+
+import pytest
+import yaml
+
+from conftest import BENCHMARK_DIR, instance_file
+from heuristic_greedyV2 import heuristic_greedy_optimizeV2
+from heuristic_greedyV3 import heuristic_greedy_optimizeV3
+from heuristic_greedyV4 import heuristic_greedy_optimizeV4
+
+# greedyV1 的結果是更早的版本跑的, 現在的 V1 (改寫前也一樣) 已經對不上
+ALGORITHMS = {
+    "greedyV2": heuristic_greedy_optimizeV2,
+    "greedyV3": heuristic_greedy_optimizeV3,
+    "greedyV4": heuristic_greedy_optimizeV4,
+}
+
+
+@pytest.mark.parametrize("version", ALGORITHMS)
+@pytest.mark.parametrize("idx", [1, 2, 3])
+def test_matches_stored_result(version, idx):
+    with open(os.path.join(BENCHMARK_DIR, "result", version, "S", f"result_S_{idx}.yaml"), "r") as file:
+        expected = yaml.safe_load(file)
+    result = ALGORITHMS[version](instance_file("instance", "S", idx), verbose=0)
+    assert result["OBJ_value"] == pytest.approx(expected["OBJ_value"], abs=1e-6)
+    assert result["best_Y"] == expected["best_Y"]
+    assert result["best_X"] == expected["best_X"]
+    assert result["best_A_EX"] == expected["best_A_EX"]
@@ -0,0 +1,85 @@
+"""Greedy V5 against its stored results, in every evaluation mode."""
+import os
+
+import numpy as np
+import pytest
+import yaml
+
+import greedy_engine as engine
+import heuristic_greedyV5 as v5
+from conftest import BENCHMARK_DIR, instance_file, load_config
+from heuristic_greedyV5 import heuristic_greedy_optimizeV5
+
+MODES = {
+    "batched": {},
+    "lazy": {"lazy": True},
+    "parallel": {"n_workers": 2},
+}
+
+
+def stored_result(size, idx):
+    with open(os.path.join(BENCHMARK_DIR, "result", "greedyV5", size, f"result_{size}_{idx}.yaml"), "r") as file:
+        return yaml.safe_load(file)
+
+
+@pytest.mark.parametrize("size, idx", [("S", 1), ("S", 2), ("S", 3), ("M", 1), ("M", 2)])
+def test_modes_match_stored_result(size, idx):
+    expected = stored_result(size, idx)
+    results = {
+        mode: heuristic_greedy_optimizeV5(instance_file("instance_new", size, idx), verbose=0, **kwargs)
+        for mode, kwargs in MODES.items()
+    }
+    for mode, result in results.items():
+        assert result["OBJ_value"] == pytest.approx(expected["OBJ_value"], abs=1e-6), mode
+        assert result["best_Y"] == expected["best_Y"], mode
+        assert result["best_X"] == expected["best_X"], mode
+        assert result["best_A_EX"] == expected["best_A_EX"], mode
+    # 各模式選到的點完全一樣, 目標值也相同
+    objectives = {result["OBJ_value"] for result in results.values()}
+    assert max(objectives) - min(objectives) < 1e-9
+
+
+def test_profile_section_only_when_asked():
+    plain = heuristic_greedy_optimizeV5(instance_file("instance_new", "S", 1), verbose=0)
+    assert "profile" not in plain and "fill_cache" not in plain
+    result = heuristic_greedy_optimizeV5(instance_file("instance_new", "S", 1), verbose=0, profile=True)
+    assert result["OBJ_value"] == plain["OBJ_value"]
+    profile = result["profile"]
+    assert {"load", "setup", "fill", "gain", "main_loop", "ladder"} <= set(profile["phases"])
+    assert profile["counters"]["candidates_evaluated"] > 0
+    assert profile["counters"]["state_commits"] == sum(result["best_Y"])
+    assert profile["fill_cache"]["hits"] + profile["fill_cache"]["misses"] > 0
+    # 結果仍然是一般的 YAML
+    assert yaml.safe_load(yaml.safe_dump(result))["profile"] == profile
+
+
+def fractional_capacities_config():
+    # 容量有小數, V 仍是整數
+    config = load_config("instance_new", "S", 1)
+    config["U_L"] = [value + 0.5 for value in config["U_L"]]
+    config["U_LT"] = [[value + 0.5 for value in row] for row in config["U_LT"]]
+    config["U_T"] = [value + 0.5 for value in config["U_T"]]
+    return config
+
+
+def test_fill_locations_fractional_capacities_with_integer_V():
+    config = fractional_capacities_config()
+    assert np.asarray(config["V"]).dtype.kind == "i"
+    locs = list(range(config["j_amount"]))
+    targets = [v5.E_MAX_INPUT, v5.E_MAX_INPUT // 2, 1]
+    batched = v5.fill_locations(config, locs, targets, config["U_T"], fill_kernel=engine.FillKernel.from_config(config))
+    assert batched == v5.fill_locations(config, locs, targets, config["U_T"])
+
+
+def test_fractional_capacities_with_integer_V(tmp_path):
+    config = fractional_capacities_config()
+    config_path = tmp_path / "instance_S_1.yaml"
+    with open(config_path, "w") as file:
+        yaml.safe_dump(config, file)
+    results = [heuristic_greedy_optimizeV5(str(config_path), verbose=0, **kwargs) for kwargs in MODES.values()]
+    for result in results:
+        assert result["OBJ_value"] == pytest.approx(results[0]["OBJ_value"], abs=1e-6)
+        X = np.asarray(result["best_X"])
+        assert (X.sum(axis=1) <= np.asarray(config["U_L"])).all() and (X.sum(axis=0) <= np.asarray(config["U_T"])).all()
+        assert (X <= np.asarray(config["U_LT"])).all()
+    assert np.asarray(results[0]["best_X"]).dtype.kind == "f"
@@ -0,0 +1,82 @@
+"""The seeded instance generator."""
+import os
+
+import numpy as np
+import pytest
+
+import utility as util
+from conftest import instance_file, load_config
+from instance import SIZE_FAMILIES, generate_instance, generate_instances, instance_rng
+
+
+def test_write_instance_yaml_is_byte_identical_to_the_benchmark_files(tmp_path):
+    file_path = str(tmp_path / "instance.yaml")
+    util.write_instance_yaml(load_config("instance_new", "M", 1), file_path)
+    with open(file_path, "rb") as written, open(instance_file("instance_new", "M", 1), "rb") as bundled:
+        assert written.read() == bundled.read()
+
+
+def test_generated_instance_has_the_benchmark_schema():
+    config = generate_instance(*SIZE_FAMILIES["S"], instance_rng(0, "S", 1))
+    bundled = load_config("instance_new", "S", 1)
+    assert config.keys() == bundled.keys()
+    for key, value in bundled.items():
+        assert np.shape(config[key]) == np.shape(value), key
+    np.testing.assert_array_equal(config["CANDIDATES"], bundled["CANDIDATES"])  # 同樣的格子
+    # 顧客不在格子上, 距離與座標一致
+    assert not (config["CONSUMERS"] % 3 == 0).all(axis=1).any()
+    np.testing.assert_array_equal(config["D"], util.pairwise_distances(config["CONSUMERS"], config["CANDIDATES"]))
+
+    coordinate_config = generate_instance(*SIZE_FAMILIES["S"], instance_rng(0, "S", 1), coordinates=True)
+    assert "D" not in coordinate_config and coordinate_config["DIST_METHOD"] == "euclidean"
+    np.testing.assert_array_equal(coordinate_config["V"], config["V"])
+    with pytest.raises(ValueError):
+        generate_instance(3, 24, 1, 4, instance_rng(0, "S", 1))  # J 不是平方數
+
+
+def test_instances_do_not_depend_on_the_number_of_workers(tmp_path):
+    sizes = {"S": SIZE_FAMILIES["S"], "T": (4, 36, 2, 4)}
+    serial = generate_instances(sizes, 2, seed=7, output_dir=str(tmp_path / "serial"), workers=1)
+    parallel = generate_instances(sizes, 2, seed=7, output_dir=str(tmp_path / "parallel"), workers=2)
+    assert sorted(os.path.relpath(path, tmp_path / "serial") for path in serial) == sorted(
+        os.path.relpath(path, tmp_path / "parallel") for path in parallel
+    )
+    for path in serial:
+        with open(path, "rb") as file, open(path.replace("serial", "parallel"), "rb") as other:
+            assert file.read() == other.read()
+    # 換一個 seed 就是不同的 instance
+    [other_seed] = generate_instances({"S": SIZE_FAMILIES["S"]}, 1, seed=8, output_dir=str(tmp_path / "other"), workers=1)
+    with open(other_seed, "rb") as file, open(str(tmp_path / "serial" / "S" / "instance_S_1.yaml"), "rb") as same_idx:
+        assert file.read() != same_idx.read()
+
+
+def test_metric_and_customer_distribution(tmp_path):
+    amounts = (200, 25**2, 3, 9)
+    uniform = generate_instance(*amounts, instance_rng(0, "M", 1))
+    manhattan = generate_instance(*amounts, instance_rng(0, "M", 1), metric="manhattan")
+    # 同樣的點, 只有距離的算法不同
+    np.testing.assert_array_equal(manhattan["CONSUMERS"], uniform["CONSUMERS"])
+    delta = np.abs(manhattan["CONSUMERS"][:, None, :] - manhattan["CANDIDATES"][None, :, :])
+    np.testing.assert_array_equal(manhattan["D"], delta.sum(axis=2))
+    coordinate_config = generate_instance(*amounts, instance_rng(0, "M", 1), coordinates=True, metric="manhattan")
+    np.testing.assert_array_equal(np.asarray(util.with_distances(coordinate_config)["D"]), manhattan["D"])
+
+    normal = generate_instance(*amounts, instance_rng(0, "M", 1), distribution="normal")
+    consumers, net_size = normal["CONSUMERS"], normal["NET_SIZE"]
+    assert ((consumers >= 0) & (consumers <= net_size)).all()
+    assert not (consumers % 3 == 0).all(axis=1).any()
+    # 集中在地圖中央
+    def spread(config):
+        return np.abs(config["CONSUMERS"] - net_size / 2).mean()
+
+    assert spread(normal) < 0.75 * spread(uniform)
+
+    with pytest.raises(ValueError):
+        generate_instance(*amounts, instance_rng(0, "M", 1), metric="chebyshev")
+    with pytest.raises(ValueError):
+        generate_instance(*amounts, instance_rng(0, "M", 1), distribution="cluster")
+
+    [file_path] = generate_instances(
+        {"T": (4, 36, 2, 4)}, 1, output_dir=str(tmp_path), file_format="coord", workers=1, metric="manhattan"
+    )
+    assert util.load_instance_npz(file_path)["DIST_METHOD"] == "manhattan"
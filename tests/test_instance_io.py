@@ -0,0 +1,223 @@
+"""The streaming instance parser, the binary instance format and the on-disk instance cache against yaml.load."""
+import json
+import multiprocessing as mp
+import os
+import shutil
+
+import numpy as np
+import pytest
+import yaml
+
+import instance_io
+import utility as util
+from conftest import instance_file, load_config
+from heuristic_greedyV5 import heuristic_greedy_optimizeV5
+
+BUNDLED = [
+    ("instance", "S", 1),
+    ("instance", "M", 1),
+    ("instance_new", "S", 1),
+    ("instance_new", "M", 1),
+    ("instance_new", "L", 1),
+]
+
+
+def assert_same_config(parsed, expected):
+    assert parsed.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, list):
+            array = np.asarray(parsed[key])
+            np.testing.assert_array_equal(array, np.asarray(value), err_msg=key)
+            assert array.dtype.kind == np.asarray(value).dtype.kind, key
+        else:
+            assert type(parsed[key]) is type(value) and parsed[key] == value, key
+
+
+@pytest.mark.parametrize("instance", BUNDLED)
+def test_read_instance_yaml_matches_yaml_load(instance):
+    assert_same_config(util.read_instance_yaml(instance_file(*instance)), load_config(*instance))
+
+
+def test_read_instance_yaml_checks_matrix_sizes(tmp_path):
+    config = load_config("instance_new", "S", 1)
+    config["D"] = config["D"][:-1]  # 少一列
+    file_path = tmp_path / "instance.yaml"
+    with open(file_path, "w") as file:
+        yaml.dump(config, file, default_flow_style=False)
+    with pytest.raises(ValueError):
+        util.read_instance_yaml(str(file_path))
+
+
+def test_read_instance_yaml_keeps_floats_and_yaml_scalars(tmp_path):
+    with open(instance_file("instance_new", "S", 1), "r") as file:
+        config = yaml.safe_load(file)
+    config["A_EX_bound"] = 30.5
+    config["V"][0][0] += 0.5  # V 的第一個值就是小數
+    config["U_LT"][-1][-1] += 0.25  # 最後一個值才是小數
+    config["H"] = [value + 0.5 for value in config["H"]]
+    config["flag"] = True
+    config["nothing"] = None
+    file_path = tmp_path / "instance.yaml"
+    with open(file_path, "w") as file:
+        yaml.dump(config, file, default_flow_style=False)
+        file.write("hex_value: 0x1f\noctal_value: 012\nyes_value: yes\nquoted: '12'\nexponent: 1.5e3\n")
+    with open(file_path, "r") as file:
+        expected = yaml.safe_load(file)
+
+    parsed = util.read_instance_yaml(str(file_path))
+    assert_same_config(parsed, expected)
+    assert parsed["V"].dtype == float and parsed["U_LT"].dtype == float
+    assert parsed["flag"] is True and parsed["nothing"] is None and parsed["octal_value"] == 10
+
+
+def test_instances_without_amounts_fall_back_to_yaml_load(tmp_path):
+    file_path = tmp_path / "plain.yaml"
+    file_path.write_text("a: 1\nb:\n- 1.5\n- 2\n")
+    with pytest.raises(ValueError):
+        util.read_instance_yaml(str(file_path))
+    assert util.parse_instance_yaml(str(file_path)) == {"a": 1, "b": [1.5, 2]}
+    loaded = util.load_specific_yaml(str(file_path))
+    assert loaded["a"] == 1 and list(loaded["b"]) == [1.5, 2]
+
+
+@pytest.mark.parametrize("instance", BUNDLED)
+@pytest.mark.parametrize("mmap", [True, False])
+def test_npz_round_trip(tmp_path, instance, mmap):
+    config = load_config(*instance)
+    file_path = str(tmp_path / "instance.npz")
+    util.save_instance_npz(config, file_path)
+    loaded = util.load_instance_npz(file_path, mmap=mmap)
+    assert_same_config(loaded, config)
+    if mmap:
+        # 直接對應到檔案, 不能寫
+        with pytest.raises(ValueError):
+            loaded["D"][0, 0] = 0
+
+
+def test_solve_from_npz_and_save_plain_yaml(tmp_path):
+    file_path = str(tmp_path / "instance_S_1.npz")
+    util.save_instance_npz(load_config("instance_new", "S", 1), file_path)
+    from_npz = heuristic_greedy_optimizeV5(file_path, verbose=0)
+    from_yaml = heuristic_greedy_optimizeV5(instance_file("instance_new", "S", 1), verbose=0)
+    assert from_npz == {**from_yaml, "spend_time(s)": from_npz["spend_time(s)"]}
+
+    # 從 array 算出來的結果也寫成一般的 YAML
+    result_path = str(tmp_path / "result.yaml")
+    util.save_yaml({**from_npz, "scalar": np.int64(3), "array": np.arange(3)}, result_path)
+    with open(result_path, "r") as file:
+        saved = yaml.safe_load(file)
+    assert saved["best_Y"] == from_yaml["best_Y"] and saved["scalar"] == 3 and saved["array"] == [0, 1, 2]
+
+
+def copy_instance(tmp_path, name, instance=("instance_new", "S", 1)):
+    file_path = tmp_path / name
+    shutil.copy(instance_file(*instance), file_path)
+    return str(file_path)
+
+
+def test_load_specific_yaml_goes_through_the_cache(isolated_instance_cache):
+    config = util.load_specific_yaml(instance_file("instance_new", "S", 1))
+    assert_same_config(config, load_config("instance_new", "S", 1))
+    util.load_specific_yaml(instance_file("instance_new", "S", 1))
+    assert (isolated_instance_cache.hits, isolated_instance_cache.misses) == (1, 1)
+
+
+
+def test_unusable_cache_warns_once_and_is_disabled(tmp_path, monkeypatch, caplog):
+    not_a_dir = tmp_path / "cache"
+    not_a_dir.write_text("")
+    monkeypatch.setattr(instance_io, "INSTANCE_CACHE", util.InstanceCache(str(not_a_dir)))
+    for _ in range(3):
+        config = util.load_specific_yaml(instance_file("instance_new", "S", 1))
+    assert_same_config(config, load_config("instance_new", "S", 1))
+    assert instance_io.INSTANCE_CACHE is None
+    assert [record.levelname for record in caplog.records if record.name == "instance_io"] == ["WARNING"]
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = util.InstanceCache(str(tmp_path / "cache"))
+    first = copy_instance(tmp_path, "a.yaml")
+    config = cache.load(first, instance_io._parse_yaml)
+    assert (cache.hits, cache.misses) == (0, 1)
+    cached = cache.load(first, instance_io._parse_yaml)
+    assert (cache.hits, cache.misses) == (1, 1)
+    for key in config:
+        np.testing.assert_array_equal(cached[key], config[key])
+
+    # 內容相同的另一個檔案共用同一個 entry
+    cache.load(copy_instance(tmp_path, "b.yaml"), instance_io._parse_yaml)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # 內容改變了就重新解析
+    with open(first, "a") as file:
+        file.write("extra: 1\n")
+    assert cache.load(first, instance_io._parse_yaml)["extra"] == 1
+    assert cache.misses == 2
+
+
+
+def test_cache_entries_of_another_format_version_are_parsed_again(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first = copy_instance(tmp_path, "a.yaml")
+    stale = util.InstanceCache(cache_dir, format_version=util.CACHE_FORMAT_VERSION - 1)
+    stale.load(first, lambda file_path: {**instance_io._parse_yaml(file_path), "V": np.zeros(1, dtype=int)})
+    # 加上版本號之前的 entry 也一樣
+    legacy = os.path.join(cache_dir, "0" * 40 + ".npz")
+    with open(legacy, "wb") as file:
+        file.write(b"\0" * 1000)
+    cache = util.InstanceCache(cache_dir)
+    config = cache.load(first, instance_io._parse_yaml)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert_same_config(config, load_config("instance_new", "S", 1))
+    entries = {name for name in os.listdir(cache_dir) if name.endswith(".npz")}
+    assert entries == {f"{entry_key}.npz" for entry_key in cache._load_index()["entries"]}
+    assert all(name.endswith(f".v{util.CACHE_FORMAT_VERSION}.npz") for name in entries)
+    assert not os.path.exists(legacy)
+
+def test_cache_eviction(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = util.InstanceCache(str(cache_dir))
+    entries = {}
+    for size in ("S", "M", "L"):
+        cache.load(copy_instance(tmp_path, f"{size}.yaml", ("instance_new", size, 1)), instance_io._parse_yaml)
+        [entries[size]] = {name for name in os.listdir(cache_dir) if name.endswith(".npz")} - set(entries.values())
+    files = {size: str(tmp_path / f"{size}.yaml") for size in entries}
+    # 放得下 M 和 L, 放不下三個: 最久沒用的 S 被移除
+    cache.max_bytes = os.path.getsize(cache_dir / entries["M"]) + os.path.getsize(cache_dir / entries["L"])
+    cache.load(files["M"], instance_io._parse_yaml)
+    with open(cache_dir / "index.json", "r") as file:
+        index = json.load(file)
+    remaining = {name for name in os.listdir(cache_dir) if name.endswith(".npz")}
+    assert remaining == {entries["M"], entries["L"]}
+    assert remaining == {f"{entry_key}.npz" for entry_key in index["entries"]}
+    assert files["S"] not in index["files"]
+
+    # index 不知道的 entry 檔案也算在大小裡, 並且會被移除
+    orphan = cache_dir / ("0" * 40 + f".v{util.CACHE_FORMAT_VERSION}.npz")
+    orphan.write_bytes(b"\0" * 300_000)
+    os.utime(orphan, (0, 0))
+    cache.load(files["L"], instance_io._parse_yaml)
+    assert not orphan.exists()
+    assert (cache_dir / entries["L"]).exists()
+
+
+def _load_in_process(args):
+    cache_dir, file_paths = args
+    cache = util.InstanceCache(cache_dir)
+    for file_path in file_paths:
+        config = cache.load(file_path, instance_io._parse_yaml)
+        assert np.shape(config["D"]) == (config["i_amount"], config["j_amount"])
+    return cache.misses
+
+
+def test_cache_concurrent_processes_keep_every_entry(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    files = [copy_instance(tmp_path, f"{idx}.yaml", ("instance_new", "S", idx)) for idx in range(1, 13)]
+    tasks = [(cache_dir, files[start::4] + files[:3]) for start in range(4)]
+    with mp.get_context("spawn").Pool(4) as pool:
+        pool.map(_load_in_process, tasks)
+    with open(os.path.join(cache_dir, "index.json"), "r") as file:
+        index = json.load(file)
+    entries = {name for name in os.listdir(cache_dir) if name.endswith(".npz")}
+    assert len(entries) == len(files)
+    assert entries == {f"{entry_key}.npz" for entry_key in index["entries"]}
+    assert set(files) <= set(index["files"])
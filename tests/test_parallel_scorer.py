@@ -0,0 +1,136 @@
+"""ParallelCandidateScorer against the serial batch evaluation."""
+import math
+import os
+import subprocess
+import sys
+import textwrap
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import greedy_engine as engine
+import heuristic_greedyV5 as v5
+import utility as util
+from conftest import ROOT_DIR, instance_file, load_config
+
+
+def serial_best(config, objective_state, candidates, obj_e):
+    evaluator = objective_state.evaluator
+    unbuilt = [loc for loc, built in enumerate(candidates) if not built]
+    total_util, location_cost = [], []
+    for loc in unbuilt:
+        cars_to_fill, cur_util, extra_attr = v5.fill_location(config, loc, obj_e, config["U_T"])
+        total_util.append(cur_util + extra_attr)
+        location_cost.append(evaluator.location_cost(loc, extra_attr, cars_to_fill))
+    objs = objective_state.score_candidates(unbuilt, total_util, location_cost)
+    best = int(np.argmax(objs))
+    return unbuilt[best], float(objs[best])
+
+
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_best_matches_serial(n_workers):
+    config = load_config("instance_new", "M", 1)
+    evaluator = engine.CandidateEvaluator(config, v5.G_function_array, v5.E_function_array)
+    objective_state = engine.ObjectiveState(evaluator)
+    candidates = [0] * config["j_amount"]
+    with engine.ParallelCandidateScorer(config, v5.G_function_array, v5.E_function_array, n_workers) as scorer:
+        for obj_e in (math.floor(v5.E_MAX_INPUT), math.floor(v5.E_MAX_INPUT / 2)):
+            expected_loc, expected_obj = serial_best(config, objective_state, candidates, obj_e)
+            best_loc, best_obj = scorer.best(objective_state, candidates, config["U_T"], obj_e)
+            assert best_loc == expected_loc
+            assert best_obj == pytest.approx(expected_obj, rel=1e-12)
+            # 蓋下這個點, 下一輪在新的 state 上比較
+            cars_to_fill, cur_util, extra_attr = v5.fill_location(config, best_loc, obj_e, config["U_T"])
+            objective_state.commit(
+                best_loc, cur_util + extra_attr, evaluator.location_cost(best_loc, extra_attr, cars_to_fill)
+            )
+            candidates[best_loc] = 1
+            for car_type, num in cars_to_fill:
+                config["U_T"][car_type] -= num
+        names = [shm.name for shm in scorer.shm_blocks]
+    # close 之後 shared memory 已經釋放
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+
+def test_coordinate_instance_shares_the_coordinates():
+    config = load_config("instance_new", "M", 1)
+    coordinate_config = util.with_distances(util.to_coordinate_instance(config))
+    evaluator = engine.CandidateEvaluator(config, v5.G_function_array, v5.E_function_array)
+    objective_state = engine.ObjectiveState(evaluator)
+    candidates = [0] * config["j_amount"]
+    obj_e = math.floor(v5.E_MAX_INPUT)
+    expected_loc, expected_obj = serial_best(config, objective_state, candidates, obj_e)
+    with engine.ParallelCandidateScorer(coordinate_config, v5.G_function_array, v5.E_function_array, 2) as scorer:
+        # 沒有 (I, J) 的 1 / D^2 放在 shared memory
+        largest = max(shm.size for shm in scorer.shm_blocks)
+        assert largest < config["i_amount"] * config["j_amount"] * 8
+        best_loc, best_obj = scorer.best(objective_state, candidates, config["U_T"], obj_e)
+    assert best_loc == expected_loc
+    assert best_obj == pytest.approx(expected_obj, rel=1e-12)
+
+def test_pool_released_when_solve_raises(monkeypatch):
+    scorers = []
+
+    class RecordingScorer(engine.ParallelCandidateScorer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            scorers.append(self)
+
+        def best(self, *args, **kwargs):
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(engine, "ParallelCandidateScorer", RecordingScorer)
+    with pytest.raises(KeyboardInterrupt):
+        v5.heuristic_greedy_optimizeV5(instance_file("instance_new", "S", 1), verbose=0, n_workers=2)
+    [scorer] = scorers
+    # worker 已經結束, shared memory 也已經釋放
+    assert scorer.pool is None
+    for shm in scorer.shm_blocks:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shm.name)
+
+
+def test_shared_memory_released_when_the_pool_fails_to_start(monkeypatch):
+    created = []
+
+    class RecordingSharedMemory(shared_memory.SharedMemory):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self.name)
+
+    def failing_pool(*args, **kwargs):
+        raise OSError("no more processes")
+
+    monkeypatch.setattr(engine.shared_memory, "SharedMemory", RecordingSharedMemory)
+    monkeypatch.setattr(engine.mp, "Pool", failing_pool)
+    with pytest.raises(OSError):
+        engine.ParallelCandidateScorer(load_config("instance_new", "S", 1), v5.G_function_array, v5.E_function_array, 2)
+    assert len(created) == len(engine.SHARED_ARRAYS)
+    for name in created:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+def test_workers_leave_the_shared_memory_to_the_main_process():
+    # resource_tracker 在 process 結束時才會抱怨 (leaked shared_memory, unregister 不存在的 name), 所以另開一個 process
+    script = textwrap.dedent(
+        f"""
+        import sys
+        import yaml
+        sys.path[:0] = [{os.path.join(ROOT_DIR, "Algorithms")!r}, {ROOT_DIR!r}]
+        import greedy_engine as engine
+        import heuristic_greedyV5 as v5
+        with open({instance_file("instance_new", "S", 1)!r}, "r") as file:
+            config = yaml.safe_load(file)
+        evaluator = engine.CandidateEvaluator(config, v5.G_function_array, v5.E_function_array)
+        with engine.ParallelCandidateScorer(config, v5.G_function_array, v5.E_function_array, 2) as scorer:
+            scorer.best(engine.ObjectiveState(evaluator), [0] * config["j_amount"], config["U_T"], v5.E_MAX_INPUT)
+        """
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == ""
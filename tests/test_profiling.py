@@ -0,0 +1,60 @@
+"""The phase profiler of the solves."""
+import time
+
+import numpy as np
+
+import utility as util
+
+
+def test_phase_profiler_and_null_profiler():
+    profiler = util.PhaseProfiler()
+    with profiler.phase("outer"):
+        with profiler.phase("inner"):
+            pass
+        with profiler.phase("inner"):
+            pass
+    square = profiler.counted("square", lambda x: x**2)
+    assert square(np.arange(4)).tolist() == [0, 1, 4, 9] and square(3) == 9
+    profiler.count("built", 2)
+    report = profiler.report()
+    assert report["phases"]["inner"]["calls"] == 2 and report["phases"]["outer"]["calls"] == 1
+    assert report["phases"]["outer"]["time(s)"] >= report["phases"]["inner"]["time(s)"]
+    assert report["counters"] == {"square_calls": 2, "square_values": 5, "built": 2}
+
+    function = np.sqrt
+    assert util.NULL_PROFILER.counted("sqrt", function) is function
+    with util.NULL_PROFILER.phase("fill"):
+        util.NULL_PROFILER.count("built")
+    assert util.NULL_PROFILER.report() == {"phases": {}, "counters": {}}
+
+
+def test_memory_tracker():
+    with util.MemoryTracker() as tracker:
+        buffer = bytearray(1 << 20)
+    assert set(tracker.memory) == {"peak_rss(MB)", "rss_before(MB)", "peak_rss_scope"}
+    assert tracker.memory["peak_rss(MB)"] > 0
+
+    with util.MemoryTracker(trace_python=True, top=3) as tracker:
+        buffer = bytearray(4 << 20)
+    assert tracker.memory["python_peak(MB)"] >= 4.0
+    assert len(tracker.memory["top_allocations"]) <= 3
+    top = tracker.memory["top_allocations"][0]
+    assert "test_profiling.py" in top["site"] and top["size(KB)"] >= 4096
+    del buffer
+
+
+def _freed_temporary():
+    temporary = bytearray(8 << 20)
+    time.sleep(0.1)
+    del temporary
+
+
+def test_memory_tracker_reports_sites_at_the_peak():
+    with util.MemoryTracker(trace_python=True, top=3, interval=0.005) as tracker:
+        _freed_temporary()
+        kept = bytearray(1 << 20)
+    assert tracker.memory["python_current(MB)"] < 8.0 <= tracker.memory["python_peak(MB)"]
+    assert tracker.memory["top_allocations_at(MB)"] >= 8.0
+    top = tracker.memory["top_allocations"][0]
+    assert "test_profiling.py" in top["site"] and top["size(KB)"] >= 8192
+    del kept
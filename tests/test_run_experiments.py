@@ -0,0 +1,100 @@
+"""run_experiments statuses and result files, in this process and on the worker pool."""
+import os
+
+import yaml
+
+import utility as util
+from conftest import BENCHMARK_DIR
+from experiment_algorithms import EXIT_INDEX, RAISE_INDEX, TIMEOUT_INDEX, scripted
+from heuristic_greedyV5 import heuristic_greedy_optimizeV5
+
+
+def read_result(result_path, i, instance_type="S"):
+    with open(os.path.join(result_path, instance_type, f"result_{instance_type}_{i}.yaml"), "r") as file:
+        return yaml.safe_load(file)
+
+
+def test_worker_pool_statuses(tmp_path):
+    result_path = str(tmp_path / "result")
+    statuses = util.run_experiments(
+        "missing-instances", result_path, scripted, ["S"], 1, 5, verbose=0, n_workers=2, timeout=3
+    )
+    assert statuses == {
+        ("S", 1): "ok",
+        ("S", TIMEOUT_INDEX): "timeout",
+        ("S", RAISE_INDEX): "crashed",
+        ("S", EXIT_INDEX): "crashed",
+        ("S", 5): "ok",
+    }
+    # 失敗的 instance 不影響其他的, 結果檔有相同的鍵
+    assert read_result(result_path, 1)["OBJ_value"] == 1.0
+    assert read_result(result_path, 5)["OBJ_value"] == 5.0
+    timeout = read_result(result_path, TIMEOUT_INDEX)
+    assert timeout["status"] == "timeout" and timeout["OBJ_value"] is None and timeout["timeout(s)"] == 3
+    assert "scripted failure" in read_result(result_path, RAISE_INDEX)["error"]
+    assert "exited with code 3" in read_result(result_path, EXIT_INDEX)["error"]
+
+
+def test_worker_pool_reuses_its_workers(tmp_path):
+    result_path = str(tmp_path / "result")
+    statuses = util.run_experiments("missing-instances", result_path, scripted, ["S"], 5, 9, verbose=0, n_workers=2)
+    assert set(statuses.values()) == {"ok"}
+    # 5 個 instance 只在兩個 process 上解
+    assert len({read_result(result_path, i)["worker"] for i in range(5, 10)}) <= 2
+
+
+def test_in_process_run_saves_the_results(tmp_path):
+    result_path = str(tmp_path / "result")
+    statuses = util.run_experiments(
+        os.path.join(BENCHMARK_DIR, "instance_new"), result_path, heuristic_greedy_optimizeV5, ["S"], 1, 2, verbose=0
+    )
+    assert statuses == {("S", 1): "ok", ("S", 2): "ok"}
+    for i in (1, 2):
+        with open(os.path.join(BENCHMARK_DIR, "result", "greedyV5", "S", f"result_S_{i}.yaml"), "r") as file:
+            expected = yaml.safe_load(file)
+        result = read_result(result_path, i)
+        assert result["best_Y"] == expected["best_Y"] and abs(result["OBJ_value"] - expected["OBJ_value"]) < 1e-6
+
+
+def test_instance_dimensions_without_loading(tmp_path):
+    file_path = os.path.join(BENCHMARK_DIR, "instance_new", "M", "instance_M_1.yaml")
+    assert util.instance_dimensions(file_path) == (6, 225, 3, 9)
+    npz_path = str(tmp_path / "instance_M_1.npz")
+    util.save_instance_npz(util.load_specific_yaml(file_path), npz_path)
+    assert util.instance_dimensions(npz_path) == (6, 225, 3, 9)
+
+
+def test_predicted_costs_and_makespan(tmp_path):
+    instance_path = os.path.join(BENCHMARK_DIR, "instance_new")
+    tasks = [
+        (instance_type, i, os.path.join(instance_path, instance_type, f"instance_{instance_type}_{i}.yaml"))
+        for instance_type in ("S", "M", "L")
+        for i in (1, 2)
+    ]
+    # 沒有歷史紀錄: 以 I * J * K 排序
+    costs, in_seconds = util.predict_task_costs(tasks, [str(tmp_path / "none")])
+    assert not in_seconds and costs[0] == 3 * 25 * 1 and costs[2] == 6 * 225 * 3
+
+    history = tmp_path / "history"
+    for instance_type, spend_time in (("S", 0.5), ("M", 2.0)):
+        os.makedirs(history / instance_type)
+        (history / instance_type / f"result_{instance_type}_1.yaml").write_text(f"OBJ_value: 1.0\nspend_time(s): {spend_time}\n")
+    costs, in_seconds = util.predict_task_costs(tasks, [str(history)])
+    assert in_seconds
+    assert costs[:4] == [0.5, 0.5, 2.0, 2.0]  # 自己的紀錄, 或相同大小的紀錄
+    assert costs[4] == costs[5] > 2.0  # L 由 S / M 的成長推估
+
+    assert util.lpt_makespan([4, 3, 3, 2, 2], 2) == 8  # 4+2+2 與 3+3
+    assert util.lpt_makespan([1, 1, 1], 4) == 1
+
+
+
+def test_in_process_run_with_memory(tmp_path):
+    result_path = str(tmp_path / "result")
+    statuses = util.run_experiments(
+        "missing-instances", result_path, scripted, ["S"], 5, 6, verbose=0, memory_mode="tracemalloc"
+    )
+    assert statuses == {("S", 5): "ok", ("S", 6): "ok"}
+    memory = read_result(result_path, 6)["memory"]
+    assert memory["python_peak(MB)"] >= 1.0  # 1 MB 的 bytearray
+    assert memory["peak_rss(MB)"] > 0 and memory["top_allocations"]
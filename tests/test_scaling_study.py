@@ -0,0 +1,69 @@
+"""The scaling study sweeps and exponent fits."""
+import json
+import os
+
+import pytest
+
+import scaling_study as study
+
+
+def test_sweep_points_vary_one_dimension_at_a_time():
+    points = study.sweep_points((6, 225, 3, 9), ["J", "K"], {"J": [625, 225], "K": [1, 5]})
+    assert points == [
+        ("J", 225, (6, 225, 3, 9)),
+        ("J", 625, (6, 625, 3, 9)),
+        ("K", 1, (6, 225, 1, 9)),
+        ("K", 5, (6, 225, 5, 9)),
+    ]
+
+
+def test_fits_recover_power_laws():
+    xs = [100, 400, 1600, 6400]
+    exponent, r2 = study.fit_exponent(xs, [0.01 * x**1.5 for x in xs])
+    assert exponent == pytest.approx(1.5) and r2 == pytest.approx(1.0)
+    assert study.fit_exponent([10, 10], [1.0, 2.0]) == (None, None)
+    assert study.local_exponents([1, 2, 4], [1.0, 2.0, 16.0]) == pytest.approx([1.0, 3.0])
+
+    measurements = [
+        {"I": I, "J": J, "K": 3, "L": 9, "time(s)": 1e-4 * I**0.5 * J**2}
+        for I, J in ((6, 225), (12, 225), (24, 225), (6, 625), (6, 1225))
+    ]
+    joint = study.fit_joint(measurements)
+    assert joint["I"] == pytest.approx(0.5) and joint["J"] == pytest.approx(2.0)
+    assert joint["K"] is None and joint["L"] is None  # 沒有變動的維度
+
+
+def test_run_sweep_writes_measurements(tmp_path):
+    output_dir = str(tmp_path / "scaling")
+    measurements = study.run_sweep(["V5"], (3, 25, 1, 4), ["J"], {"J": [25, 36]}, count=1, output_dir=output_dir)
+    assert [(m["dim"], m["value"], m["J"]) for m in measurements] == [("J", 25, 25), ("J", 36, 36)]
+    with open(os.path.join(output_dir, "measurements.jsonl"), "r") as file:
+        assert [json.loads(line) for line in file] == measurements
+    assert all(m["base"] == [3, 25, 1, 4] and m["seed"] == 0 for m in measurements)
+    rows, joint = study.fit_table(measurements)
+    assert [(row["algorithm"], row["base"], row["dim"], row["points"]) for row in rows] == [("V5", "3x25x1x4", "J", 2)]
+    assert "V5 (base 3x25x1x4): time ~ J^" in study.format_table(rows, joint)
+
+
+def test_fit_table_keeps_bases_and_seeds_apart():
+    def measurement(base, seed, value, time_s):
+        amounts = dict(zip(study.DIMENSIONS, base), J=value)
+        return {"algorithm": "V5", "dim": "J", "value": value, **amounts, "base": list(base), "seed": seed, "time(s)": time_s}
+
+    measurements = [
+        # base M: time ~ J^1, 兩個 seed 的中位數
+        measurement((6, 225, 3, 9), 0, 100, 1.0),
+        measurement((6, 225, 3, 9), 1, 100, 3.0),
+        measurement((6, 225, 3, 9), 0, 400, 8.0),
+        measurement((6, 225, 3, 9), 1, 400, 8.0),
+        # 同一個 J 但 base 不同: time ~ J^2, 不會蓋掉 base M 的量測
+        measurement((12, 225, 3, 9), 0, 100, 1.0),
+        measurement((12, 225, 3, 9), 0, 400, 16.0),
+        # 重跑同一點 (同一個 base 和 seed) 時取最後一次
+        measurement((12, 225, 3, 9), 0, 400, 5.0),
+        measurement((12, 225, 3, 9), 0, 400, 16.0),
+    ]
+    rows, joint = study.fit_table(measurements)
+    exponents = {row["base"]: row["exponent"] for row in rows}
+    assert exponents == {"6x225x3x9": pytest.approx(1.0), "12x225x3x9": pytest.approx(2.0)}
+    assert joint["V5", "12x225x3x9"]["J"] == pytest.approx(2.0)